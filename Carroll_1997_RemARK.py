@@ -28,7 +28,7 @@
 # 
 # Infinite Horizon 
 # 
-# $$c_t = \kappa_t[m_t + h_t]$$
+# $$c_t = \kappa_t[m_t + h_t]$$ 
 # $$h_t = \sum_{i=t+1}^{\infty}R^{i-t}y_{i} \approx \frac{y_t}{r - g}$$
 # $$\kappa = {(1 - {[R^{-1}(\beta R)^{1/\rho}]})}$$
 
@@ -108,22 +108,19 @@
 
 # This cell has a bit of initial setup.
 #get_ipython().run_line_magic('matplotlib', 'inline') #This line does not work
-import matplotlib.pyplot as plt
 
 # The first step is to be able to bring things in from different directories
-import sys 
+import sys
 import os
 
 sys.path.insert(0, os.path.abspath('../lib'))
 
 #from util import log_progress
 
+# matplotlib, pandas, tabulate and HARK take seconds to import, so each stage below imports what it uses
+# itself: making one figure or table (e.g. python Carroll_1997_RemARK.py --only Figure7) loads only that
 import numpy as np
-import HARK 
-from time import clock
-from copy import deepcopy
 mystr = lambda number : "{:.4f}".format(number)
-from HARK.utilities import plotFuncs
 
 
 # In[3]:
@@ -140,346 +137,216 @@ UnempPrb   = 0.005
 IncUnemp   = 0.0
 PermShkStd = 0.1
 TranShkStd = 0.1
-# Import default parameter values
-import HARK.ConsumptionSaving.ConsumerParameters as Params 
-
-# Make a dictionary containing all parameters needed to solve the model
-base_params = Params.init_idiosyncratic_shocks
-
-# Set the parameters for the baseline results in the paper
-# using the variable values defined in the cell above
-base_params['PermGroFac'] = [PermGroFac]   # Permanent income growth factor
-base_params['Rfree']      = Rfree          # Interest factor on assets
-base_params['DiscFac']    = DiscFac        # Time Preference Factor
-base_params['CRRA']       = CRRA           # Coefficient of relative risk aversion
-base_params['UnempPrb']   = UnempPrb       # Probability of unemployment (e.g. Probability of Zero Income in the paper)
-base_params['IncUnemp']   = IncUnemp       # Induces natural borrowing constraint
-base_params['PermShkStd'] = [PermShkStd]   # Standard deviation of log permanent income shocks
-base_params['TranShkStd'] = [TranShkStd]   # Standard deviation of log transitory income shocks
-
-# Some technical settings that are not interesting for our purposes
-base_params['LivPrb']       = [1.0]   # 100 percent probability of living to next period
-base_params['CubicBool']    = True    # Use cubic spline interpolation
-base_params['T_cycle']      = 1       # No 'seasonal' cycles
-base_params['BoroCnstArt']  = None    # No artificial borrowing constraint
+# Import default parameter values, without loading the rest of HARK
+from bufferstock.params import ParamSpec, default_parameters
+from bufferstock.cache import SolutionCache
+from bufferstock.pipeline import Pipeline, module_sources
+Params = default_parameters()
+
+# Solved models are saved here and loaded again when the script is rerun with the same parameters
+cache = SolutionCache()
+
+# Every figure and table is made by a chain of named stages (solve -> simulate -> aggregate -> plot or
+# tabulate), each declaring what it depends on. A stage is rerun only when its code, its parameters, the
+# bufferstock modules it uses or a stage it depends on has changed, or when one of its files is missing or was edited.
+pipeline = Pipeline()
+
+def uses(*modules):
+    #Source files of the bufferstock modules a stage calls, and of every bufferstock module they import
+    return module_sources(*['bufferstock/{}.py'.format(name) for name in modules])
+
+# Make a frozen spec containing all parameters needed to solve the model.
+# from_dict copies Params.init_idiosyncratic_shocks, so the shared default dictionary is never modified.
+base_params = ParamSpec.from_dict(Params.init_idiosyncratic_shocks, cycles=0, #cycles=0 implies infinite horizon model
+    # Set the parameters for the baseline results in the paper
+    # using the variable values defined in the cell above
+    PermGroFac = [PermGroFac],   # Permanent income growth factor
+    Rfree      = Rfree,          # Interest factor on assets
+    DiscFac    = DiscFac,        # Time Preference Factor
+    CRRA       = CRRA,           # Coefficient of relative risk aversion
+    UnempPrb   = UnempPrb,       # Probability of unemployment (e.g. Probability of Zero Income in the paper)
+    IncUnemp   = IncUnemp,       # Induces natural borrowing constraint
+    PermShkStd = [PermShkStd],   # Standard deviation of log permanent income shocks
+    TranShkStd = [TranShkStd],   # Standard deviation of log transitory income shocks
+
+    # Some technical settings that are not interesting for our purposes
+    LivPrb       = [1.0],   # 100 percent probability of living to next period
+    CubicBool    = True,    # Use cubic spline interpolation
+    T_cycle      = 1,       # No 'seasonal' cycles
+    BoroCnstArt  = None)    # No artificial borrowing constraint
 
 
 # In[4]:
 
 
-from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType #Import consumer type
-baseEx_inf = IndShockConsumerType(cycles=0,**base_params) #cycles=0 implies infinite horizon model
-
-baseEx_inf.solve()
-baseEx_inf.unpackcFunc()
-
-
-# In[5]:
+# Expected consumption growth E[c_{t+1}*G*psi]/c_t is computed by expected_growth
+# (bufferstock/growth.py), which takes any solved agent and a whole array of m at once
 
+@pipeline.stage(sources=uses('solve', 'growth'), params=base_params)
+def baseline_growth():
+    from types import SimpleNamespace
+    from bufferstock.solve import solve_spec
+    from bufferstock.growth import expected_growth
 
-# Define a function to calculate expected consumption 
-def exp_consumption(a):
-    '''
-    Taking end-of-period assets as input, return expectation of next period's consumption
-    Inputs:
-       a: end-of-period assets
-    Returns:
-       expconsump: next period's expected consumption
-    '''
-    GrowFactp1 = baseEx_inf.PermGroFac[0]* baseEx_inf.PermShkDstn[0][1]
-    Rnrmtp1 = baseEx_inf.Rfree / GrowFactp1
-    # end-of-period assets plus normalized returns
-    btp1 = Rnrmtp1*a
-    # expand dims of btp1 and use broadcasted sum of a column and a row vector
-    # to obtain a matrix of possible beginning-of-period assets next period
-    mtp1 = np.expand_dims(btp1, axis=1) + baseEx_inf.TranShkDstn[0][1]
-    part_expconsumption = GrowFactp1*baseEx_inf.cFunc[0](mtp1).T
-    # finish expectation over permanent income shocks by right multiplying with
-    # the weights
-    part_expconsumption = np.dot(part_expconsumption, baseEx_inf.PermShkDstn[0][0])
-    # finish expectation over transitory income shocks by right multiplying with
-    # weights
-    expconsumption = np.dot(part_expconsumption, baseEx_inf.TranShkDstn[0][0])
-    # return expected consumption
-    return expconsumption
+    baseEx_inf = solve_spec(base_params, cache) #Solve the IndShockConsumerType (or load it from the cache)
 
+    # Calculate the expected consumption growth factor
+    m1 = np.linspace(1,baseEx_inf.solution[0].mNrmSS,50) # m1 defines the plot range on the left of target m value (e.g. m <= target m)
 
-# In[6]:
+    # growth1 defines the values of expected consumption growth factor when m is less than target m
+    growth1 = expected_growth(baseEx_inf, m1)
 
+    # m2 defines the plot range on the right of target m value (e.g. m >= target m)
+    m2 = np.linspace(baseEx_inf.solution[0].mNrmSS,1.9,50)
 
-# Calculate the expected consumption growth factor
-m1 = np.linspace(1,baseEx_inf.solution[0].mNrmSS,50) # m1 defines the plot range on the left of target m value (e.g. m <= target m)
-c_m1 = baseEx_inf.cFunc[0](m1)
-a1 = m1-c_m1
-exp_consumption_l1 = [exp_consumption(i) for i in a1]
+    # growth 2 defines the values of expected consumption growth factor when m is bigger than target m
+    growth2 = expected_growth(baseEx_inf, m2)
 
-# growth1 defines the values of expected consumption growth factor when m is less than target m
-growth1 = np.array(exp_consumption_l1)/c_m1
-
-# m2 defines the plot range on the right of target m value (e.g. m >= target m)
-m2 = np.linspace(baseEx_inf.solution[0].mNrmSS,1.9,50)
-c_m2 = baseEx_inf.cFunc[0](m2)
-a2 = m2-c_m2
-exp_consumption_l2 = [exp_consumption(i) for i in a2]
-
-# growth 2 defines the values of expected consumption growth factor when m is bigger than target m
-growth2 = np.array(exp_consumption_l2)/c_m2
+    # The figures only need these numbers from the model, so they can be drawn without loading HARK
+    baseEx_inf = SimpleNamespace(Rfree=baseEx_inf.Rfree, DiscFac=baseEx_inf.DiscFac, CRRA=baseEx_inf.CRRA,
+                                 PermGroFac=baseEx_inf.PermGroFac, mNrmSS=baseEx_inf.solution[0].mNrmSS)
+    return baseEx_inf, m1, growth1, m2, growth2
 
 
 # In[7]:
 
 
-# Define a function to construct the arrows on the consumption growth rate function
-def arrowplot(axes, x, y, narrs=15, dspace=0.5, direc='neg',
-              hl=0.01, hw=3, c='black'):
-    '''
-    The function is used to plot arrows given the data x and y.
-
-    Input:
-        narrs  :  Number of arrows that will be drawn along the curve
-
-        dspace :  Shift the position of the arrows along the curve.
-                  Should be between 0. and 1.
-
-        direc  :  can be 'pos' or 'neg' to select direction of the arrows
-
-        hl     :  length of the arrow head
-
-        hw     :  width of the arrow head
-
-        c      :  color of the edge and face of the arrow head
-    '''
-
-    # r is the distance spanned between pairs of points
-    r = np.sqrt(np.diff(x)**2+np.diff(y)**2)
-    r = np.insert(r, 0, 0.0)
-
-    # rtot is a cumulative sum of r, it's used to save time
-    rtot = np.cumsum(r)
-
-    # based on narrs set the arrow spacing
-    aspace = r.sum() / narrs
-
-    if direc is 'neg':
-        dspace = -1.*abs(dspace)
-    else:
-        dspace = abs(dspace)
-
-    arrowData = [] # will hold tuples of x,y,theta for each arrow
-    arrowPos = aspace*(dspace) # current point on walk along data
-                                 # could set arrowPos to 0 if you want
-                                 # an arrow at the beginning of the curve
-
-    ndrawn = 0
-    rcount = 1
-    while arrowPos < r.sum() and ndrawn < narrs:
-        x1,x2 = x[rcount-1],x[rcount]
-        y1,y2 = y[rcount-1],y[rcount]
-        da = arrowPos-rtot[rcount]
-        theta = np.arctan2((x2-x1),(y2-y1))
-        ax = np.sin(theta)*da+x1
-        ay = np.cos(theta)*da+y1
-        arrowData.append((ax,ay,theta))
-        ndrawn += 1
-        arrowPos+=aspace
-        while arrowPos > rtot[rcount+1]:
-            rcount+=1
-            if arrowPos > rtot[-1]:
-                break
-
-    for ax,ay,theta in arrowData:
-        # use aspace as a guide for size and length of things
-        # scaling factors were chosen by experimenting a bit
-
-        dx0 = np.sin(theta)*hl/2.0 + ax
-        dy0 = np.cos(theta)*hl/2.0 + ay
-        dx1 = -1.*np.sin(theta)*hl/2.0 + ax
-        dy1 = -1.*np.cos(theta)*hl/2.0 + ay
-
-        if direc is 'neg' :
-            ax0 = dx0
-            ay0 = dy0
-            ax1 = dx1
-            ay1 = dy1
-        else:
-            ax0 = dx1
-            ay0 = dy1
-            ax1 = dx0
-            ay1 = dy0
-
-        axes.annotate('', xy=(ax0, ay0), xycoords='data',
-                xytext=(ax1, ay1), textcoords='data',
-                arrowprops=dict( headwidth=hw, frac=1., ec=c, fc=c))
+# The arrows on the consumption growth curves are drawn by arrowplot (bufferstock/plotting.py),
+# which places the arrows of every curve at once and draws them with a single quiver
 
 
 # In[8]:
 
 
-# Plot consumption growth as a function of market resources
-# Calculate Absolute Patience Factor Phi = lower bound of consumption growth factor
 import math
 
-AbsPatientFac = math.log((baseEx_inf.Rfree*baseEx_inf.DiscFac)**(1.0/baseEx_inf.CRRA))
+@pipeline.stage(requires=['baseline_growth'], sources=uses('plotting'), outputs=['Paper/Figures/Figure1a.png'])
+def Figure1a(baseline_growth):
+    import matplotlib.pyplot as plt
+    from bufferstock.plotting import arrowplot
 
-fig = plt.figure(figsize = (12,8))
-ax = fig.add_subplot(111)
+    baseEx_inf, m1, growth1, m2, growth2 = baseline_growth
 
-# Plot the Absolute Patience Factor line
-ax.plot([0,2.0],[AbsPatientFac,AbsPatientFac], label=r'Absolute Patience Rate: $\rho^{-1}(r-\delta)$')
+    # Plot consumption growth as a function of market resources
+    # Calculate Absolute Patience Factor Phi = lower bound of consumption growth factor
+    AbsPatientFac = math.log((baseEx_inf.Rfree*baseEx_inf.DiscFac)**(1.0/baseEx_inf.CRRA))
 
-# Plot the Permanent Income Growth Factor line
-ax.plot([0,2.0],[math.log(baseEx_inf.PermGroFac[0]),math.log(baseEx_inf.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g$')
+    fig = plt.figure(figsize = (12,8))
+    ax = fig.add_subplot(111)
 
-# Plot the expected consumption growth factor on the left side of target m
-ax.plot(m1,np.log(growth1),color="black", label=r'Expected Consumption Growth Rate: $E_t\Delta \log C_{t+1}$')
+    # Plot the Absolute Patience Factor line
+    ax.plot([0,2.0],[AbsPatientFac,AbsPatientFac], label=r'Absolute Patience Rate: $\rho^{-1}(r-\delta)$')
 
-# Plot the expected consumption growth factor on the right side of target m
-ax.plot(m2,np.log(growth2),color="black")
+    # Plot the Permanent Income Growth Factor line
+    ax.plot([0,2.0],[math.log(baseEx_inf.PermGroFac[0]),math.log(baseEx_inf.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g$')
 
-# Plot the arrows
-arrowplot(ax, m1,np.log(growth1))
-arrowplot(ax, m2,np.log(growth2), direc='pos')
+    # Plot the expected consumption growth factor on the left side of target m
+    ax.plot(m1,np.log(growth1),color="black", label=r'Expected Consumption Growth Rate: $E_t\Delta \log C_{t+1}$')
 
-# Plot the target m
-ax.plot([baseEx_inf.solution[0].mNrmSS,baseEx_inf.solution[0].mNrmSS],[-1,1.4],color="red", label='Target Level of Wealth')
-ax.set_xlim(1,1.9)
-ax.set_ylim(-0.05,0.05)
+    # Plot the expected consumption growth factor on the right side of target m
+    ax.plot(m2,np.log(growth2),color="black")
 
-plt.xlabel('$m_t$', fontsize=20)
-plt.ylabel('Growth', fontsize=20)
-plt.legend()
-plt.savefig('Paper/Figures/Figure1a.png')
+    # Plot the arrows
+    arrowplot(ax, [m1,m2], [np.log(growth1),np.log(growth2)], direc=['neg','pos'])
 
-# In[9]:
+    # Plot the target m
+    ax.plot([baseEx_inf.mNrmSS,baseEx_inf.mNrmSS],[-1,1.4],color="red", label='Target Level of Wealth')
+    ax.set_xlim(1,1.9)
+    ax.set_ylim(-0.05,0.05)
 
+    plt.xlabel('$m_t$', fontsize=20)
+    plt.ylabel('Growth', fontsize=20)
+    plt.legend()
+    plt.savefig('Paper/Figures/Figure1a.png')
 
-#Create a new consumer model with lower permanent income growth (1.005)
+# In[9]:
 
-# Make a dictionary containing all parameters needed to solve the model
-base_params1 = Params.init_idiosyncratic_shocks
 
-# Set the parameters for the baseline results in the paper
-# using the variable values defined in the cell above
-base_params1['PermGroFac'] = [1.005]        # Permanent income growth factor reduced
-base_params1['Rfree']      = Rfree          # Interest factor on assets
-base_params1['DiscFac']    = DiscFac        # Time Preference Factor
-base_params1['CRRA']       = CRRA           # Coefficient of relative risk aversion
-base_params1['UnempPrb']   = UnempPrb       # Probability of unemployment (e.g. Probability of Zero Income in the paper)
-base_params1['IncUnemp']   = IncUnemp       # Induces natural borrowing constraint
-base_params1['PermShkStd'] = [PermShkStd]   # Standard deviation of log permanent income shocks
-base_params1['TranShkStd'] = [TranShkStd]   # Standard deviation of log transitory income shocks
+#Create a new consumer model with lower permanent income growth (1.005)
 
-# Some technical settings that are not interesting for our purposes
-base_params1['LivPrb']       = [1.0]   # 100 percent probability of living to next period
-base_params1['CubicBool']    = True    # Use cubic spline interpolation
-base_params1['T_cycle']      = 1       # No 'seasonal' cycles
-base_params1['BoroCnstArt']  = None    # No artificial borrowing constraint
+# Copy the baseline spec, changing only the growth factor. base_params itself is left untouched.
+base_params1 = base_params.replace(PermGroFac = [1.005])        # Permanent income growth factor reduced
 
 
 # In[10]:
 
 
-from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType
-baseEx_inf1 = IndShockConsumerType(cycles=0,**base_params1)
+# The same expected_growth function works for the new model; nothing has to be redefined
 
-baseEx_inf1.solve()
-baseEx_inf1.unpackcFunc()
+@pipeline.stage(sources=uses('solve', 'growth'), params=base_params1)
+def slow_growth():
+    from types import SimpleNamespace
+    from bufferstock.solve import solve_spec
+    from bufferstock.growth import expected_growth
 
+    baseEx_inf1 = solve_spec(base_params1, cache)
 
-# In[11]:
+    # Calculate the expected consumption growth factor
+    m11 = np.linspace(1,baseEx_inf1.solution[0].mNrmSS,50) # m11 defines the plot range on the left of target m value (e.g. m <= target m)
 
+    # growth11 defines the values of expected consumption growth factor when m is less than target m
+    growth11 = expected_growth(baseEx_inf1, m11)
 
-# Redefine a function to calculate expected consumption since the model has changed
-def exp_consumption(a):
-    '''
-    Taking end-of-period assets as input, return expectation of next period's consumption
-    Inputs:
-       a: end-of-period assets
-    Returns:
-       expconsump: next period's expected consumption
-    '''
-    GrowFactp1 = baseEx_inf1.PermGroFac[0]* baseEx_inf1.PermShkDstn[0][1]
-    Rnrmtp1 = baseEx_inf1.Rfree / GrowFactp1
-    # end-of-period assets plus normalized returns
-    btp1 = Rnrmtp1*a
-    # expand dims of btp1 and use broadcasted sum of a column and a row vector
-    # to obtain a matrix of possible beginning-of-period assets next period
-    mtp1 = np.expand_dims(btp1, axis=1) + baseEx_inf1.TranShkDstn[0][1]
-    part_expconsumption = GrowFactp1*baseEx_inf1.cFunc[0](mtp1).T
-    # finish expectation over permanent income shocks by right multiplying with
-    # the weights
-    part_expconsumption = np.dot(part_expconsumption, baseEx_inf1.PermShkDstn[0][0])
-    # finish expectation over transitory income shocks by right multiplying with
-    # weights
-    expconsumption = np.dot(part_expconsumption, baseEx_inf1.TranShkDstn[0][0])
-    # return expected consumption
-    return expconsumption
+    # m21 defines the plot range on the right of target m value (e.g. m >= target m)
+    m21 = np.linspace(baseEx_inf1.solution[0].mNrmSS,1.9,50)
 
+    # growth 21 defines the values of expected consumption growth factor when m is bigger than target m
+    growth21 = expected_growth(baseEx_inf1, m21)
 
-# In[12]:
+    baseEx_inf1 = SimpleNamespace(Rfree=baseEx_inf1.Rfree, DiscFac=baseEx_inf1.DiscFac, CRRA=baseEx_inf1.CRRA,
+                                  PermGroFac=baseEx_inf1.PermGroFac, mNrmSS=baseEx_inf1.solution[0].mNrmSS)
+    return baseEx_inf1, m11, growth11, m21, growth21
 
 
-# Calculate the expected consumption growth factor
-m11 = np.linspace(1,baseEx_inf1.solution[0].mNrmSS,50) # m11 defines the plot range on the left of target m value (e.g. m <= target m)
-c_m11 = baseEx_inf1.cFunc[0](m11)
-a11 = m11-c_m11
-exp_consumption_l11 = [exp_consumption(i) for i in a11]
-
-# growth11 defines the values of expected consumption growth factor when m is less than target m
-growth11 = np.array(exp_consumption_l11)/c_m11
-
-# m21 defines the plot range on the right of target m value (e.g. m >= target m)
-m21 = np.linspace(baseEx_inf1.solution[0].mNrmSS,1.9,50)
-c_m21 = baseEx_inf1.cFunc[0](m21)
-a21 = m21-c_m21
-exp_consumption_l21 = [exp_consumption(i) for i in a21]
+# In[13]:
 
-# growth 21 defines the values of expected consumption growth factor when m is bigger than target m
-growth21 = np.array(exp_consumption_l21)/c_m21
 
+@pipeline.stage(requires=['baseline_growth', 'slow_growth'], outputs=['Paper/Figures/Figure1b.png'])
+def Figure1b(baseline_growth, slow_growth):
+    import matplotlib.pyplot as plt
 
-# In[13]:
+    baseEx_inf, m1, growth1, m2, growth2 = baseline_growth
+    baseEx_inf1, m11, growth11, m21, growth21 = slow_growth
 
+    # Plot consumption growth for both cases (high growth and low growth) as a function of market resources
+    # Calculate Absolute Patience Factor Phi = lower bound of consumption growth factor
+    AbsPatientFac1 = math.log((baseEx_inf1.Rfree)*(baseEx_inf1.DiscFac)**(1.0/baseEx_inf1.CRRA))
 
-# Plot consumption growth for both cases (high growth and low growth) as a function of market resources
-# Calculate Absolute Patience Factor Phi = lower bound of consumption growth factor
-AbsPatientFac1 = math.log((baseEx_inf1.Rfree)*(baseEx_inf1.DiscFac)**(1.0/baseEx_inf1.CRRA))
+    fig = plt.figure(figsize = (12,8))
+    ax = fig.add_subplot(111)
+    # Plot the Absolute Patience Factor line
+    ax.plot([0,1.9],[AbsPatientFac1,AbsPatientFac1],label=r'Absolute Patience Rate: $\rho^{-1}(r-\delta)$')
 
-fig = plt.figure(figsize = (12,8))
-ax = fig.add_subplot(111)
-# Plot the Absolute Patience Factor line
-ax.plot([0,1.9],[AbsPatientFac1,AbsPatientFac1],label=r'Absolute Patience Rate: $\rho^{-1}(r-\delta)$')
+    # Plot the Permanent Income Growth Factor line
+    ax.plot([0,1.9],[math.log(baseEx_inf1.PermGroFac[0]),math.log(baseEx_inf1.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g_2$', color='orange', linestyle="--")
+    ax.plot([0,1.9],[math.log(baseEx_inf.PermGroFac[0]),math.log(baseEx_inf.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g_1$', color='orange')
 
-# Plot the Permanent Income Growth Factor line
-ax.plot([0,1.9],[math.log(baseEx_inf1.PermGroFac[0]),math.log(baseEx_inf1.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g_2$', color='orange', linestyle="--")
-ax.plot([0,1.9],[math.log(baseEx_inf.PermGroFac[0]),math.log(baseEx_inf.PermGroFac[0])], label=r'Permanent Income Growth Rate: $g_1$', color='orange')
+    # Plot the expected consumption growth factor on the left side of target m
+    ax.plot(m11,np.log(growth11),color="black",linestyle="--", label=r'Expected Consumption Growth Rate under $g_2$')
+    ax.plot(m1,np.log(growth1),color="black", label=r'Expected Consumption Growth Rate under $g_1$')
 
-# Plot the expected consumption growth factor on the left side of target m
-ax.plot(m11,np.log(growth11),color="black",linestyle="--", label=r'Expected Consumption Growth Rate under $g_2$')
-ax.plot(m1,np.log(growth1),color="black", label=r'Expected Consumption Growth Rate under $g_1$')
+    # Plot the expected consumption growth factor on the right side of target m
+    ax.plot(m21,np.log(growth21),color="black", linestyle="--")
+    ax.plot(m2,np.log(growth2),color="black")
 
-# Plot the expected consumption growth factor on the right side of target m
-ax.plot(m21,np.log(growth21),color="black", linestyle="--")
-ax.plot(m2,np.log(growth2),color="black")
+    # Plot the target m
+    ax.plot([baseEx_inf1.mNrmSS,baseEx_inf1.mNrmSS],[-0.05,0.05],color="red",linestyle="--", label='Target Level of Wealth under $g_2$')
+    ax.plot([baseEx_inf.mNrmSS,baseEx_inf.mNrmSS],[-0.05,0.05],color="red", label='Target Level of Wealth under $g_1$')
 
-# Plot the target m
-ax.plot([baseEx_inf1.solution[0].mNrmSS,baseEx_inf1.solution[0].mNrmSS],[-0.05,0.05],color="red",linestyle="--", label='Target Level of Wealth under $g_2$')
-ax.plot([baseEx_inf.solution[0].mNrmSS,baseEx_inf.solution[0].mNrmSS],[-0.05,0.05],color="red", label='Target Level of Wealth under $g_1$')
-
-ax.set_xlim(0.9,1.9)
-ax.set_ylim(-0.05,0.05)
-plt.xlabel('$m_t$',fontsize=20)
-plt.ylabel('Growth',fontsize=20)
-plt.legend()
-plt.savefig('Paper/Figures/Figure1b.png')
+    ax.set_xlim(0.9,1.9)
+    ax.set_ylim(-0.05,0.05)
+    plt.xlabel('$m_t$',fontsize=20)
+    plt.ylabel('Growth',fontsize=20)
+    plt.legend()
+    plt.savefig('Paper/Figures/Figure1b.png')
 
 # ### Methods of Solution
 # 
-#  
+# 
 # 
 # The optimal consumption for a given value of gross wealth, $c_t(m_t)$, is derived by solving the Euler equation recursively backwards.
 # 
-#  
+# 
 # 
 # 1. $c_T(m_T) = m_T$
 # 
@@ -491,7 +358,7 @@ plt.savefig('Paper/Figures/Figure1b.png')
 # 
 # 5. Continue this method until period $t$.
 # 
-#  
+# 
 # 
 # For the infinite horizon version of this model, the following convergence criterion is used.
 # 
@@ -515,14 +382,10 @@ plt.savefig('Paper/Figures/Figure1b.png')
 
 #Some preliminary setup for the lifecycle model
 
-import HARK.ConsumptionSaving.ConsIndShockModel as Model    
-import HARK.ConsumptionSaving.ConsumerParameters as Params
-from HARK.utilities import plotFuncsDer, plotFuncs
-from time import time
 mystr = lambda number : "{:.4f}".format(number)
-do_simulation = True
-import numpy as np
-import matplotlib.pyplot as plt
+do_simulation = True #False computes the same statistics without Monte Carlo, from distributions pushed forward on a grid
+sampling_method = 'mc' #Random numbers of the lifecycle and Table 1 simulations: 'mc', or 'sobol', 'antithetic' or 'stratified' for less sampling noise
+replications = 1 #With more than one, each simulation is repeated with independent draws and the standard errors of its statistics are written to Paper/Tables
 
 
 # In[15]:
@@ -530,23 +393,25 @@ import matplotlib.pyplot as plt
 
 #Set Parameters
 
-Params.init_lifecycle["CRRA"]= 2.00            # Default coefficient of relative risk aversion (rho)
-Params.init_lifecycle["DiscFac"]= 0.96         # Default intertemporal discount factor (beta)
-Params.init_lifecycle["PermGroFacAgg"]= 1.02   # Aggregate permanent income growth factor 
-Params.init_lifecycle["aNrmInitMean"]= -1000   # Mean of log initial assets. Set to -1000 so that initial assets is close to 0.
-Params.init_lifecycle["aNrmInitStd"]= 0.0      # Standard deviation of log initial assets. All agents start with the same amount of assets.
-Params.init_lifecycle["pLvlInitMean"]= 0.0     # Mean of log initial permanent income. Initial permanent income is set to 1.
-Params.init_lifecycle["pLvlInitStd"]= 0.0      # Standard deviation of log initial permanent income. All agents start with the same permanent level of income.
-Params.init_lifecycle["Rfree"]= 1.00           # Follows the paper's choice of risk free interest rates.
+# The spec copies Params.init_lifecycle, so these values do not leak into later cells
+lifecycle_params = ParamSpec.from_dict(Params.init_lifecycle, cycles=1, #1 for finite horizon and 0 for infinite horizon
+    CRRA          = 2.00,    # Default coefficient of relative risk aversion (rho)
+    DiscFac       = 0.96,    # Default intertemporal discount factor (beta)
+    PermGroFacAgg = 1.02,    # Aggregate permanent income growth factor 
+    aNrmInitMean  = -1000,   # Mean of log initial assets. Set to -1000 so that initial assets is close to 0.
+    aNrmInitStd   = 0.0,     # Standard deviation of log initial assets. All agents start with the same amount of assets.
+    pLvlInitMean  = 0.0,     # Mean of log initial permanent income. Initial permanent income is set to 1.
+    pLvlInitStd   = 0.0,     # Standard deviation of log initial permanent income. All agents start with the same permanent level of income.
+    Rfree         = 1.00,    # Follows the paper's choice of risk free interest rates.
 
-Params.init_lifecycle['AgentCount'] = 10000    # Number of agents simulated
+    AgentCount = 10000,      # Number of agents simulated
 
-Params.init_lifecycle['PermShkStd'] = [0.1]*40 + [0]*9      # SD of Permanent income shock
-Params.init_lifecycle['TranShkStd'] = [0.1]*40 + [0]*9      # SD of Transitory income shock
-Params.init_lifecycle['LivPrb']     = [1]*49                # Probability of living.
-Params.init_lifecycle['T_cycle']    = 49                    # Agents are simulated for 49 periods.
-Params.init_lifecycle['T_retire']   = 40                    # Agents retire at age 65, or their 40th period.
-Params.init_lifecycle['T_age']      = 50                    #Make sure that old people die at terminal age and don't turn into newborns!
+    PermShkStd = [0.1]*40 + [0]*9,      # SD of Permanent income shock
+    TranShkStd = [0.1]*40 + [0]*9,      # SD of Transitory income shock
+    LivPrb     = [1]*49,                # Probability of living.
+    T_cycle    = 49,                    # Agents are simulated for 49 periods.
+    T_retire   = 40,                    # Agents retire at age 65, or their 40th period.
+    T_age      = 50)                    #Make sure that old people die at terminal age and don't turn into newborns!
 
 
 # In[16]:
@@ -554,14 +419,9 @@ Params.init_lifecycle['T_age']      = 50                    #Make sure that old
 
 #Unskilled Laborers: 3 percent growth from 26~40. flat for 40~65.
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.03)  #There seems to be a bug where the permanent income is increased by the growth rate already in the first period. This is set to offset that and have agents start with permanent income of 1.
-Params.init_lifecycle['PermGroFac'] = [1.03]*14 + [1]*25 + [0.7] + [1]*9     # Income growth over the lifetime for unskilled workers
-
-Lifecycle_Unskilled = Model.IndShockConsumerType(**Params.init_lifecycle)
-Lifecycle_Unskilled.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Unskilled.solve()
-Lifecycle_Unskilled.unpackcFunc()
-Lifecycle_Unskilled.timeFwd() #make sure that time is moving forward
+Unskilled_params = lifecycle_params.replace(
+    pLvlInitMean = math.log(1/1.03),  #There seems to be a bug where the permanent income is increased by the growth rate already in the first period. This is set to offset that and have agents start with permanent income of 1.
+    PermGroFac   = [1.03]*14 + [1]*25 + [0.7] + [1]*9)     # Income growth over the lifetime for unskilled workers
 
 
 # In[17]:
@@ -569,128 +429,182 @@ Lifecycle_Unskilled.timeFwd() #make sure that time is moving forward
 
 #Operatives: 2.5 percent growth from 26~50. 1 percent growth from 50~65.
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.025) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9     #Income growth over the lifetime for operatives
-
-Lifecycle_Operatives = Model.IndShockConsumerType(**Params.init_lifecycle)
-Lifecycle_Operatives.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Operatives.solve()
-Lifecycle_Operatives.unpackcFunc()
-Lifecycle_Operatives.timeFwd() #make sure that time is moving forward
-
+Operatives_params = lifecycle_params.replace(
+    pLvlInitMean = math.log(1/1.025), #This is set as such to offset growth bug
+    PermGroFac   = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9)     #Income growth over the lifetime for operatives
 
 # In[18]:
 
 
 #Managers: 3 percent growth from 26~55. 1 percent decline from 55~65.
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.03) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.03]*29 + [0.99]*10 + [0.7] + [1]*9     #Income growth over the lifetime for managers
+Managers_params = lifecycle_params.replace(
+    pLvlInitMean = math.log(1/1.03), #This is set as such to offset growth bug
+    PermGroFac   = [1.03]*29 + [0.99]*10 + [0.7] + [1]*9)     #Income growth over the lifetime for managers
 
-Lifecycle_Managers = Model.IndShockConsumerType(**Params.init_lifecycle)
-Lifecycle_Managers.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Managers.solve()
-Lifecycle_Managers.unpackcFunc()
-Lifecycle_Managers.timeFwd() #make sure that time is moving forward
+# The three occupations do not depend on each other, so solve them side by side in a pool of processes
+@pipeline.stage(sources=uses('parallel'), params=[Unskilled_params, Operatives_params, Managers_params])
+def lifecycle_models(processes=None):
+    from bufferstock.parallel import solve_specs
+    return solve_specs([Unskilled_params, Operatives_params, Managers_params], processes=processes, cache=cache) #solve_specs makes sure that time is moving forward
 
 
 # In[19]:
 
 
-#Simulate the models for each agent type
+#Simulate the models for each agent type, keeping only the per-age means that Figure 5 needs, and the
+#histories of the operatives, which are written to a panel on disk with the digest of their spec
+
+Operatives_panel = os.path.join(pipeline.directory, 'panels', 'Operatives')
+
+@pipeline.stage(requires=['lifecycle_models'], sources=uses('streaming', 'sampling', 'histogram', 'panel_io'),
+                params=[do_simulation, sampling_method, replications],
+                outputs=([os.path.join(Operatives_panel, 'metadata.json')] if do_simulation else []) +
+                        (['Paper/Tables/lifecycle_se.csv'] if do_simulation and replications > 1 else []))
+def lifecycle_simulation(lifecycle_models):
+    from bufferstock.streaming import Mean, simulate_streaming, stats_frame
+    from bufferstock.histogram import cohort_path
+    from bufferstock.panel_io import write_panel
+    from bufferstock.counter import initialize_counter_sim
+    from bufferstock.sampling import comparison_draws, combine_replications
+
+    Lifecycle_Unskilled, Lifecycle_Operatives, Lifecycle_Managers = lifecycle_models
+
+    if do_simulation:
+        for agent in lifecycle_models:
+            agent.T_sim = 49 #Simulate agents for 49 periods since their lifespan is 49 periods
+        Replications = []
+        for replication in range(replications):
+            #All three occupations draw their shocks from one source, so the differences between them are
+            #not blurred by sampling noise; every replication has its own independent draws
+            Shocks = comparison_draws(lifecycle_models, sampling_method, seed=replication)
+
+            Lifecycle_Unskilled.track_vars = [] #No full histories; the statistics are accumulated period by period
+            initialize_counter_sim(Lifecycle_Unskilled, Shocks, np.arange(Lifecycle_Unskilled.AgentCount))
+            Stats_Unskilled = simulate_streaming(Lifecycle_Unskilled,
+                {'Cons_Unskilled': Mean(lambda agent: agent.cNrmNow*agent.pLvlNow), #This represents consumption level
+                 'Inc_Unskilled': Mean('pLvlNow')}, draws=Shocks)
+
+            Lifecycle_Operatives.track_vars = ['mNrmNow','cNrmNow','pLvlNow','TranShkNow'] #Kept for the MPC and divergence statistics
+            initialize_counter_sim(Lifecycle_Operatives, Shocks, np.arange(Lifecycle_Operatives.AgentCount))
+            Stats_Operatives = simulate_streaming(Lifecycle_Operatives,
+                {'Cons_Operatives': Mean(lambda agent: agent.cNrmNow*agent.pLvlNow),
+                 'Inc_Operatives': Mean('pLvlNow')}, draws=Shocks)
+
+            Lifecycle_Managers.track_vars = []
+            initialize_counter_sim(Lifecycle_Managers, Shocks, np.arange(Lifecycle_Managers.AgentCount))
+            Stats_Managers = simulate_streaming(Lifecycle_Managers,
+                {'Cons_Managers': Mean(lambda agent: agent.cNrmNow*agent.pLvlNow),
+                 'Inc_Managers': Mean('pLvlNow')}, draws=Shocks)
+
+            Replications.append(stats_frame([Stats_Unskilled, Stats_Operatives, Stats_Managers], age_offset=25)) #add 25 to make the starting age 26
+
+    if not do_simulation:
+        #The same per-age means, exact up to the grid
+        Path_Unskilled, Path_Operatives, Path_Managers = [cohort_path(agent, 49) for agent in
+            [Lifecycle_Unskilled, Lifecycle_Operatives, Lifecycle_Managers]]
+        Stats_Unskilled = {'Cons_Unskilled': Path_Unskilled.stat(Path_Unskilled.mean('cNrmNow', 'pLvl')),
+                           'Inc_Unskilled': Path_Unskilled.stat(Path_Unskilled.mean(None, 'pLvl'))}
+        Stats_Operatives = {'Cons_Operatives': Path_Operatives.stat(Path_Operatives.mean('cNrmNow', 'pLvl')),
+                            'Inc_Operatives': Path_Operatives.stat(Path_Operatives.mean(None, 'pLvl'))}
+        Stats_Managers = {'Cons_Managers': Path_Managers.stat(Path_Managers.mean('cNrmNow', 'pLvl')),
+                          'Inc_Managers': Path_Managers.stat(Path_Managers.mean(None, 'pLvl'))}
+
+    #aNrmNow: End of Period Assets normalized by permanent income
+    #mNrmNow: Market Resources (beginning of period assets + income) normalized by permanent income
+    #cNrmNow: Consumption normalized by permanent income
+    #pLvlNow: Permanent level of income
+    #t_age:   Period of the simulation
+
+    #Collect the per-age means into a dataframe, averaged over the replications, and write their standard errors
+    if do_simulation:
+        AgeMeans, AgeMeans_se = combine_replications(Replications)
+        if replications > 1:
+            AgeMeans_se.to_csv('Paper/Tables/lifecycle_se.csv', index=False)
+    else:
+        AgeMeans = stats_frame([Stats_Unskilled, Stats_Operatives, Stats_Managers], age_offset=25)
 
-if do_simulation:
-    Lifecycle_Unskilled.T_sim = 49 #Simulate agents for 49 periods since their lifespan is 49 periods
-    Lifecycle_Unskilled.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    Lifecycle_Unskilled.initializeSim()
-    Lifecycle_Unskilled.simulate()
-    
-if do_simulation:
-    Lifecycle_Operatives.T_sim = 49
-    Lifecycle_Operatives.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age']
-    Lifecycle_Operatives.initializeSim()
-    Lifecycle_Operatives.simulate()
+    #The histories of the operatives (of the last replication), one column per variable
+    Panel_Operatives = None
+    if do_simulation:
+        write_panel(Operatives_panel, Lifecycle_Operatives, spec=Operatives_params,
+                    sampling_method=sampling_method, seed=replications - 1)
+        Panel_Operatives = Operatives_panel
+    return AgeMeans, Panel_Operatives
 
-if do_simulation:
-    Lifecycle_Managers.T_sim = 49
-    Lifecycle_Managers.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age']
-    Lifecycle_Managers.initializeSim()    
-    Lifecycle_Managers.simulate()
-    
-#aNrmNow: End of Period Assets normalized by permanent income
-#mNrmNow: Market Resources (beginning of period assets + income) normalized by permanent income
-#cNrmNow: Consumption normalized by permanent income
-#pLvlNow: Permanent level of income
-#t_age:   Period of the simulation
 
+# In[21]:
 
-# In[20]:
 
+@pipeline.stage(requires=['lifecycle_simulation'],
+                outputs=['Paper/Figures/Figure5a.png', 'Paper/Figures/Figure5b.png', 'Paper/Figures/Figure5c.png'])
+def Figure5(lifecycle_simulation):
+    import matplotlib.pyplot as plt
 
-#Save the simulated data into a dataframe
+    AgeMeans = lifecycle_simulation[0]
 
-import pandas as pd
-raw_data = {'T_age': Lifecycle_Unskilled.t_age_hist.flatten()+25, #add 25 to make the starting age 26. age is same for all occupations so so need to make three of these.
-            'cNrmNow_Unskilled': Lifecycle_Unskilled.cNrmNow_hist.flatten(),
-            'pLvlNow_Unskilled': Lifecycle_Unskilled.pLvlNow_hist.flatten(),
-            'cNrmNow_Operatives': Lifecycle_Operatives.cNrmNow_hist.flatten(),
-            'pLvlNow_Operatives': Lifecycle_Operatives.pLvlNow_hist.flatten(),
-            'cNrmNow_Managers': Lifecycle_Managers.cNrmNow_hist.flatten(),
-            'pLvlNow_Managers': Lifecycle_Managers.pLvlNow_hist.flatten()}
+    plt.figure()
 
-Data = pd.DataFrame(raw_data) #make the raw data into a formal dataset
+    plt.plot(AgeMeans.T_age, AgeMeans.Cons_Unskilled,label='Consumption')
+    plt.plot(AgeMeans.T_age, AgeMeans.Inc_Unskilled,label='Income')
 
-Data['Cons_Unskilled'] = Data.cNrmNow_Unskilled * Data.pLvlNow_Unskilled #This represents consumption level
-Data['Cons_Operatives'] = Data.cNrmNow_Operatives * Data.pLvlNow_Operatives
-Data['Cons_Managers'] = Data.cNrmNow_Managers * Data.pLvlNow_Managers
-Data['Inc_Unskilled'] = Data.pLvlNow_Unskilled
-Data['Inc_Operatives'] = Data.pLvlNow_Operatives 
-Data['Inc_Managers'] = Data.pLvlNow_Managers
+    plt.legend()
+    plt.xlabel('Age')
+    plt.title('Unskilled Laborers')
+    plt.ylim(0.8,2.5)
+    plt.savefig('Paper/Figures/Figure5a.png')
 
-AgeMeans = Data.groupby(['T_age']).mean().reset_index() # Group the dataset by T_age and get the mean.
+    plt.figure()
 
+    plt.plot(AgeMeans.T_age, AgeMeans.Cons_Operatives,label='Consumption')
+    plt.plot(AgeMeans.T_age, AgeMeans.Inc_Operatives, label='Income')
 
-# In[21]:
+    plt.legend()
+    plt.xlabel('Age')
+    plt.title('Operatives')
+    plt.ylim(0.8,2.5)
+    plt.savefig('Paper/Figures/Figure5b.png')
 
+    plt.figure()
 
-plt.figure()
+    plt.plot(AgeMeans.T_age, AgeMeans.Cons_Managers,label='Consumption')
+    plt.plot(AgeMeans.T_age, AgeMeans.Inc_Managers, label='Income')
 
-plt.plot(AgeMeans.T_age, AgeMeans.Cons_Unskilled,label='Consumption')
-plt.plot(AgeMeans.T_age, AgeMeans.Inc_Unskilled,label='Income')
+    plt.legend()
+    plt.xlabel('Age')
+    plt.title('Managers')
+    plt.ylim(0.8,2.5)
+    plt.savefig('Paper/Figures/Figure5c.png')
 
-plt.legend()
-plt.xlabel('Age')
-plt.title('Unskilled Laborers')
-plt.ylim(0.8,2.5)
-plt.savefig('Paper/Figures/Figure5a.png')
-
-plt.figure()
+# Results show the parallel until the age of 45 or 50. Then retirement savings allow income profile to rise above the consumption profile in the years immediately before the retirement.
+# 
+# #### 2) The Consumption/Income Divergence in High Frequency Data
+# 
+# The Buffer-Stock model has no difficulty generating an MPC large enough to match emprical estimates, while the standard LC/PIH model is simply incapable of implying large values for the MPC out of transitory income. 
 
-plt.plot(AgeMeans.T_age, AgeMeans.Cons_Operatives,label='Consumption')
-plt.plot(AgeMeans.T_age, AgeMeans.Inc_Operatives, label='Income')
+# In[ ]:
 
-plt.legend()
-plt.xlabel('Age')
-plt.title('Operatives')
-plt.ylim(0.8,2.5)
-plt.savefig('Paper/Figures/Figure5b.png')
 
-plt.figure()
+#The MPC distribution of the simulated operatives, and how far household consumption is from household income,
+#from the columns of their stored panel that these statistics use
 
-plt.plot(AgeMeans.T_age, AgeMeans.Cons_Managers,label='Consumption')
-plt.plot(AgeMeans.T_age, AgeMeans.Inc_Managers, label='Income')
+@pipeline.stage(requires=['lifecycle_models', 'lifecycle_simulation'], sources=uses('mpc'))
+def divergence(lifecycle_models, lifecycle_simulation):
+    from bufferstock.panel import Panel
+    from bufferstock.panel_io import panel_metadata
+    from bufferstock.mpc import cross_section
 
-plt.legend()
-plt.xlabel('Age')
-plt.title('Managers')
-plt.ylim(0.8,2.5)
-plt.savefig('Paper/Figures/Figure5c.png')
+    Panel_Operatives = lifecycle_simulation[1]
+    if Panel_Operatives is not None:
+        if panel_metadata(Panel_Operatives)['spec_digest'] != Operatives_params.digest:
+            raise ValueError('The panel in {} was not simulated from Operatives_params'.format(Panel_Operatives))
+        MPC_Operatives, Divergence = cross_section(lifecycle_models[1],
+            Panel.from_panel(Panel_Operatives, columns=['mNrmNow', 'cNrmNow', 'pLvlNow', 'TranShkNow']))
+        print('MPC out of transitory income: ' + ', '.join(name + ' ' + mystr(value) for name, value in Divergence['mpc'].items()))
+        for level in ['household', 'aggregate']:
+            print(level.capitalize() + ' level: ' + ', '.join(name + ' ' + mystr(value) for name, value in Divergence[level].items()))
+        return Divergence
 
-# Results show the parallel until the age of 45 or 50. Then retirement savings allow income profile to rise above the consumption profile in the years immediately before the retirement.
-# 
-# #### 2) The Consumption/Income Divergence in High Frequency Data
-# 
-# The Buffer-Stock model has no difficulty generating an MPC large enough to match emprical estimates, while the standard LC/PIH model is simply incapable of implying large values for the MPC out of transitory income. 
 # 
 # #### 3) The Behaviour of Wealth over the Lifetime
 # 
@@ -707,86 +621,82 @@ plt.savefig('Paper/Figures/Figure5c.png')
 
 #Simulate Figure VI (Wealth for faster and slower income growth under perfect foresight)
 
-from HARK.ConsumptionSaving.ConsIndShockModel import PerfForesightConsumerType
+PF_params = ParamSpec.from_dict(Params.init_lifecycle, agent_type='PerfForesightConsumerType', cycles=1,
+    CRRA          = 2.00,    # Default coefficient of relative risk aversion (rho)
+    DiscFac       = 0.96,    # Default intertemporal discount factor (beta)
+    PermGroFacAgg = 1.02,    # Aggregate permanent income growth factor 
+    aNrmInitMean  = -1000,   # Mean of log initial assets 
+    aNrmInitStd   = 0.0,     # Standard deviation of log initial assets
+    pLvlInitMean  = 0.0,     # Mean of log initial permanent income 
+    pLvlInitStd   = 0.0,     # Standard deviation of log initial permanent income
+    Rfree         = 1.08,    # Risk free interest rate has been set to 8% so that it best fits the the age/wealth profile of data
 
-Params.init_lifecycle["CRRA"]= 2.00            # Default coefficient of relative risk aversion (rho)
-Params.init_lifecycle["DiscFac"]= 0.96         # Default intertemporal discount factor (beta)
-Params.init_lifecycle["PermGroFacAgg"]= 1.02   # Aggregate permanent income growth factor 
-Params.init_lifecycle["aNrmInitMean"]= -1000   # Mean of log initial assets 
-Params.init_lifecycle["aNrmInitStd"]= 0.0      # Standard deviation of log initial assets
-Params.init_lifecycle["pLvlInitMean"]= 0.0     # Mean of log initial permanent income 
-Params.init_lifecycle["pLvlInitStd"]= 0.0      # Standard deviation of log initial permanent income
-Params.init_lifecycle["Rfree"]= 1.08           # Risk free interest rate has been set to 8% so that it best fits the the age/wealth profile of data
+    AgentCount = 1,          # This is a perfect foresight model so we only need 1 agent
 
-Params.init_lifecycle['AgentCount'] = 1        # This is a perfect foresight model so we only need 1 agent
+    PermShkStd = [0]*49,     # No shocks in a perfect foresight model
+    TranShkStd = [0]*49,     # No shocks in a perfect foresight model
+    LivPrb     = [1]*49,     # No probability of death before terminal age
+    T_cycle    = 49,         # Life starts at age 26 and ends at 75
+    T_retire   = 40,         # Agents retire at age 65
+    T_age      = 50)         # Make sure that old people die at terminal age and don't turn into newborns!
 
-Params.init_lifecycle['PermShkStd'] = [0]*49   # No shocks in a perfect foresight model
-Params.init_lifecycle['TranShkStd'] = [0]*49   # No shocks in a perfect foresight model
-Params.init_lifecycle['LivPrb']     = [1]*49   # No probability of death before terminal age
-Params.init_lifecycle['T_cycle']    = 49       # Life starts at age 26 and ends at 75
-Params.init_lifecycle['T_retire']   = 40       # Agents retire at age 65
-Params.init_lifecycle['T_age']      = 50       # Make sure that old people die at terminal age and don't turn into newborns!
+Operatives_PF_params = PF_params.replace(
+    pLvlInitMean = math.log(1/1.025), #This is set as such to offset growth bug
+    PermGroFac   = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9)     #Lifetime income growth for operatives
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.025) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9     #Lifetime income growth for operatives
+Operatives_PF_Slow_params = PF_params.replace(
+    pLvlInitMean = math.log(1/1.015), #This is set as such to offset growth bug
+    PermGroFac   = [1.015]*24 + [1.00]*15 + [0.7] + [1]*9)     #Lifetime income growth for operatives with 1% slower income growth
 
-Lifecycle_Operatives_PF = Model.PerfForesightConsumerType(**Params.init_lifecycle)
-Lifecycle_Operatives_PF.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Operatives_PF.solve()
-Lifecycle_Operatives_PF.unpackcFunc()
-Lifecycle_Operatives_PF.timeFwd() #make sure that time is moving forward
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.015) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.015]*24 + [1.00]*15 + [0.7] + [1]*9     #Lifetime income growth for operatives with 1% slower income growth
+# In[23]:
 
-Lifecycle_Operatives_PF_Slow = Model.PerfForesightConsumerType(**Params.init_lifecycle)
-Lifecycle_Operatives_PF_Slow.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Operatives_PF_Slow.solve()
-Lifecycle_Operatives_PF_Slow.unpackcFunc()
-Lifecycle_Operatives_PF_Slow.timeFwd() #make sure that time is moving forward
 
+@pipeline.stage(sources=uses('perfect_foresight'), params=[Operatives_PF_params, Operatives_PF_Slow_params])
+def perfect_foresight_paths():
+    import pandas as pd
+    from bufferstock.perfect_foresight import solve_pf_spec
 
-# In[23]:
+    #Perfect foresight consumption functions are linear, so both models are solved in closed form
+    Lifecycle_Operatives_PF = solve_pf_spec(Operatives_PF_params)
+    Lifecycle_Operatives_PF_Slow = solve_pf_spec(Operatives_PF_Slow_params)
 
+    #Trace the models: with no uncertainty one agent's deterministic path is the whole simulation,
+    #starting from the assets and income at birth in each spec
+    Path_Operatives_PF = Lifecycle_Operatives_PF.simulate_path()
+    Path_Operatives_PF_Slow = Lifecycle_Operatives_PF_Slow.simulate_path()
 
-#Simulate the models
+    raw_data = {'T_age': Path_Operatives_PF['t_age'].flatten()+25,
+                'aNrmNow_Operatives': Path_Operatives_PF['aNrm'].flatten(),
+                'aNrmNow_Operatives_Slow': Path_Operatives_PF_Slow['aNrm'].flatten()}
 
-if do_simulation:
-    Lifecycle_Operatives_PF.T_sim = 49 
-    Lifecycle_Operatives_PF.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    Lifecycle_Operatives_PF.initializeSim()
-    Lifecycle_Operatives_PF.simulate()
+    #Make the simulated results into a dataset
 
-if do_simulation:
-    Lifecycle_Operatives_PF_Slow.T_sim = 49
-    Lifecycle_Operatives_PF_Slow.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    Lifecycle_Operatives_PF_Slow.initializeSim()
-    Lifecycle_Operatives_PF_Slow.simulate()
-    
-raw_data = {'T_age': Lifecycle_Operatives_PF.t_age_hist.flatten()+25,
-            'aNrmNow_Operatives': Lifecycle_Operatives_PF.aNrmNow_hist.flatten(),
-            'aNrmNow_Operatives_Slow': Lifecycle_Operatives_PF_Slow.aNrmNow_hist.flatten()}
+    Data = pd.DataFrame(raw_data) #make the raw data into a formal dataset
+    Data['W_Y_PF'] = Data.aNrmNow_Operatives
+    Data['W_Y_PF_Slow'] = Data.aNrmNow_Operatives_Slow
+    return Data
 
-#Make the simulated results into a dataset
 
-Data = pd.DataFrame(raw_data) #make the raw data into a formal dataset
-Data['W_Y_PF'] = Data.aNrmNow_Operatives
-Data['W_Y_PF_Slow'] = Data.aNrmNow_Operatives_Slow
+# In[24]:
 
 
-# In[24]:
+@pipeline.stage(requires=['perfect_foresight_paths'], outputs=['Paper/Figures/Figure6.png'])
+def Figure6(perfect_foresight_paths):
+    import matplotlib.pyplot as plt
 
+    Data = perfect_foresight_paths
 
-plt.figure()
+    plt.figure()
 
-plt.plot(Data.T_age, Data.W_Y_PF,label='Faster Productivity Growth')
-plt.plot(Data.T_age, Data.W_Y_PF_Slow,label='Slower Productivity Growth',linestyle='--')
+    plt.plot(Data.T_age, Data.W_Y_PF,label='Faster Productivity Growth')
+    plt.plot(Data.T_age, Data.W_Y_PF_Slow,label='Slower Productivity Growth',linestyle='--')
 
-plt.legend()
-plt.xlabel('Age')
-plt.ylabel('Wealth')
-plt.title('Figure VI: Standard Lifecycle Model')
-plt.savefig('Paper/Figures/Figure6.png')
+    plt.legend()
+    plt.xlabel('Age')
+    plt.ylabel('Wealth')
+    plt.title('Figure VI: Standard Lifecycle Model')
+    plt.savefig('Paper/Figures/Figure6.png')
 
 # In[25]:
 
@@ -795,84 +705,100 @@ plt.savefig('Paper/Figures/Figure6.png')
 
 #Parameter setup and solve
 
-Params.init_lifecycle["CRRA"]= 2.00            # Default coefficient of relative risk aversion (rho)
-Params.init_lifecycle["DiscFac"]= 0.96         # Default intertemporal discount factor (beta)
-Params.init_lifecycle["PermGroFacAgg"]= 1.02   # Aggregate permanent income growth factor 
-Params.init_lifecycle["aNrmInitMean"]= -1000   # Mean of log initial assets 
-Params.init_lifecycle["aNrmInitStd"]= 0.0      # Standard deviation of log initial assets
-Params.init_lifecycle["pLvlInitMean"]= 0.0     # Mean of log initial permanent income 
-Params.init_lifecycle["pLvlInitStd"]= 0.0      # Standard deviation of log initial permanent income
-Params.init_lifecycle["Rfree"]= 1.00           # Risk free interest rate set to default 0%
-
-Params.init_lifecycle['AgentCount'] = 10000    # Simulate 10000 agents
+slowdown_params = ParamSpec.from_dict(Params.init_lifecycle, cycles=1,
+    CRRA          = 2.00,    # Default coefficient of relative risk aversion (rho)
+    DiscFac       = 0.96,    # Default intertemporal discount factor (beta)
+    PermGroFacAgg = 1.02,    # Aggregate permanent income growth factor 
+    aNrmInitMean  = -1000,   # Mean of log initial assets 
+    aNrmInitStd   = 0.0,     # Standard deviation of log initial assets
+    pLvlInitMean  = 0.0,     # Mean of log initial permanent income 
+    pLvlInitStd   = 0.0,     # Standard deviation of log initial permanent income
+    Rfree         = 1.00,    # Risk free interest rate set to default 0%
+
+    AgentCount = 10000,      # Simulate 10000 agents
+
+    PermShkStd = [0.1]*40 + [0]*9,   # SD of permanent income shock
+    TranShkStd = [0.1]*40 + [0]*9,   # SD of transitory income shock
+    LivPrb     = [1]*49,     # No probability of death before terminal age
+    T_cycle    = 49,         # Life starts at age 26 and ends at 75
+    T_retire   = 40,         # Agents retire at age 65
+    T_age      = 50)         # Make sure that old people die at terminal age and don't turn into newborns!
+
+Operatives_Faster_params = slowdown_params.replace(
+    pLvlInitMean = math.log(1/1.025), #This is set as such to offset growth bug
+    PermGroFac   = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9)     #Lifetime income growth for operatives
+
+Operatives_Slower_params = slowdown_params.replace(
+    pLvlInitMean = math.log(1/1.015), #This is set as such to offset growth bug
+    PermGroFac   = [1.015]*24 + [1.0]*15 + [0.7] + [1]*9)     #Lifetime income growth for operatives with 1% lower labor income growth
+
+#Operatives has the same spec as in Figure 5, so its solved model is taken from there and only the
+#slower growth model is solved here
+@pipeline.stage(requires=['lifecycle_models'], sources=uses('parallel'), params=[Operatives_Faster_params, Operatives_Slower_params])
+def slowdown_models(lifecycle_models, processes=None):
+    from bufferstock.parallel import solve_specs
+    if Operatives_Faster_params == Operatives_params:
+        return [lifecycle_models[1], solve_specs([Operatives_Slower_params], processes=processes, cache=cache)[0]]
+    return solve_specs([Operatives_Faster_params, Operatives_Slower_params], processes=processes, cache=cache)
 
-Params.init_lifecycle['PermShkStd'] = [0.1]*40 + [0]*9   # SD of permanent income shock
-Params.init_lifecycle['TranShkStd'] = [0.1]*40 + [0]*9   # SD of transitory income shock
-Params.init_lifecycle['LivPrb']     = [1]*49   # No probability of death before terminal age
-Params.init_lifecycle['T_cycle']    = 49       # Life starts at age 26 and ends at 75
-Params.init_lifecycle['T_retire']   = 40       # Agents retire at age 65
-Params.init_lifecycle['T_age']      = 50       # Make sure that old people die at terminal age and don't turn into newborns!
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.025) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.025]*24 + [1.01]*15 + [0.7] + [1]*9     #Lifetime income growth for operatives
+# In[26]:
 
-Lifecycle_Operatives = Model.IndShockConsumerType(**Params.init_lifecycle)
-Lifecycle_Operatives.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Operatives.solve()
-Lifecycle_Operatives.unpackcFunc()
-Lifecycle_Operatives.timeFwd() #make sure that time is moving forward
 
-Params.init_lifecycle["pLvlInitMean"]= math.log(1/1.015) #This is set as such to offset growth bug
-Params.init_lifecycle['PermGroFac'] = [1.015]*24 + [1.0]*15 + [0.7] + [1]*9     #Lifetime income growth for operatives with 1% lower labor income growth
+@pipeline.stage(requires=['slowdown_models'], sources=uses('streaming', 'shock_bank', 'histogram'), params=do_simulation)
+def slowdown_simulation(slowdown_models):
+    from bufferstock.streaming import Quantile, simulate_streaming, stats_frame
+    from bufferstock.histogram import cohort_path
+    from bufferstock.counter import initialize_counter_sim
+    from bufferstock.shock_bank import bank_for
 
-Lifecycle_Operatives_Slower = Model.IndShockConsumerType(**Params.init_lifecycle)
-Lifecycle_Operatives_Slower.cycles = 1 #1 for finite horizon and 0 for infinite horizon
-Lifecycle_Operatives_Slower.solve()
-Lifecycle_Operatives_Slower.unpackcFunc()
-Lifecycle_Operatives_Slower.timeFwd() #make sure that time is moving forward
+    Lifecycle_Operatives, Lifecycle_Operatives_Slower = slowdown_models
 
+    if do_simulation:
+        #Both growth scenarios draw their shocks from one bank
+        for agent in slowdown_models:
+            agent.T_sim = 49
+        Shocks = bank_for(slowdown_models)
 
-# In[26]:
+    if do_simulation:
+        Lifecycle_Operatives.track_vars = [] #Only the median wealth of each age is needed
+        initialize_counter_sim(Lifecycle_Operatives, Shocks, np.arange(Lifecycle_Operatives.AgentCount))
+        Stats_Operatives = simulate_streaming(Lifecycle_Operatives,
+            {'W_Y_Faster': Quantile('aNrmNow', 0.5)}, draws=Shocks) #Named W_Y since it is wealth normalized by permanent income.
 
+    if do_simulation:
+        Lifecycle_Operatives_Slower.track_vars = []
+        initialize_counter_sim(Lifecycle_Operatives_Slower, Shocks, np.arange(Lifecycle_Operatives_Slower.AgentCount))
+        Stats_Operatives_Slower = simulate_streaming(Lifecycle_Operatives_Slower,
+            {'W_Y_Slower': Quantile('aNrmNow', 0.5)}, draws=Shocks)
 
-if do_simulation:
-    Lifecycle_Operatives.T_sim = 49
-    Lifecycle_Operatives.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    Lifecycle_Operatives.initializeSim()
-    Lifecycle_Operatives.simulate()
-    
-if do_simulation:
-    Lifecycle_Operatives_Slower.T_sim = 49
-    Lifecycle_Operatives_Slower.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    Lifecycle_Operatives_Slower.initializeSim()
-    Lifecycle_Operatives_Slower.simulate()
-    
-raw_data = {'T_age': Lifecycle_Operatives.t_age_hist.flatten()+25, 
-            'aNrmNow_Operatives': Lifecycle_Operatives.aNrmNow_hist.flatten(),
-            'aNrmNow_Operatives_Slower': Lifecycle_Operatives_Slower.aNrmNow_hist.flatten(),}
+    if not do_simulation:
+        Path_Operatives, Path_Operatives_Slower = cohort_path(Lifecycle_Operatives, 49), cohort_path(Lifecycle_Operatives_Slower, 49)
+        Stats_Operatives = {'W_Y_Faster': Path_Operatives.stat(Path_Operatives.quantile('aNrmNow', 0.5))}
+        Stats_Operatives_Slower = {'W_Y_Slower': Path_Operatives_Slower.stat(Path_Operatives_Slower.quantile('aNrmNow', 0.5))}
 
-#Make the simulated results into a dataset
+    return stats_frame([Stats_Operatives, Stats_Operatives_Slower], age_offset=25) #The median of each age
 
-Data = pd.DataFrame(raw_data) #make the raw data into a formal dataset
 
-Data['W_Y_Faster'] = Data.aNrmNow_Operatives #Data is named W_Y since it is wealth normalized by permanent income.
-Data['W_Y_Slower'] = Data.aNrmNow_Operatives_Slower
-AgeMeans = Data.groupby(['T_age']).median().reset_index() #Group the dataset by T_age and get the median.
+# In[27]:
 
 
-# In[27]:
+@pipeline.stage(requires=['slowdown_simulation'], outputs=['Paper/Figures/Figure7.png'])
+def Figure7(slowdown_simulation):
+    import matplotlib.pyplot as plt
 
+    AgeMeans = slowdown_simulation
 
-plt.figure()
+    plt.figure()
 
-plt.plot(AgeMeans.T_age, AgeMeans.W_Y_Faster,label='Faster Productivity Growth')
-plt.plot(AgeMeans.T_age, AgeMeans.W_Y_Slower, label='Slower Productivity Growth',linestyle='--')
+    plt.plot(AgeMeans.T_age, AgeMeans.W_Y_Faster,label='Faster Productivity Growth')
+    plt.plot(AgeMeans.T_age, AgeMeans.W_Y_Slower, label='Slower Productivity Growth',linestyle='--')
 
-plt.legend()
-plt.xlabel('Age')
-plt.ylabel('Wealth')
-plt.title('Figure VII: Buffer Stock Lifecycle Model')
-plt.savefig('Paper/Figures/Figure7.png')
+    plt.legend()
+    plt.xlabel('Age')
+    plt.ylabel('Wealth')
+    plt.title('Figure VII: Buffer Stock Lifecycle Model')
+    plt.savefig('Paper/Figures/Figure7.png')
 
 # #### 4) Variation of Parameter Values
 # 
@@ -885,239 +811,168 @@ plt.savefig('Paper/Figures/Figure7.png')
 
 #Some preliminary setup and parameter definitions
 
-import HARK.ConsumptionSaving.ConsumerParameters as Params 
-
-# Make a dictionary containing all parameters needed to solve the model
-base_params = Params.init_idiosyncratic_shocks
-
-# Set the parameters for the baseline results in the paper
-# using the variable values defined in the cell above
-base_params['PermGroFac'] = [1.02]  # Permanent income growth factor
-base_params['Rfree']      = 1       # Interest factor on assets
-base_params['DiscFac']    = 0.96    # Time Preference Factor
-base_params['CRRA']       = 2.00    # Coefficient of relative risk aversion
-base_params['UnempPrb']   = 0.005   # Probability of unemployment (e.g. Probability of Zero Income in the paper)
-base_params['IncUnemp']   = 0.0     # Induces natural borrowing constraint
-base_params['PermShkStd'] = [0.1]   # Standard deviation of log permanent income shocks
-base_params['TranShkStd'] = [0.1]   # Standard deviation of log transitory income shocks
-
-# Some technical settings that are not interesting for our purposes
-base_params['LivPrb']       = [1.0]   # 100 percent probability of living to next period
-base_params['CubicBool']    = True    # Use cubic spline interpolation
-base_params['T_cycle']      = 1       # No 'seasonal' cycles
-base_params['BoroCnstArt']  = None    # No artificial borrowing constraint
+# Make a spec containing all parameters needed to solve the model, without
+# modifying HARK's shared default dictionary
+table1_params = ParamSpec.from_dict(Params.init_idiosyncratic_shocks, cycles=0,
+    # Set the parameters for the baseline results in the paper
+    # using the variable values defined in the cell above
+    PermGroFac = [1.02],    # Permanent income growth factor
+    Rfree      = 1,         # Interest factor on assets
+    DiscFac    = 0.96,      # Time Preference Factor
+    CRRA       = 2.00,      # Coefficient of relative risk aversion
+    UnempPrb   = 0.005,     # Probability of unemployment (e.g. Probability of Zero Income in the paper)
+    IncUnemp   = 0.0,       # Induces natural borrowing constraint
+    PermShkStd = [0.1],     # Standard deviation of log permanent income shocks
+    TranShkStd = [0.1],     # Standard deviation of log transitory income shocks
+
+    # Some technical settings that are not interesting for our purposes
+    LivPrb      = [1.0],    # 100 percent probability of living to next period
+    CubicBool   = True,     # Use cubic spline interpolation
+    T_cycle     = 1,        # No 'seasonal' cycles
+    BoroCnstArt = None)     # No artificial borrowing constraint
 
 
 # In[29]:
 
 
-from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType
-
-#Base parameter model
-baseEx_inf = IndShockConsumerType(cycles=0,**base_params) #cycles=0 since we are solving for an infinite horizon consumer
-
-#Variant of the model with permanent income growth set as 1.04
-base_params['PermGroFac']=[1.04]
-baseEx_infg= IndShockConsumerType(cycles=0,**base_params)
-
-#Variant of the model with the discount factor set as 0.9
-base_params['PermGroFac']=[1.02]
-base_params['DiscFac'] = 0.9
-baseEx_infd= IndShockConsumerType(cycles=0,**base_params)
-
-#Solve for the three different models
-baseEx_inf.solve()
-baseEx_inf.unpackcFunc()
-
-baseEx_infg.solve()
-baseEx_infg.unpackcFunc()
-
-baseEx_infd.solve()
-baseEx_infd.unpackcFunc()
+#Base parameter model, the variant with permanent income growth set as 1.04 and
+#the variant with the discount factor set as 0.9, all solved at once
+@pipeline.stage(sources=uses('parallel'), params=table1_params)
+def table1_models(processes=None):
+    from bufferstock.parallel import solve_specs
+    return solve_specs(
+        [table1_params,                              #cycles=0 since we are solving for an infinite horizon consumer
+         table1_params.replace(PermGroFac = [1.04]),
+         table1_params.replace(DiscFac = 0.9)], processes=processes, cache=cache)
 
 
 # In[30]:
 
 
-#Simulate the three models
-
-if do_simulation:
-    baseEx_inf.T_sim = 100 #We simulate for 100 periods compared to 10 periods in the original paper since we do not control for initial saving ratio. It takes more periods to converge to the steady state.
-    baseEx_inf.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    baseEx_inf.initializeSim()
-    baseEx_inf.simulate()
-    
-if do_simulation:
-    baseEx_infg.T_sim = 100 #We simulate for 100 periods compared to 10 periods in the original paper since we do not control for initial saving ratio. It takes more periods to converge to the steady state.
-    baseEx_infg.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    baseEx_infg.initializeSim()
-    baseEx_infg.simulate()
-
-if do_simulation:
-    baseEx_infd.T_sim = 100 #We simulate for 100 periods compared to 10 periods in the original paper since we do not control for initial saving ratio. It takes more periods to converge to the steady state.
-    baseEx_infd.track_vars = ['aNrmNow','mNrmNow','cNrmNow','pLvlNow','t_age'] #track these variables
-    baseEx_infd.initializeSim()
-    baseEx_infd.simulate()
-
-
-# In[31]:
-
-
-#Save simulated data into a dataframe
-
-import pandas as pd
-raw_data = {'T_age': baseEx_inf.t_age_hist.flatten()+25,
-            'cNrm': baseEx_inf.cNrmNow_hist.flatten(),
-            'logcNrm': np.log(baseEx_inf.cNrmNow_hist.flatten()),
-            'pLvl': baseEx_inf.pLvlNow_hist.flatten(),
-            'logpLvl': np.log(baseEx_inf.pLvlNow_hist.flatten()),
-            'mNrm': baseEx_inf.mNrmNow_hist.flatten(),
-            'logmNrm': np.log(baseEx_inf.mNrmNow_hist.flatten()),
-            'aNrm': baseEx_inf.aNrmNow_hist.flatten(),    
-            'cNrmg': baseEx_infg.cNrmNow_hist.flatten(),
-            'logcNrmg': np.log(baseEx_infg.cNrmNow_hist.flatten()),
-            'pLvlg': baseEx_infg.pLvlNow_hist.flatten(),
-            'logpLvlg': np.log(baseEx_infg.pLvlNow_hist.flatten()),
-            'mNrmg': baseEx_infg.mNrmNow_hist.flatten(),
-            'logmNrmg': np.log(baseEx_infg.mNrmNow_hist.flatten()),
-            'aNrmg': baseEx_infg.aNrmNow_hist.flatten(),
-            'cNrmd': baseEx_infd.cNrmNow_hist.flatten(),
-            'logcNrmd': np.log(baseEx_infd.cNrmNow_hist.flatten()),
-            'pLvld': baseEx_infd.pLvlNow_hist.flatten(),
-            'logpLvld': np.log(baseEx_infd.pLvlNow_hist.flatten()),
-            'mNrmd': baseEx_infd.mNrmNow_hist.flatten(),
-            'logmNrmd': np.log(baseEx_infd.mNrmNow_hist.flatten()),
-            'aNrmd': baseEx_infd.aNrmNow_hist.flatten()}
-
-Data = pd.DataFrame(raw_data) #make the raw data into a formal dataset
-
-Data['Cons'] = Data.cNrm * Data.pLvl             #Consumption level
-Data['logCons'] = Data.logcNrm + Data.logpLvl    #log of consumption level
-Data['Consg'] = Data.cNrmg * Data.pLvlg          #Consumption level for g=1.04 model
-Data['logConsg'] = Data.logcNrmg + Data.logpLvlg #log of consumption level for g=1.04 model
-Data['Consd'] = Data.cNrmd * Data.pLvld          #Consumption level for discount factor=0.9 model
-Data['logConsd'] = Data.logcNrmd + Data.logpLvld #log of consumption level for discount factor=0.9 model
-
-Data['m'] = Data.mNrm * Data.pLvl                #Wealth level
-Data['logm'] = Data.logmNrm                      #log of wealth level
-Data['mg'] = Data.mNrmg * Data.pLvlg             #wealth level for g=1.04 model
-Data['logmg'] = Data.logmNrmg                    #log of wealth for g=1.04 model
-Data['md'] = Data.mNrmd * Data.pLvld             #wealth level for discount factor=0.9 model
-Data['logmd'] = Data.logmNrmd                    #log of wealth for discount factor=0.9 model
-
-Data['a'] = Data.aNrm * Data.pLvl                #end of period asset level
-Data['ag'] = Data.aNrmg * Data.pLvlg             #end of period asset level for g=1.04 model
-Data['ad'] = Data.aNrmd * Data.pLvld             #end of period asset level for discount factor=0.9 model
-
-Data['Inc'] = Data.pLvl                          #permanent income level
-Data['logInc'] = Data.logpLvl                    #log of permanent income
-Data['Incg'] = Data.pLvlg                        #permanent income level for g=1.04 model
-Data['logIncg'] = Data.logpLvlg                  #log of permanent income for g=1.04 model
-Data['Incd'] = Data.pLvld                        #permanent income level for discount factor=0.9 model
-Data['logIncd'] = Data.logpLvld                  #log of permanent income for discount factor=0.9 model
-
-AgeMeans = Data.groupby(['T_age']).mean().reset_index() # Group the dataset by T_age and get the mean.
-
-
-# In[32]:
-
-
-#Create Table1
-
-table1 = np.zeros((3,7))
-
-#Base Model
-#Growth rate of aggregate consumption
-table1[0,0] = math.log(AgeMeans.Cons[99]) - math.log(AgeMeans.Cons[98])
-
-#Average growth rate of household permanent income
-table1[0,1]=AgeMeans.logpLvl[99]-AgeMeans.logpLvl[98]
-
-#Average growth rate of household consumption
-table1[0,2]=AgeMeans.logCons[99]-AgeMeans.logCons[98]
-
-#Aggregate personal saving rate
-table1[0,3]=1-(AgeMeans.Cons[99]/(AgeMeans.m[99]-AgeMeans.a[98]))
-
-#Average MPC out of wealth
-table1[0,4]=(baseEx_inf.cFunc[0](AgeMeans.mNrm[99]+0.00001) - baseEx_inf.cFunc[0](AgeMeans.mNrm[99]))/0.00001
-
-#Average Net wealth
-table1[0,5]=(AgeMeans.mNrm[99] - AgeMeans.cNrm[99])
-
-#Target net wealth
-table1[0,6]=baseEx_inf.solution[0].mNrmSS - baseEx_inf.cFunc[0](baseEx_inf.solution[0].mNrmSS)
-
-
-# In[33]:
-
-
-#g=1.04 Model
-
-#Growth rate of aggregate consumption
-table1[1,0]=math.log(AgeMeans.Consg[99]) - math.log(AgeMeans.Consg[98])
-
-#Average growth rate of household permanent income
-table1[1,1]=AgeMeans.logpLvlg[99]-AgeMeans.logpLvlg[98]
+#Simulate the three models, accumulating the per-age means that Table 1 uses as the simulation runs
+
+@pipeline.stage(requires=['table1_models'], sources=uses('streaming', 'sampling', 'ergodic', 'histogram', 'sweep'),
+                params=[do_simulation, sampling_method, replications])
+def table1_simulation(table1_models):
+    from bufferstock.streaming import stats_frame
+    from bufferstock.ergodic import start_from_ergodic, simulate_until_stable
+    from bufferstock.histogram import stationary_path
+    from bufferstock.sweep import table1_path_stats, table1_reducers
+    from bufferstock.counter import initialize_counter_sim
+    from bufferstock.sampling import comparison_draws, combine_replications
+
+    baseEx_inf, baseEx_infg, baseEx_infd = table1_models
+
+    if do_simulation:
+        # Rather than starting everyone with (almost) no assets and burning in 100 periods, draw the
+        # initial assets from each model's approximate ergodic distribution and simulate until the
+        # mean normalized m and c of every model stop changing; T_sim = 100 is kept as an upper bound.
+        # The three models draw their shocks from one source, so their moments differ by the model alone.
+        for agent in table1_models:
+            agent.T_sim = 100
+        Replications = []
+        T_stable = None
+        for replication in range(replications):
+            Shocks = comparison_draws(table1_models, sampling_method, seed=replication)
+            for agent in table1_models:
+                agent.track_vars = [] #No full histories are kept
+                initialize_counter_sim(agent, Shocks, np.arange(agent.AgentCount))
+                start_from_ergodic(agent, seed=agent.seed + replication)
+            Stats_inf, Stats_infg, Stats_infd = table1_reducers(), table1_reducers('g'), table1_reducers('d') #g=1.04 model, d=discount factor 0.9 model
+            if T_stable is None:
+                T_stable = simulate_until_stable(table1_models, [Stats_inf, Stats_infg, Stats_infd], draws=Shocks)
+                if T_stable < baseEx_inf.T_sim:
+                    print('Table 1 simulation: means stable after {} periods'.format(T_stable))
+                else:
+                    print('Table 1 simulation: means still drifting after {} periods'.format(T_stable))
+            else:
+                #Later replications run as long as the first, so that they compare the same two periods
+                simulate_until_stable(table1_models, [Stats_inf, Stats_infg, Stats_infd], draws=Shocks,
+                                      min_periods=T_stable, max_periods=T_stable)
+            Replications.append(stats_frame([Stats_inf, Stats_infg, Stats_infd], age_offset=25))
+    else:
+        #Two periods of each model's stationary cross-section, exact up to the grid
+        Stats_inf, Stats_infg, Stats_infd = [table1_path_stats(stationary_path(agent, 2), suffix) for agent, suffix in
+            [(baseEx_inf, ''), (baseEx_infg, 'g'), (baseEx_infd, 'd')]]
+        Replications = [stats_frame([Stats_inf, Stats_infg, Stats_infd], age_offset=25)]
 
-#Average growth rate of household consumption
-table1[1,2]=AgeMeans.logConsg[99]-AgeMeans.logConsg[98]
+    #Collect the per-age means into a dataframe, averaged over the replications; Table 1 compares its last
+    #two rows. The replications themselves are kept for the standard errors of the table.
+    return combine_replications(Replications)[0], Replications
 
-#Aggregate personal saving rate
-table1[1,3]=1-(AgeMeans.Consg[99]/(AgeMeans.mg[99]-AgeMeans.ag[98]))
 
-#Average MPC out of wealth
-table1[1,4]=(baseEx_infg.cFunc[0](AgeMeans.mNrmg[99]+0.00001) - baseEx_infg.cFunc[0](AgeMeans.mNrmg[99]))/0.00001
+# In[32]:
 
-#Average Net wealth
-table1[1,5]=(AgeMeans.mNrmg[99] - AgeMeans.cNrmg[99])
 
-#Target net wealth
-table1[1,6]=baseEx_infg.solution[0].mNrmSS - baseEx_infg.cFunc[0](baseEx_infg.solution[0].mNrmSS)
+#Create Table1: the same seven moments of each model, from the means of the last two periods
 
+@pipeline.stage(requires=['table1_models', 'table1_simulation'], sources=uses('sweep'),
+                outputs=['Paper/Tables/table1.tex'] + (['Paper/Tables/table1_se.csv'] if do_simulation and replications > 1 else []))
+def table1(table1_models, table1_simulation):
+    import pandas as pd
+    from tabulate import tabulate
+    from bufferstock.sweep import MEANS as TABLE1_MEANS, table1_row
 
-# In[34]:
+    AgeMeans, Replications = table1_simulation
 
+    def moments(AgeMeans):
+        table1 = np.zeros((3,7))
+        for row, (agent, suffix) in enumerate(zip(table1_models, ['', 'g', 'd'])):
+            table1[row] = table1_row(dict((name, AgeMeans[name+suffix].values) for name in TABLE1_MEANS), agent)
+        return table1
 
-#Discount Factor=0.9 Model
+    # Data frame of the results we calculated
+    table = pd.DataFrame(moments(AgeMeans))
+    table.columns = ['Agg Cons Growth Rate', 'Perm Inc Av Growth Rate', 'Cons Av Growth Rate', 'Agg Saving Rate', 'Av MPC','Av Net Wealth','Target Net Wealth'] # add names for columns
+    table.index = ['Base Model','g = .04','DiscFac = .90']
 
-#Growth rate of aggregate consumption
-table1[2,0] = math.log(AgeMeans.Consd[99]) - math.log(AgeMeans.Consd[98])
+    #create tabular version of the dataframe and export it
+    headers = ['Agg Cons Growth Rate', 'Perm Inc Av Growth Rate', 'Cons Av Growth Rate', 'Agg Saving Rate', 'Av MPC','Av Net Wealth','Target Net Wealth']
+    tab1 = tabulate(table,headers, tablefmt='latex')
+    with open('Paper/Tables/table1.tex','w') as table_1:
+        table_1.write(tab1)
 
-#Average growth rate of household permanent income
-table1[2,1]=AgeMeans.logpLvld[99]-AgeMeans.logpLvld[98]
+    #Standard errors of the moments, from their spread over the independent replications of the simulation
+    if len(Replications) > 1:
+        se = table.copy()
+        se[:] = np.std([moments(frame) for frame in Replications], axis=0, ddof=1) / np.sqrt(len(Replications))
+        se.to_csv('Paper/Tables/table1_se.csv')
+    return table
 
-#Average growth rate of household consumption
-table1[2,2]=AgeMeans.logConsd[99]-AgeMeans.logConsd[98]
 
-#Aggregate personal saving rate
-table1[2,3]=1-(AgeMeans.Consd[99]/(AgeMeans.md[99]-AgeMeans.ad[98]))
+# In[ ]:
 
-#Average MPC out of wealth
-table1[2,4]=(baseEx_infd.cFunc[0](AgeMeans.mNrmd[99]+0.00001) - baseEx_infd.cFunc[0](AgeMeans.mNrmd[99]))/0.00001
 
-#Average Net wealth
-table1[2,5]=(AgeMeans.mNrmd[99] - AgeMeans.cNrmd[99])
+#The same moments over a grid of parameters around the base model, one row per combination in a CSV
+#table; rerunning skips the combinations already in the table, so a long sweep can be resumed.
+#This stage only runs when asked for by name: python Carroll_1997_RemARK.py --only table1_sweep
 
-#Target net wealth
-table1[2,6]=baseEx_infd.solution[0].mNrmSS - baseEx_infd.cFunc[0](baseEx_infd.solution[0].mNrmSS)
+@pipeline.stage(sources=uses('sweep'), params=table1_params, outputs=['Paper/Tables/table1_sweep.csv'], default=False)
+def table1_sweep(processes=None):
+    from bufferstock.sweep import run_sweep
+    return run_sweep(table1_params,
+                     {'PermGroFac': [1.0, 1.02, 1.04],
+                      'DiscFac': [0.90, 0.93, 0.96],
+                      'CRRA': [1.5, 2.0, 3.0],
+                      'UnempPrb': [0.0, 0.005, 0.05]},
+                     path='Paper/Tables/table1_sweep.csv', processes=processes, cache=cache)
 
 
-# In[35]:
+# In[ ]:
 
 
-# Data frame of the results we calculated
-table = pd.DataFrame(table1)
-table.columns = ['Agg Cons Growth Rate', 'Perm Inc Av Growth Rate', 'Cons Av Growth Rate', 'Agg Saving Rate', 'Av MPC','Av Net Wealth','Target Net Wealth'] # add names for columns
-table.index = ['Base Model','g = .04','DiscFac = .90']
-table
+#Derivatives of the target wealth and the Table 1 moments of the base model with respect to each
+#parameter, from the base model and a small step either side in every parameter, all solved together.
+#Nothing in the paper uses them, so this stage only runs when asked for by name:
+#python Carroll_1997_RemARK.py --only sensitivity
 
-#create tabular version of the dataframe and export it
-from tabulate import tabulate
-headers = ['Agg Cons Growth Rate', 'Perm Inc Av Growth Rate', 'Cons Av Growth Rate', 'Agg Saving Rate', 'Av MPC','Av Net Wealth','Target Net Wealth']
-tab1 = tabulate(table,headers, tablefmt='latex')
-table_1 = open('Paper/Tables/table1.tex','w')
-table_1.write(tab1)
+@pipeline.stage(name='sensitivity', sources=uses('sensitivity'), params=table1_params,
+                outputs=['Paper/Tables/sensitivity.csv'], default=False)
+def base_sensitivity():
+    from bufferstock.sensitivity import sensitivity
+    base_sensitivity = sensitivity(table1_params)
+    base_sensitivity.frame().to_csv('Paper/Tables/sensitivity.csv')
+    return base_sensitivity
 
 # In[36]:
 
@@ -1126,113 +981,130 @@ table_1.write(tab1)
 
 # Preliminary setup and parameter definitions
 
-# Import default parameter values
-import HARK.ConsumptionSaving.ConsumerParameters as Params 
-
-# Make a dictionary containing all parameters needed to solve the model
-base_params = Params.init_idiosyncratic_shocks
-
-# Set the parameters for the baseline results in the paper
-# using the variable values defined in the cell above
-base_params['PermGroFac'] = [1.02]    # Permanent income growth factor
-base_params['Rfree']      = 1.04      # Interest factor on assets
-base_params['DiscFac']    = 0.96      # Time Preference Factor
-base_params['CRRA']       = 2.00      # Coefficient of relative risk aversion
-base_params['UnempPrb']   = 0.005     # Probability of unemployment (e.g. Probability of Zero Income in the paper)
-base_params['IncUnemp']   = 0.0       # Induces natural borrowing constraint
-base_params['PermShkStd'] = [0.1]     # Standard deviation of log permanent income shocks
-base_params['TranShkStd'] = [0.1]     # Standard deviation of log transitory income shocks
-
-# Some technical settings that are not interesting for our purposes
-base_params['LivPrb']       = [1.0]   # 100 percent probability of living to next period
-base_params['CubicBool']    = True    # Use cubic spline interpolation
-base_params['T_cycle']      = 1       # No 'seasonal' cycles
-base_params['BoroCnstArt']  = None    # No artificial borrowing constraint
+# Make a spec containing all parameters needed to solve the model, without
+# modifying HARK's shared default dictionary
+table2_params = ParamSpec.from_dict(Params.init_idiosyncratic_shocks, cycles=0,
+    # Set the parameters for the baseline results in the paper
+    # using the variable values defined in the cell above
+    PermGroFac = [1.02],    # Permanent income growth factor
+    Rfree      = 1.04,      # Interest factor on assets
+    DiscFac    = 0.96,      # Time Preference Factor
+    CRRA       = 2.00,      # Coefficient of relative risk aversion
+    UnempPrb   = 0.005,     # Probability of unemployment (e.g. Probability of Zero Income in the paper)
+    IncUnemp   = 0.0,       # Induces natural borrowing constraint
+    PermShkStd = [0.1],     # Standard deviation of log permanent income shocks
+    TranShkStd = [0.1],     # Standard deviation of log transitory income shocks
+
+    # Some technical settings that are not interesting for our purposes
+    LivPrb      = [1.0],    # 100 percent probability of living to next period
+    CubicBool   = True,     # Use cubic spline interpolation
+    T_cycle     = 1,        # No 'seasonal' cycles
+    BoroCnstArt = None)     # No artificial borrowing constraint
 
 
 # In[37]:
 
 
-from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType
-
-#Base Model
-baseEx_inf = IndShockConsumerType(cycles=0,**base_params) # Infinite Horizon model
-
-#Model with higher growth rate
-base_params['PermGroFac']=[1.03]
-baseEx_infg = IndShockConsumerType(cycles=0,**base_params)
-
-baseEx_inf.solve()
-baseEx_inf.unpackcFunc()
-
-baseEx_infg.solve()
-baseEx_infg.unpackcFunc()
+#Base Model (infinite horizon) and the model with a higher growth rate
+@pipeline.stage(sources=uses('parallel'), params=table2_params)
+def table2_models(processes=None):
+    from bufferstock.parallel import solve_specs
+    return solve_specs([table2_params, table2_params.replace(PermGroFac = [1.03])], processes=processes, cache=cache)
 
 
 # In[38]:
 
 
-import math
-from scipy.optimize import fsolve
-
-Rfree = 1.04 #Set Rfree to be equal to the risk free interest rate set in parameters
-table2 = np.zeros((7,8))
-DeltaHW = (1/(1 - 1.03/Rfree)) - (1/(1 - 1.02/Rfree)) #Human wealth difference between two growth rates
-
-for i in range(8):
-    table2[i-1,0] = 0.4*i                                  #Different Gross wealth ratios
-    table2[i-1,4] = baseEx_inf.cFunc[0](0.4*i)             #consumption under 2% permanent income growth rate
-    table2[i-1,5] = baseEx_infg.cFunc[0](0.4*i)            #consumption under 3% permanent income growth rate
-    table2[i-1,6] = (table2[i-1,5]-table2[i-1,4])/DeltaHW  #MPC out of human wealth
-    def func(x):
-        return table2[i-1,5]-table2[i-1,4]-(1-(x**(-1)*((x*DiscFac)**(1/CRRA))))*((1/(1-(1.03/x)))-(1/(1-(1.02/x))))
-    table2[i-1,7] = fsolve(func, 1.1) -1                   #Implied discount rate of future income
-
-
-# In[39]:
-
-
-from HARK.ConsumptionSaving.ConsIndShockModel import PerfForesightConsumerType
-
-base_params['PermGroFac']=[1.02] #Set to original value
-baseEx_inf_PF = PerfForesightConsumerType(cycles=0,**base_params) #Infinite horizon perfect foresight consumer
-
-base_params['PermGroFac']=[1.03]
-baseEx_inf_PFg = PerfForesightConsumerType(cycles=0,**base_params)
+@pipeline.stage(requires=['table2_models'], sources=uses('implied_rate', 'perfect_foresight'), params=dict(spec=table2_params, DiscFac=DiscFac, CRRA=CRRA),
+                outputs=['Paper/Tables/table2.tex'])
+def table2(table2_models):
+    import pandas as pd
+    from tabulate import tabulate
+    from bufferstock.implied_rate import consumption_on_grid, implied_discount_rate
+    from bufferstock.perfect_foresight import solve_pf_spec
 
-baseEx_inf_PF.solve()
-baseEx_inf_PF.unpackcFunc()
+    baseEx_inf, baseEx_infg = table2_models
 
-baseEx_inf_PFg.solve()
-baseEx_inf_PFg.unpackcFunc()
+    Rfree = 1.04 #Set Rfree to be equal to the risk free interest rate set in parameters
+    Wealth = 0.4*np.arange(1, 8) #Different Gross wealth ratios, 0.4 to 2.8; any grid (e.g. thousands of points) works the same way
+    table2 = np.zeros((Wealth.size, 8))
+    DeltaHW = (1/(1 - 1.03/Rfree)) - (1/(1 - 1.02/Rfree)) #Human wealth difference between two growth rates
 
+    table2[:,0] = Wealth
+    table2[:,4], table2[:,5] = consumption_on_grid([baseEx_inf, baseEx_infg], Wealth) #consumption under 2% and 3% permanent income growth rates
+    table2[:,6] = (table2[:,5]-table2[:,4])/DeltaHW  #MPC out of human wealth
+    #Implied discount rate of future income: the interest rate at which a perfect foresight consumer's
+    #consumption responds to the higher growth rate as much as the buffer stock consumer's does
+    table2[:,7] = implied_discount_rate(table2[:,5]-table2[:,4], DiscFac, CRRA, PermGroFac=(1.02, 1.03))
 
-# In[40]:
+    PF_base_params = table2_params.replace(agent_type='PerfForesightConsumerType')
+    #Infinite horizon perfect foresight consumers with 2% and 3% income growth, using the closed form c = kappa*(m + h)
+    baseEx_inf_PF = solve_pf_spec(PF_base_params)
+    baseEx_inf_PFg = solve_pf_spec(PF_base_params.replace(PermGroFac = [1.03]))
 
+    table2[:,1] = baseEx_inf_PF.cFunc(Wealth)[0]            #Consumption in certainty model when permanent income growth rate is 2%
+    table2[:,2] = baseEx_inf_PFg.cFunc(Wealth)[0]           #Consumption in certainty model when permanent income growth rate is 3%
+    table2[:,3] = (table2[:,2] - table2[:,1])/DeltaHW       #MPC out of human wealth in certainty model
 
-for i in range(8):
-    table2[i-1,1] = baseEx_inf_PF.cFunc[0](0.4*i)            #Consumption in certainty model when permanent income growth rate is 2%
-    table2[i-1,2] = baseEx_inf_PFg.cFunc[0](0.4*i)           #Consumption in certainty model when permanent income growth rate is 3%
-    table2[i-1,3] = (table2[i-1,2] - table2[i-1,1])/DeltaHW  #MPC out of human wealth in certainty model
+    # Data frame of the results we calculated
 
+    table = pd.DataFrame(table2)
+    table.columns = ['Wealth', 'PF Consumption g=2%', 'PF Consumption g=3%', 'PF MPC out of human wealth','BS Consumption g=2%', 'BS Consumption g=3%', 'BS MPC out of human wealth', 'BS Implied Discount Rate of Future Income'] # add names for columns
+    table.index = ['']*len(table2)
 
-# In[41]:
-
-
-# Data frame of the results we calculated
-
-table = pd.DataFrame(table2)
-table.columns = ['Wealth', 'PF Consumption g=2%', 'PF Consumption g=3%', 'PF MPC out of human wealth','BS Consumption g=2%', 'BS Consumption g=3%', 'BS MPC out of human wealth', 'BS Implied Discount Rate of Future Income'] # add names for columns
-table.index =['','','','','','','']
-table
-
-#create tabular version of the dataframe and export it
-from tabulate import tabulate
-headers = ['Wealth', 'PF Consumption g=2%', 'PF Consumption g=3%', 'PF MPC out of human wealth','BS Consumption g=2%', 'BS Consumption g=3%', 'BS MPC out of human wealth', 'BS Implied Discount Rate of Future Income'] # add names for columns
-tab2 = tabulate(table,headers, tablefmt='latex')
-table_2 = open('Paper/Tables/table2.tex','w')
-table_2.write(tab2)
+    #create tabular version of the dataframe and export it
+    headers = ['Wealth', 'PF Consumption g=2%', 'PF Consumption g=3%', 'PF MPC out of human wealth','BS Consumption g=2%', 'BS Consumption g=3%', 'BS MPC out of human wealth', 'BS Implied Discount Rate of Future Income'] # add names for columns
+    tab2 = tabulate(table,headers, tablefmt='latex')
+    with open('Paper/Tables/table2.tex','w') as table_2:
+        table_2.write(tab2)
+    return table
 
 # ### Conclusion 
 # 
 # This paper argues that the buffer-stock version of the LC/PIH model is closer both to the behaviour of the typical household and to Friedman's original conception of the Permanent Income Hypothesis model. It can explain why consumption tracks income closely when aggregated by groups or in whole economies, but is often sharply different from income at the level of individual households. The model is consistent having higher MPC out of transitory income without imposing liquidity constraints. Further, it provides an explanation for why median household wealth/income ratios have remained roughly stable despite a sharp slowdown in expected income growth. 
+
+
+# In[ ]:
+
+
+#Typeset the paper and the slides once the figures and tables are up to date (as doEverything.sh does)
+
+import subprocess
+
+@pipeline.stage(requires=['Figure1a', 'Figure1b', 'Figure5', 'Figure6', 'Figure7', 'table1', 'table2'],
+                sources=['Paper/main.tex', 'Paper/*/*.tex', 'Paper/Figures/*.png', 'Paper/References/*.bib'],
+                outputs=['Paper/main.pdf'], default=False)
+def paper(**figures_and_tables):
+    subprocess.check_call(['xelatex', 'main.tex'], cwd='Paper') #creates the main paper and aux file
+    subprocess.check_call(['bibtex', 'main.aux'], cwd='Paper')  #run bibtex to run aux to create bbl file
+    subprocess.check_call(['xelatex', 'main.tex'], cwd='Paper') #rerun latex with the bbl file
+
+@pipeline.stage(sources=['Slides/Slides.tex', 'Slides/Slides.bib', 'Slides/make_slides.sh'],
+                outputs=['Slides/Slides.pdf'], default=False)
+def slides():
+    subprocess.check_call(['sh', 'make_slides.sh'], cwd='Slides')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Make the figures and tables of the REMARK, rerunning only the stages '
+                                                 'that are out of date.')
+    parser.add_argument('--only', nargs='+', metavar='STAGE',
+                        help='bring just these stages (and the stages they need) up to date, e.g. --only table2 Figure7; '
+                             'by default every figure and table')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE',
+                        help='rerun these stages even if they are up to date (and run them if they are not otherwise needed)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='number of stages that may run at once, sharing the cores between them (default: the number of cores)')
+    parser.add_argument('--list', action='store_true',
+                        help='list the stages and whether each is up to date, then stop')
+    args = parser.parse_args()
+    unknown = [name for name in (args.only or []) + args.force if name not in pipeline.stages]
+    if unknown:
+        parser.error('no stage named {}; the stages are {}'.format(', '.join(unknown), ', '.join(pipeline.order)))
+    if args.list:
+        for name, reason in pipeline.status(args.only or pipeline.order).items():
+            print('{:24s}{}'.format(name, reason or 'up to date'))
+    else:
+        # Stages that do not depend on each other run side by side
+        pipeline.run(args.only, jobs=args.jobs, force=args.force)
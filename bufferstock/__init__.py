@@ -0,0 +1,10 @@
+'''
+Helpers for solving, simulating and tabulating the buffer-stock models used in
+Carroll_1997_RemARK.py.
+'''
+import time
+
+# HARK 0.10 does `from time import clock`, which Python 3.8 removed; every
+# module here that imports HARK is imported through this package first
+if not hasattr(time, 'clock'):
+    time.clock = time.perf_counter
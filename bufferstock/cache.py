@@ -0,0 +1,225 @@
+'''
+A persistent, content-addressed cache of solved consumer types.
+
+Each entry is keyed on the solution-relevant hash of a ParamSpec, plus the HARK
+version and a hash of the bufferstock solver code that produced it, and holds
+the per-period solution list together with the consumption function knots and
+steady state market resources.  Single periods of finite horizon solutions are
+stored as well, under their chained period keys, so lifecycle models that
+share their last periods with one solved in an earlier run only solve the
+periods before the first difference.  Entries are evicted least-recently-used first
+once the cache grows past its size cap.
+'''
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+# Default location of the cache, relative to the directory the script is run from
+DEFAULT_CACHE_DIR = '.solution_cache'
+
+# Modules whose code produces the cached entries: a change to any of them gives
+# every entry a new name, so solutions of the old code are never loaded again
+SOLVER_MODULES = ('solve.py', 'parallel.py', 'steady_state.py', 'stack.py', 'utilities.py')
+
+_SOLVER_DIGEST = None
+
+
+def solver_digest():
+    '''
+    Hash of the source of SOLVER_MODULES (read once per process).
+    '''
+    global _SOLVER_DIGEST
+    if _SOLVER_DIGEST is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in SOLVER_MODULES:
+            with open(os.path.join(here, name), 'rb') as f:
+                h.update(name.encode('utf-8'))
+                h.update(f.read())
+        _SOLVER_DIGEST = h.hexdigest()
+    return _SOLVER_DIGEST
+
+
+def cFunc_knots(cFunc):
+    '''
+    Find the interpolation nodes of a (possibly lower-enveloped) HARK consumption
+    function.
+    Inputs:
+       cFunc: a HARK interpolator
+    Returns:
+       knots: tuple of arrays (m, c) or None if cFunc has no nodes
+    '''
+    if hasattr(cFunc, 'x_list') and hasattr(cFunc, 'y_list'):
+        return (cFunc.x_list, cFunc.y_list)
+    for func in getattr(cFunc, 'functions', []):
+        knots = cFunc_knots(func)
+        if knots is not None:
+            return knots
+    return None
+
+
+class SolutionCache(object):
+    '''
+    On-disk LRU cache of solved models.
+    Inputs:
+       directory:   where cache entries are stored
+       max_bytes:   total size the cache may grow to before old entries are evicted
+       max_entries: optional cap on the number of entries
+    '''
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=512 * 2**20, max_entries=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _tag(self):
+        # Imported here rather than at the top so that making a cache does not load HARK
+        import HARK
+        version = HARK.__version__ if hasattr(HARK, '__version__') else 'unknown'
+        return '{}-{}'.format(version, solver_digest()[:12])
+
+    def path(self, spec):
+        '''
+        File name of the entry for a spec.
+        '''
+        return os.path.join(self.directory, '{}-{}.pkl'.format(spec.solution_key[:32], self._tag()))
+
+    def period_path(self, key):
+        '''
+        File name of the entry for one period of a finite horizon solution,
+        identified by its chained period key (see solve.period_key).
+        '''
+        return os.path.join(self.directory, 'period-{}-{}.pkl'.format(key[:32], self._tag()))
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def _store(self, path, entry):
+        # Write to a temporary file first so that readers never see half an entry
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get(self, spec):
+        '''
+        Load a cached entry, or return None on a miss.  A hit refreshes the
+        entry's position in the LRU order.
+        '''
+        return self._load(self.path(spec))
+
+    def put(self, spec, agent):
+        '''
+        Store the solution of a solved agent, then evict old entries if the
+        cache is over its limits.
+        '''
+        entry = {'agent_type': spec.agent_type,
+                 'cycles': spec.cycles,
+                 'solution': agent.solution,
+                 'cFunc_knots': [cFunc_knots(solution_t.cFunc) for solution_t in agent.solution],
+                 'mNrmSS': [getattr(solution_t, 'mNrmSS', None) for solution_t in agent.solution],
+                 'aNrmSS': [getattr(solution_t, 'aNrmSS', None) for solution_t in agent.solution],
+                 'mGrowthSlopeSS': [getattr(solution_t, 'mGrowthSlopeSS', None) for solution_t in agent.solution]}
+        self._store(self.path(spec), entry)
+        return entry
+
+    def get_period(self, key):
+        '''
+        Load the one period solution stored under a period key, or None.
+        '''
+        return self._load(self.period_path(key))
+
+    def put_period(self, key, solution_t):
+        '''
+        Store a one period solution under its period key.
+        '''
+        self._store(self.period_path(key), solution_t)
+
+    def entries(self):
+        '''
+        List (last used time, size, path) of every entry, oldest first.
+        '''
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Evicted by another process since the listing
+                    continue
+                found.append((stat.st_mtime, stat.st_size, path))
+        return sorted(found)
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache is within its limits.
+        '''
+        found = self.entries()
+        total = sum(size for _, size, _ in found)
+        while found and (total > self.max_bytes or
+                         (self.max_entries is not None and len(found) > self.max_entries)):
+            _, size, path = found.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        '''
+        Remove every entry from the cache.
+        '''
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+class PeriodMemo(object):
+    '''
+    In-memory LRU store of one period solutions of finite horizon models, keyed
+    on a hash of that period's solver inputs and of every later period.  Two
+    lifecycle models whose last periods are identical share those solutions.
+    Inputs:
+       max_entries: number of one period solutions to keep
+    '''
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.store = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''
+        Return the solution stored under key, or None on a miss.
+        '''
+        solution = self.store.get(key)
+        if solution is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.store.move_to_end(key)
+        return solution
+
+    def put(self, key, solution):
+        self.store[key] = solution
+        self.store.move_to_end(key)
+        while len(self.store) > self.max_entries:
+            self.store.popitem(last=False)
+
+    def clear(self):
+        self.store.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,157 @@
+'''
+Counter-based random numbers, and the simulation step that draws from them.
+
+HARK draws every shock from one sequential RandomState, so a simulation cannot
+be split, nor two scenarios given the same shocks, without changing its
+results.  Here each random number is instead a function of (seed, stream,
+period, agent id), taken from a counter-based Philox generator whose counter
+is the agent id, so an agent draws the same shocks however the population is
+split up.  counter_sim_one_period() is AgentType.simOnePeriod with its death,
+birth and income draws taken from such a source: a CounterDraws, a
+shock_bank.ShockBank or the variance-reduced draws of sampling.make_draws.
+'''
+import numpy as np
+from scipy.special import ndtri
+
+from .history import initialize_sim
+
+# Streams of random numbers, so that different uses of one (period, agent) never collide
+DEATH_STREAM = 1
+BIRTH_STREAM = 2
+INCOME_STREAM = 3
+
+
+def counter_uniforms(seed, stream, period, agent_ids):
+    '''
+    Uniform draws in (0, 1) that depend only on (seed, stream, period, agent id).
+    Inputs:
+       seed, stream, period: non-negative integers
+       agent_ids:            sorted integer array of agent ids
+    Returns:
+       u: array (len(agent_ids), 4) of four independent uniforms per agent
+    '''
+    agent_ids = np.asarray(agent_ids, dtype=np.int64)
+    if agent_ids.size == 0:
+        return np.zeros((0, 4))
+    lo = agent_ids[0]
+    n = agent_ids[-1] - lo + 1
+    # Philox4x64 gives four 64 bit words per counter value, and the first
+    # counter word is the agent id
+    bitgen = np.random.Philox(key=np.array([seed, stream], dtype=np.uint64),
+                              counter=np.array([lo, period, 0, 0], dtype=np.uint64))
+    raw = bitgen.random_raw(4 * n).reshape(n, 4)[agent_ids - lo]
+    return ((raw >> np.uint64(11)).astype(float) + 0.5) * 2. ** -53
+
+
+class CounterDraws(object):
+    '''
+    Random numbers computed on demand from the counter-based generator.
+    Inputs:
+       seed: key of the random numbers
+    '''
+    def __init__(self, seed):
+        self.seed = seed
+
+    def uniforms(self, stream, period, agent_ids):
+        return counter_uniforms(self.seed, stream, period, agent_ids)
+
+
+def _inverse_cdf(prbs, u):
+    '''
+    Index of the outcome of a discrete distribution hit by each uniform u.
+    '''
+    cdf = np.cumsum(prbs)
+    return np.minimum(np.searchsorted(cdf, u * cdf[-1], side='right'), cdf.size - 1)
+
+
+def _unemployment_prb(agent, t):
+    '''
+    Probability of the unemployment outcome that HARK puts first in
+    TranShkDstn[t] (zero if there is none).
+    '''
+    retired = agent.T_retire > 0 and t >= agent.T_retire
+    return agent.UnempPrbRet if retired else agent.UnempPrb
+
+
+def counter_death(agent, draws, period):
+    '''
+    AgentType.simDeath with draws from a CounterDraws or a ShockBank.
+    '''
+    DiePrb = (1.0 - np.asarray(agent.LivPrb))[agent.t_cycle - 1]  # Time has already advanced
+    which_agents = draws.uniforms(DEATH_STREAM, period, agent.agent_ids)[:, 0] < DiePrb
+    if agent.T_age is not None:
+        which_agents = np.logical_or(which_agents, agent.t_age >= agent.T_age)
+    return which_agents
+
+
+def counter_birth(agent, which_agents, draws, period):
+    '''
+    PerfForesightConsumerType.simBirth with draws from a CounterDraws or a ShockBank.
+    '''
+    u = draws.uniforms(BIRTH_STREAM, period, agent.agent_ids[which_agents])
+    pLvlInitMeanNow = agent.pLvlInitMean + np.log(agent.PlvlAggNow)
+    agent.aNrmNow[which_agents] = np.exp(agent.aNrmInitMean + agent.aNrmInitStd * ndtri(u[:, 0]))
+    agent.pLvlNow[which_agents] = np.exp(pLvlInitMeanNow + agent.pLvlInitStd * ndtri(u[:, 1]))
+    agent.t_age[which_agents] = 0
+    agent.t_cycle[which_agents] = 0
+
+
+def counter_shocks(agent, draws, period):
+    '''
+    IndShockConsumerType.getShocks with draws from a CounterDraws or a ShockBank.
+    Each agent has its own standardized permanent, transitory and unemployment
+    uniforms, mapped through the inverse CDFs of PermShkDstn and TranShkDstn,
+    so agent types with different income processes still get the same
+    percentiles of each shock.
+    '''
+    u = draws.uniforms(INCOME_STREAM, period, agent.agent_ids)
+    PermShkNow = np.zeros(agent.AgentCount)
+    TranShkNow = np.zeros(agent.AgentCount)
+    newborn = agent.t_age == 0
+    # Newborns use the first period of the cycle, everyone else the one they came from
+    t_dstn = np.where(newborn, 0, agent.t_cycle - 1) % agent.T_cycle
+    for t in np.unique(t_dstn):
+        these = t_dstn == t
+        PermPrbs, PermShkVals = agent.PermShkDstn[t][0], agent.PermShkDstn[t][1]
+        TranPrbs, TranShkVals = agent.TranShkDstn[t][0], agent.TranShkDstn[t][1]
+        PermShkNow[these] = PermShkVals[_inverse_cdf(PermPrbs, u[these, 0])] * agent.PermGroFac[t]
+        UnempPrb = _unemployment_prb(agent, t) if TranShkVals.size > 1 else 0.
+        if UnempPrb > 0:
+            # The unemployment outcome comes first; the others keep their relative probabilities
+            TranShkNow[these] = np.where(u[these, 2] < UnempPrb, TranShkVals[0],
+                                         TranShkVals[1:][_inverse_cdf(TranPrbs[1:], u[these, 1])])
+        else:
+            TranShkNow[these] = TranShkVals[_inverse_cdf(TranPrbs, u[these, 1])]
+    TranShkNow[newborn] = 1.0
+
+    agent.EmpNow = np.ones(agent.AgentCount, dtype=bool)
+    agent.EmpNow[TranShkNow == agent.IncUnemp] = False
+    agent.PermShkNow = PermShkNow
+    agent.TranShkNow = TranShkNow
+
+
+def initialize_counter_sim(agent, draws, agent_ids, store=None):
+    '''
+    initializeSim() for the agents with the given ids; their initial states are
+    drawn as period 0 of the counter-based streams, and their histories are
+    allocated by store (a HistoryStore).
+    '''
+    agent.AgentCount = len(agent_ids)
+    initialize_sim(agent, store)
+    agent.agent_ids = np.asarray(agent_ids, dtype=np.int64)
+    counter_birth(agent, np.ones(agent.AgentCount, dtype=bool), draws, 0)
+
+
+def counter_sim_one_period(agent, draws):
+    '''
+    AgentType.simOnePeriod with the draws of period t_sim + 1.
+    '''
+    period = agent.t_sim + 1
+    counter_birth(agent, counter_death(agent, draws, period), draws, period)
+    counter_shocks(agent, draws, period)
+    agent.getStates()
+    agent.getControls()
+    agent.getPostStates()
+    agent.t_age = agent.t_age + 1
+    agent.t_cycle = agent.t_cycle + 1
+    agent.t_cycle[agent.t_cycle == agent.T_cycle] = 0
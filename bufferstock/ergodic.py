@@ -0,0 +1,181 @@
+'''
+Warm starts and automatic stopping for infinite-horizon simulations.
+
+The infinite-horizon simulations start everyone with (almost) no assets and
+run a fixed number of periods, long enough for the wealth distribution to
+forget its starting point, before any moment is read off.  Here the starting
+assets are instead drawn from an approximation of the ergodic distribution of
+normalized end-of-period assets, found from the solved consumption function
+and the discrete income distribution by iterating a histogram on a grid of a
+(each point of the next period's a is split between its two neighbouring
+grid points).  simulate_until_stable() then simulates until the per-period
+cross-sectional means of a few normalized variables stop changing by more
+than their Monte Carlo noise, rather than for a fixed T_sim.
+'''
+import numpy as np
+import scipy.sparse as sp
+
+from .histogram import _lottery, _spread
+from .streaming import simulate_streaming
+
+
+def asset_grid(agent, t=0, points=500, aMax=None):
+    '''
+    Grid of normalized end-of-period assets for the histogram, denser near the
+    lowest feasible a.
+    Inputs:
+       agent:  solved consumer type
+       t:      period of the solution
+       points: number of grid points
+       aMax:   top of the grid (defaults to 20 times the target a, at least 20)
+    Returns:
+       aGrid: array (points,)
+    '''
+    solution = agent.solution[t]
+    aMin = solution.mNrmMin
+    if aMax is None:
+        aMax = aMin + 20. * max(getattr(solution, 'aNrmSS', 1.), 1.)
+    return aMin + (aMax - aMin) * np.linspace(0., 1., points) ** 3
+
+
+def asset_transition(agent, aGrid, t=0):
+    '''
+    Transition matrix of normalized end-of-period assets between grid points:
+    survivors draw the shocks of IncomeDstn[t] and consume cFunc(m), while the
+    dead are replaced by newborns with exp(aNrmInitMean) assets (aNrmInitStd
+    is ignored).
+    Returns:
+       trans: sparse CSR matrix (len(aGrid), len(aGrid)); row i is the
+              distribution of next period's a given a = aGrid[i]
+    '''
+    solution = agent.solution[t]
+    ShkPrbs, PermShkVals, TranShkVals = agent.IncomeDstn[t][0], agent.IncomeDstn[t][1], agent.IncomeDstn[t][2]
+    PermGroFac = agent.PermGroFac[t]
+    Rfree = agent.Rfree[t] if np.ndim(agent.Rfree) else agent.Rfree
+    LivPrb = agent.LivPrb[t]
+
+    def next_assets(aNow):
+        # Next period's a for every (a now, shock) pair, with the probabilities of the shocks
+        mNext = Rfree / (PermGroFac * PermShkVals[None, :]) * aNow[:, None] + TranShkVals[None, :]
+        return mNext - solution.cFunc(mNext.ravel()).reshape(mNext.shape)
+
+    N = aGrid.size
+    lower, weight = _lottery(next_assets(aGrid), aGrid)
+    trans = _spread(lower, weight, ShkPrbs[None, :], N)
+    if LivPrb < 1.:
+        # Every row also sends 1-LivPrb to the newborns' distribution
+        lower, weight = _lottery(next_assets(np.array([np.exp(agent.aNrmInitMean)])), aGrid)
+        newborn = _spread(lower, weight, ShkPrbs[None, :], N)
+        trans = LivPrb * trans + (1. - LivPrb) * sp.csr_matrix(np.ones((N, 1))).dot(newborn)
+    return trans.tocsr()
+
+
+def ergodic_assets(agent, t=0, aGrid=None, tol=1e-12, max_iter=10000):
+    '''
+    Approximate ergodic distribution of normalized end-of-period assets of an
+    infinite-horizon agent, by iterating the histogram from a point mass at the
+    target a (or the middle of the grid) until it stops changing.
+    Inputs:
+       agent:    solved infinite-horizon consumer type
+       t:        period of the solution
+       aGrid:    grid of a (defaults to asset_grid(agent, t))
+       tol:      largest total absolute change in the histogram at convergence
+       max_iter: maximum number of iterations
+    Returns:
+       aGrid: array of grid points
+       pmf:   array of the probability of each grid point
+    '''
+    if aGrid is None:
+        aGrid = asset_grid(agent, t)
+    transT = asset_transition(agent, aGrid, t).T.tocsr()
+    lower, weight = _lottery(np.array([getattr(agent.solution[t], 'aNrmSS', aGrid[aGrid.size // 2])]), aGrid)
+    pmf = np.zeros(aGrid.size)
+    pmf[lower[0]] = 1. - weight[0]
+    pmf[lower[0] + 1] = weight[0]
+    for it in range(max_iter):
+        pmf_new = transT.dot(pmf)
+        diff = np.abs(pmf_new - pmf).sum()
+        pmf = pmf_new
+        if diff < tol:
+            break
+    return aGrid, pmf / pmf.sum()
+
+
+def start_from_ergodic(agent, seed=None, t=0, aGrid=None):
+    '''
+    Replace the initial assets of an initialized agent (after initializeSim())
+    with draws from its approximate ergodic distribution; permanent income,
+    ages and the simulation's own random numbers are left as they are.
+    Inputs:
+       agent: solved infinite-horizon consumer type after initializeSim()
+       seed:  seed of the draws (defaults to agent.seed)
+       t:     period of the solution
+       aGrid: see ergodic_assets
+    Returns:
+       aNrm: array (AgentCount,) of the new initial assets
+    '''
+    aGrid, pmf = ergodic_assets(agent, t, aGrid)
+    RNG = np.random.RandomState(agent.seed if seed is None else seed)
+    # Invert the CDF, interpolating linearly between grid points
+    cdf = np.cumsum(pmf)
+    agent.aNrmNow = np.interp(RNG.uniform(size=agent.AgentCount) * cdf[-1], cdf, aGrid)
+    return agent.aNrmNow
+
+
+def simulate_until_stable(agents, reducers, moments=('mNrmNow', 'cNrmNow'), tolerance=1e-3, noise=2.,
+                          window=3, min_periods=20, max_periods=None, by='t_age', draws=None):
+    '''
+    Simulate initialized agents side by side, one period at a time as
+    simulate_streaming does, until the cross-sectional means of the moments
+    have stopped drifting for window periods in a row for every agent, so all
+    of them stop at the same period.  A change in a mean counts as drift when
+    it is larger than tolerance (relative to its level) and also larger than
+    noise standard errors of the change, so Monte Carlo noise in the means of
+    a finite panel is never taken for drift, nor is its absence taken for
+    stability before min_periods.
+    Moments should be normalized variables, which have an ergodic distribution.
+    From a cold start, a slow drift towards the target can pass a loose
+    tolerance too early; start_from_ergodic() avoids that.
+    Inputs:
+       agents:      list of consumer types after initializeSim()
+       reducers:    list with a dict of name -> Reducer for each agent
+       moments:     names of the agent attributes whose means are watched
+       tolerance:   largest relative change in a mean that counts as stable
+       noise:       largest change in a mean, in standard errors of the change,
+                    that counts as stable
+       window:      number of stable periods in a row needed to stop
+       min_periods: least number of periods to simulate
+       max_periods: most number of periods to simulate (defaults to the
+                    smallest T_sim of the agents)
+       by:          see simulate_streaming
+       draws:       see simulate_streaming; one source shared by all the agents
+                    gives them the same shocks
+    Returns:
+       periods: number of periods simulated
+    '''
+    if max_periods is None:
+        max_periods = min(agent.T_sim for agent in agents)
+    last = [None] * len(agents)
+    last_se = [None] * len(agents)
+    stable = 0
+    periods = 0
+    while periods < max_periods:
+        changed = False
+        for i, (agent, stats) in enumerate(zip(agents, reducers)):
+            simulate_streaming(agent, stats, sim_periods=1, by=by, draws=draws)
+            values = [np.asarray(getattr(agent, var_name)) for var_name in moments]
+            means = np.array([np.mean(x) for x in values])
+            se = np.array([np.std(x) / np.sqrt(x.size) for x in values])
+            if last[i] is None:
+                changed = True
+            else:
+                change = np.abs(means - last[i])
+                bound = np.maximum(tolerance * np.abs(last[i]), noise * np.sqrt(se**2 + last_se[i]**2))
+                changed = changed or bool(np.any(change > bound))
+            last[i] = means
+            last_se[i] = se
+        periods += 1
+        stable = 0 if changed else stable + 1
+        if periods >= min_periods and stable >= window:
+            break
+    return periods
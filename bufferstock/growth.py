@@ -0,0 +1,63 @@
+'''
+Expected consumption and expected consumption growth of a solved consumer.
+
+For end-of-period assets a_t, next period's market resources and consumption
+(in units of this period's permanent income) are
+
+    m_{t+1} = R/(G*psi)*a_t + theta,     C_{t+1}/P_t = G*psi*c_{t+1}(m_{t+1})
+
+The expectation is taken over the whole (assets x PermShk x TranShk) tensor in
+one broadcasted evaluation of c_{t+1}, so a dense grid of assets costs a
+single call to the consumption function.
+'''
+import numpy as np
+
+
+def _next_period(agent, t):
+    '''
+    Index of the solution that follows period t (wrapping around for infinite
+    horizon models).
+    '''
+    if agent.cycles == 0:
+        return (t + 1) % len(agent.solution)
+    return t + 1
+
+
+def expected_consumption(agent, aNrm, t=0):
+    '''
+    Next period's expected consumption, E_t[G*psi*c_{t+1}(m_{t+1})], for an
+    array of end-of-period assets.
+    Inputs:
+       agent: solved IndShockConsumerType with cFunc unpacked and time flowing forward
+       aNrm:  scalar or array of normalized end-of-period assets in period t
+       t:     period in which the assets are chosen
+    Returns:
+       cNext: array of the same shape as aNrm
+    '''
+    aNrm = np.asarray(aNrm, dtype=float)
+    PermPrbs, PermShkVals = agent.PermShkDstn[t][0], agent.PermShkDstn[t][1]
+    TranPrbs, TranShkVals = agent.TranShkDstn[t][0], agent.TranShkDstn[t][1]
+    GrowFac = agent.PermGroFac[t] * PermShkVals
+
+    # Tensor of next period's market resources, (assets, PermShk, TranShk)
+    mNext = (agent.Rfree / GrowFac)[np.newaxis, :, np.newaxis] * aNrm.reshape(-1, 1, 1) \
+        + TranShkVals[np.newaxis, np.newaxis, :]
+    cNext = agent.cFunc[_next_period(agent, t)](mNext.ravel()).reshape(mNext.shape)
+    cNext = cNext * GrowFac[np.newaxis, :, np.newaxis]
+    return np.einsum('ijk,j,k->i', cNext, PermPrbs, TranPrbs).reshape(aNrm.shape)
+
+
+def expected_growth(agent, mNrm, t=0):
+    '''
+    Expected consumption growth factor, E_t[C_{t+1}/C_t], at an array of market
+    resources.
+    Inputs:
+       agent: solved IndShockConsumerType with cFunc unpacked and time flowing forward
+       mNrm:  scalar or array of normalized market resources in period t
+       t:     period of the lifecycle
+    Returns:
+       growth: array of the same shape as mNrm
+    '''
+    mNrm = np.asarray(mNrm, dtype=float)
+    cNrm = agent.cFunc[t](mNrm)
+    return expected_consumption(agent, mNrm - cNrm, t) / cNrm
@@ -0,0 +1,284 @@
+'''
+Non-stochastic simulation: distributions of normalized market resources pushed
+forward on a grid.
+
+Instead of drawing shocks for a panel of agents, the distribution of m is kept
+as probabilities on a fixed grid and moved from one period to the next with a
+sparse transition matrix built from cFunc and the discretized IncomeDstn (each
+point of next period's m is split between its two neighbouring grid points,
+which keeps its mean).  A finite-horizon cohort is followed age by age; an
+infinite-horizon model's stationary distribution is solved for directly.
+Alongside the probabilities, the grid carries the expected permanent income
+E[p; m] and log permanent income E[log p; m] of the agents at each point, so
+that means of levels such as consumption c*p come out exactly too.  Every
+statistic is then exact up to the grid and free of Monte Carlo noise.
+
+Newborns start with exp(aNrmInitMean) assets and are drawn as in HARK (first
+period's IncomeDstn, no transitory shock); aNrmInitStd is ignored.
+'''
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import spsolve
+
+
+def _lottery(x, grid):
+    '''
+    Split each x between its two neighbouring grid points, keeping its mean.
+    Returns:
+       lower:  index of the grid point below each x
+       weight: weight put on the grid point above (lower+1)
+    '''
+    x = np.clip(x, grid[0], grid[-1])
+    lower = np.clip(np.searchsorted(grid, x, side='right') - 1, 0, grid.size - 2)
+    weight = (x - grid[lower]) / (grid[lower + 1] - grid[lower])
+    return lower, weight
+
+
+def market_grid(agent, points=500, mMax=50.):
+    '''
+    Grid of normalized market resources from just above the lowest feasible m
+    of any period (where c = 0, so log c would not be finite) up to mMax,
+    denser near the bottom.
+    Inputs:
+       agent:  solved consumer type
+       points: number of grid points
+       mMax:   top of the grid
+    Returns:
+       mGrid: array (points,)
+    '''
+    mMin = min(solution.mNrmMin for solution in agent.solution)
+    return mMin + (mMax - mMin) * np.linspace(0., 1., points + 1)[1:] ** 3
+
+
+def _spread(lower, weight, prbs, N):
+    '''
+    Sparse matrix (sources, N) splitting points between grid points with the
+    shock probabilities, given their _lottery() as arrays (sources, shocks).
+    Kept in COO format: it is only multiplied by vectors, and converting to
+    CSR would sort every entry again.
+    '''
+    rows = np.repeat(np.arange(lower.shape[0]), lower.shape[1])
+    data = np.concatenate([(prbs * (1. - weight)).ravel(), (prbs * weight).ravel()])
+    cols = np.concatenate([lower.ravel(), lower.ravel() + 1])
+    return sp.coo_matrix((data, (np.tile(rows, 2), cols)), shape=(lower.shape[0], N))
+
+
+def _income(agent, t):
+    '''
+    Probabilities, permanent "shocks" including growth, and transitory shocks
+    of the transition out of period t of the cycle.
+    '''
+    IncomeDstn = agent.IncomeDstn[t]
+    return IncomeDstn[0], IncomeDstn[1] * agent.PermGroFac[t], IncomeDstn[2]
+
+
+def transition_matrices(agent, t, mGrid):
+    '''
+    Sparse transition matrices of a survivor's m from period t of the cycle to
+    the next: consume cFunc[t](m), then draw the shocks of IncomeDstn[t].
+    Inputs:
+       agent: solved consumer type
+       t:     period of the cycle
+       mGrid: grid of m
+    Returns:
+       trans:    COO matrix (N, N); row i is the distribution of next m given m = mGrid[i]
+       pTrans:   trans with each entry multiplied by the growth of permanent income
+       logTrans: trans with each entry multiplied by the log growth of permanent income
+    '''
+    Rfree = agent.Rfree[t] if np.ndim(agent.Rfree) else agent.Rfree
+    ShkPrbs, PermShk, TranShk = _income(agent, t)
+    aNrm = mGrid - agent.solution[t].cFunc(mGrid)
+    lower, weight = _lottery(Rfree / PermShk[None, :] * aNrm[:, None] + TranShk[None, :], mGrid)
+    trans = _spread(lower, weight, ShkPrbs[None, :], mGrid.size)
+    pTrans = _spread(lower, weight, (ShkPrbs * PermShk)[None, :], mGrid.size)
+    logTrans = _spread(lower, weight, (ShkPrbs * np.log(PermShk))[None, :], mGrid.size)
+    return trans, pTrans, logTrans
+
+
+def newborn_distribution(agent, mGrid):
+    '''
+    Distribution of m in a newborn's first period, with E[p; m] and E[log p; m].
+    '''
+    Rfree = agent.Rfree[0] if np.ndim(agent.Rfree) else agent.Rfree
+    ShkPrbs, PermShk, TranShk = _income(agent, 0)
+    lower, weight = _lottery(Rfree / PermShk[None, :] * np.exp(agent.aNrmInitMean) + 1., mGrid)
+    pInit = np.exp(agent.pLvlInitMean + 0.5 * agent.pLvlInitStd ** 2)
+    mass = _spread(lower, weight, ShkPrbs[None, :], mGrid.size).toarray()[0]
+    pLvl = pInit * _spread(lower, weight, (ShkPrbs * PermShk)[None, :], mGrid.size).toarray()[0]
+    logpLvl = _spread(lower, weight, (ShkPrbs * (agent.pLvlInitMean + np.log(PermShk)))[None, :], mGrid.size).toarray()[0]
+    return mass, pLvl, logpLvl
+
+
+class PathStat(object):
+    '''
+    A per-age statistic of a DistributionPath, with the result() of a
+    streaming Reducer, so stats_frame() collects it in the same way.
+    '''
+    def __init__(self, ages, values, q=None):
+        self.ages = ages
+        self.values = values
+        self.q = q
+
+    def result(self):
+        return self.ages, self.values
+
+
+class DistributionPath(object):
+    '''
+    Distributions of normalized market resources of a cohort, one per
+    simulated period, on a common grid.
+    Inputs:
+       mGrid:   array (N,) grid of m
+       cNrm:    array (T, N) of consumption at each grid point in each period
+       mass:    array (T, N) of the probability of each grid point
+       pLvl:    array (T, N) of E[p; m], permanent income summed over the agents at each point
+       logpLvl: array (T, N) of E[log p; m]
+       ages:    array (T,) of the t_age the streaming reducers give each period
+    '''
+    def __init__(self, mGrid, cNrm, mass, pLvl, logpLvl, ages):
+        self.mGrid = mGrid
+        self.cNrm = cNrm
+        self.mass = mass
+        self.pLvl = pLvl
+        self.logpLvl = logpLvl
+        self.ages = ages
+
+    def values(self, var):
+        '''
+        Values of 'mNrmNow', 'cNrmNow' or 'aNrmNow' at each period and grid
+        point, or var itself if it is already an array.
+        '''
+        if not isinstance(var, str):
+            return np.broadcast_to(var, self.cNrm.shape)
+        if var == 'mNrmNow':
+            return np.broadcast_to(self.mGrid, self.cNrm.shape)
+        if var == 'cNrmNow':
+            return self.cNrm
+        if var == 'aNrmNow':
+            return self.mGrid[None, :] - self.cNrm
+        raise ValueError('Unknown variable {!r}'.format(var))
+
+    def mean(self, var=None, weight='mass'):
+        '''
+        Mean of each period's cross-section.
+        Inputs:
+           var:    variable (see values), or None for 1
+           weight: 'mass' for the mean of var, 'pLvl' for the mean of var*p, or
+                   'logpLvl' for the mean of var*log(p)
+        Returns:
+           means: array (T,)
+        '''
+        weights = {'mass': self.mass, 'pLvl': self.pLvl, 'logpLvl': self.logpLvl}[weight]
+        if var is None:
+            return weights.sum(axis=1)
+        return (self.values(var) * weights).sum(axis=1)
+
+    def quantile(self, var, q=0.5):
+        '''
+        Quantiles of each period's cross-section, interpolating between the
+        midpoints of the grid points' probabilities as the Quantile reducer does.
+        Returns:
+           values: array (T,), or (T, len(q)) for a list of quantiles
+        '''
+        x = self.values(var)
+        qs = np.atleast_1d(q)
+        out = np.zeros((x.shape[0], qs.size))
+        for k in range(x.shape[0]):
+            order = np.argsort(x[k], kind='mergesort')
+            w = self.mass[k][order]
+            out[k] = np.interp(qs, np.cumsum(w) - 0.5 * w, x[k][order])
+        return out[:, 0] if np.ndim(q) == 0 else out
+
+    def stat(self, values, q=None):
+        '''
+        Wrap an array of per-period values as a PathStat for stats_frame().
+        '''
+        return PathStat(self.ages, values, q)
+
+
+def cohort_path(agent, periods=None, mGrid=None):
+    '''
+    Follow a cohort of newborns age by age, as simulate() would with deaths
+    switched off (the distribution of the survivors does not depend on who dies).
+    Inputs:
+       agent:   solved consumer type
+       periods: number of periods (defaults to agent.T_sim)
+       mGrid:   grid of m (defaults to market_grid(agent))
+    Returns:
+       path: DistributionPath for ages 1..periods
+    '''
+    if periods is None:
+        periods = agent.T_sim
+    if mGrid is None:
+        mGrid = market_grid(agent)
+    N = mGrid.size
+    mass, pLvl, logpLvl, cNrm = (np.zeros((periods, N)) for _ in range(4))
+    mass[0], pLvl[0], logpLvl[0] = newborn_distribution(agent, mGrid)
+    for k in range(periods):
+        t = k % agent.T_cycle
+        cNrm[k] = agent.solution[t].cFunc(mGrid)
+        if k + 1 < periods:
+            trans, pTrans, logTrans = transition_matrices(agent, t, mGrid)
+            mass[k + 1] = trans.T.dot(mass[k])
+            pLvl[k + 1] = pTrans.T.dot(pLvl[k])
+            logpLvl[k + 1] = trans.T.dot(logpLvl[k]) + logTrans.T.dot(mass[k])
+    return DistributionPath(mGrid, cNrm, mass, pLvl, logpLvl, np.arange(1, periods + 1))
+
+
+def stationary_distribution(agent, mGrid=None):
+    '''
+    Stationary distribution of m of an infinite-horizon model with a one
+    period cycle, solving mass = mass*trans directly; the dead are replaced by
+    newborns.
+    Returns:
+       mGrid: grid of m
+       mass:  array of the probability of each grid point
+    '''
+    if mGrid is None:
+        mGrid = market_grid(agent)
+    trans = transition_matrices(agent, 0, mGrid)[0]
+    LivPrb = agent.LivPrb[0]
+    A = sp.identity(mGrid.size, format='csr') - LivPrb * trans.T.tocsr()
+    b = (1. - LivPrb) * newborn_distribution(agent, mGrid)[0]
+    if LivPrb == 1.:
+        # Replace one equation by the probabilities summing to one
+        A = sp.vstack([A[:-1], sp.csr_matrix(np.ones((1, mGrid.size)))], format='csr')
+        b = np.zeros(mGrid.size)
+        b[-1] = 1.
+    mass = np.maximum(spsolve(A.tocsc(), b), 0.)
+    return mGrid, mass / mass.sum()
+
+
+def stationary_path(agent, periods=2, mGrid=None):
+    '''
+    Follow the stationary cross-section of an infinite-horizon model (one
+    period cycle, LivPrb = 1) forward for some periods.  The distribution of m
+    stays put; the permanent income weights start from their own stationary
+    shape, scaled to mean one, and grow at the mean growth of permanent
+    income, so growth rates, saving rates and means of levels come out as in a
+    long simulation.
+    Returns:
+       path: DistributionPath for ages 1..periods
+    '''
+    if agent.LivPrb[0] < 1.:
+        raise ValueError('stationary_path needs LivPrb = 1')
+    mGrid, mass = stationary_distribution(agent, mGrid)
+    trans, pTrans, logTrans = transition_matrices(agent, 0, mGrid)
+    # Rows of pTrans all sum to the mean growth factor, so pTrans divided by it
+    # is a transition matrix whose stationary distribution is the p-weighted shape
+    growth = np.asarray(pTrans.sum(axis=1)).ravel()[0]
+    A = sp.identity(mGrid.size, format='csr') - pTrans.T.tocsr() / growth
+    A = sp.vstack([A[:-1], sp.csr_matrix(np.ones((1, mGrid.size)))], format='csr')
+    b = np.zeros(mGrid.size)
+    b[-1] = 1.
+    pShape = np.maximum(spsolve(A.tocsc(), b), 0.)
+    pShape /= pShape.sum()
+
+    N = mGrid.size
+    cNrm = np.tile(agent.solution[0].cFunc(mGrid), (periods, 1))
+    masses, pLvl, logpLvl = np.tile(mass, (periods, 1)), np.zeros((periods, N)), np.zeros((periods, N))
+    pLvl[0] = pShape
+    for k in range(1, periods):
+        pLvl[k] = pTrans.T.dot(pLvl[k - 1])
+        logpLvl[k] = trans.T.dot(logpLvl[k - 1]) + logTrans.T.dot(masses[k - 1])
+    return DistributionPath(mGrid, cNrm, masses, pLvl, logpLvl, np.arange(1, periods + 1))
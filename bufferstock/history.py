@@ -0,0 +1,96 @@
+'''
+Storage of simulation histories.
+
+AgentType.clearHistory makes each <var>_hist a float64 array in memory.  A
+HistoryStore makes them float32 or float64, in memory or as .npy files mapped
+with np.memmap, so the histories of very large populations need not fit in
+RAM and can be read back later without a copy.  The arrays keep their usual
+names and shapes (T_sim x AgentCount), so code that reads agent.aNrmNow_hist
+does not change.
+'''
+import os
+
+import numpy as np
+
+
+class HistoryStore(object):
+    '''
+    Where and in what precision simulation histories are kept.
+    Inputs:
+       dtype:     'float64' (HARK's default) or 'float32' to halve memory and bandwidth
+       directory: None to keep histories in memory, or a directory for
+                  memory-mapped .npy files
+       prefix:    prepended to the file names, to keep several agents' histories
+                  in one directory apart
+    '''
+    def __init__(self, dtype='float64', directory=None, prefix=''):
+        self.dtype = np.dtype(dtype)
+        self.directory = directory
+        self.prefix = prefix
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @property
+    def mapped(self):
+        return self.directory is not None
+
+    def path(self, var_name):
+        return os.path.join(self.directory, '{}{}_hist.npy'.format(self.prefix, var_name))
+
+    def allocate(self, var_name, shape):
+        '''
+        Make a new history array filled with NaN.
+        '''
+        if self.mapped:
+            arr = np.lib.format.open_memmap(self.path(var_name), mode='w+', dtype=self.dtype, shape=shape)
+            arr[:] = np.nan
+            return arr
+        return np.full(shape, np.nan, dtype=self.dtype)
+
+    def open(self, var_name, mode='r'):
+        '''
+        Map an existing history file without reading it into memory.
+        '''
+        return np.lib.format.open_memmap(self.path(var_name), mode=mode)
+
+    def load(self, track_vars):
+        '''
+        Map the stored histories of track_vars, e.g. in a later session.
+        Returns:
+           histories: dict of var_name -> read-only np.memmap
+        '''
+        return {var_name: self.open(var_name) for var_name in track_vars}
+
+
+def clear_history(agent, store=None):
+    '''
+    Replacement for AgentType.clearHistory that allocates through a HistoryStore.
+    '''
+    if store is None:
+        store = HistoryStore()
+    for var_name in agent.track_vars:
+        setattr(agent, var_name + '_hist', store.allocate(var_name, (agent.T_sim, agent.AgentCount)))
+
+
+def initialize_sim(agent, store=None):
+    '''
+    agent.initializeSim(), with the histories of agent.track_vars allocated by
+    store instead of as float64 arrays in memory.
+    '''
+    track_vars = agent.track_vars
+    agent.track_vars = []
+    try:
+        agent.initializeSim()
+    finally:
+        agent.track_vars = track_vars
+    clear_history(agent, store)
+
+
+def flush_history(agent):
+    '''
+    Write any memory-mapped histories of agent.track_vars out to their files.
+    '''
+    for var_name in agent.track_vars:
+        arr = getattr(agent, var_name + '_hist')
+        if isinstance(arr, np.memmap):
+            arr.flush()
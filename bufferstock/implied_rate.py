@@ -0,0 +1,99 @@
+'''
+Table 2: consumption of buffer-stock and perfect foresight consumers with two
+income growth rates, the MPC out of human wealth, and the implied discount
+rate of future income, for a whole vector of wealth ratios at once.
+
+The implied discount rate is the interest factor x at which a perfect
+foresight consumer would respond to the higher growth rate as much as the
+buffer-stock consumer does:
+
+    c_hi - c_lo = kappa(x)*(h_hi(x) - h_lo(x)),
+    kappa(x) = 1 - (x*DiscFac)**(1/CRRA)/x,   h(x) = 1/(1 - G/x)
+
+The right hand side falls from infinity to zero as x rises above the higher
+growth factor, so every wealth ratio has one root there.  All of them are
+found together by Newton steps, falling back to bisection wherever a step
+would leave the bracket.
+'''
+import numpy as np
+
+from .stack import StackedFunc
+
+
+def consumption_on_grid(agents, mNrm, t=0):
+    '''
+    Evaluate the consumption functions of several agents on one grid in one
+    stacked call.
+    Inputs:
+       agents: list of K solved consumer types
+       mNrm:   array (M,) of normalized market resources
+       t:      period of the solutions
+    Returns:
+       cNrm: array (K, M)
+    '''
+    funcs = StackedFunc.from_functions([agent.solution[t].cFunc for agent in agents])
+    mNrm = np.asarray(mNrm, dtype=float)
+    return funcs(np.tile(mNrm, (len(agents), 1)))
+
+
+def _pf_response(x, DiscFac, CRRA, G_lo, G_hi):
+    '''
+    kappa(x)*(h_hi(x) - h_lo(x)) and its derivative with respect to x.
+    '''
+    kappa = 1. - (x * DiscFac) ** (1. / CRRA) / x
+    dkappa = -(1. / CRRA - 1.) * DiscFac ** (1. / CRRA) * x ** (1. / CRRA - 2.)
+    H = x / (x - G_hi) - x / (x - G_lo)
+    dH = G_lo / (x - G_lo) ** 2 - G_hi / (x - G_hi) ** 2
+    return kappa * H, dkappa * H + kappa * dH
+
+
+def implied_discount_rate(dc, DiscFac, CRRA, PermGroFac=(1.02, 1.03), tol=1e-12, max_iter=200):
+    '''
+    Implied discount rate of future income for each consumption response.
+    Inputs:
+       dc:         array of c_hi - c_lo, consumption with the higher growth
+                   factor minus with the lower, each > 0
+       DiscFac:    intertemporal discount factor
+       CRRA:       coefficient of relative risk aversion
+       PermGroFac: (lower, higher) income growth factors
+       tol:        relative tolerance on the interest factor
+       max_iter:   maximum number of Newton/bisection steps
+    Returns:
+       rate: array of the same shape as dc, x - 1 (NaN where dc <= 0)
+    '''
+    G_lo, G_hi = PermGroFac
+    dc = np.asarray(dc, dtype=float)
+    shape = dc.shape
+    dc = dc.ravel()
+    valid = dc > 0
+    target = np.where(valid, dc, 1.)
+
+    # For large x the response is about (G_hi - G_lo)/x, so start the upper
+    # end of the bracket there and double it until it is above the root
+    lo = np.full(dc.size, G_hi)
+    hi = np.maximum(2. * G_hi, 2. * (G_hi - G_lo) / target)
+    while True:
+        f_hi = _pf_response(hi, DiscFac, CRRA, G_lo, G_hi)[0] - target
+        below = f_hi > 0
+        if not below.any():
+            break
+        lo[below] = hi[below]
+        hi[below] *= 2.
+    x = 0.5 * (lo + hi)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for it in range(max_iter):
+            f, df = _pf_response(x, DiscFac, CRRA, G_lo, G_hi)
+            f -= target
+            # f falls in x: a positive f means the root is higher
+            lo = np.where(f > 0, x, lo)
+            hi = np.where(f > 0, hi, x)
+            newton = x - f / df
+            bisect = ~((newton > lo) & (newton < hi))
+            x_new = np.where(bisect, 0.5 * (lo + hi), newton)
+            done = np.abs(x_new - x) <= tol * x_new
+            x = x_new
+            if done.all():
+                break
+    rate = np.where(valid, x - 1., np.nan)
+    return rate.reshape(shape)
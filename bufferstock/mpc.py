@@ -0,0 +1,132 @@
+'''
+Marginal propensities to consume across the whole simulated population, and
+household-level consumption/income divergence.
+
+The MPC of every agent (and every period of a panel) comes from the analytic
+derivative of cFunc (exact for the cubic spline and its lower envelope with
+the borrowing constraint), evaluated for all agents in one batched call per
+period of the cycle, instead of a finite difference at one point.  The same
+pass over a panel of histories gives the divergence statistics: how far
+individual consumption is from individual income, and how little of the
+changes in income shows up in consumption.
+'''
+import numpy as np
+
+from .panel import Panel, log
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def marginal_propensities(agent, mNrm, t_cycle=None):
+    '''
+    Analytic MPC out of market resources (which is also the MPC out of
+    transitory income).
+    Inputs:
+       agent:   solved consumer type
+       mNrm:    array of normalized market resources, any shape
+       t_cycle: array of the periods of the cycle of the same shape, or None for period 0
+    Returns:
+       mpc: array of the same shape as mNrm
+    '''
+    mNrm = np.asarray(mNrm, dtype=float)
+    if t_cycle is None:
+        return agent.solution[0].cFunc.derivative(mNrm.ravel()).reshape(mNrm.shape)
+    t_cycle = np.broadcast_to(t_cycle, mNrm.shape)
+    mpc = np.full(mNrm.shape, np.nan)
+    for t in np.unique(t_cycle):
+        these = t_cycle == t
+        mpc[these] = agent.solution[t].cFunc.derivative(mNrm[these])
+    return mpc
+
+
+def agent_mpc(agent):
+    '''
+    MPCs of an agent's simulated population this period; a Reducer var, e.g.
+    Quantile(agent_mpc, [0.1, 0.5, 0.9]).
+    '''
+    # cNrmNow was chosen with the cFunc of the period before t_cycle was advanced
+    return marginal_propensities(agent, agent.mNrmNow, (agent.t_cycle - 1) % agent.T_cycle)
+
+
+def mpc_moments(mpc, weights=None):
+    '''
+    Summary of an MPC distribution, ignoring NaN.
+    Inputs:
+       mpc:     array of MPCs
+       weights: optional array of the same shape, e.g. permanent income for a
+                wealth-weighted average
+    Returns:
+       moments: dict with mean, std and the QUANTILES (as 'p10', ..., 'p90')
+    '''
+    mpc = np.asarray(mpc, dtype=float).ravel()
+    ok = ~np.isnan(mpc)
+    w = np.ones(mpc.size) if weights is None else np.asarray(weights, dtype=float).ravel()
+    mpc, w = mpc[ok], w[ok]
+    mean = np.average(mpc, weights=w)
+    moments = {'mean': float(mean), 'std': float(np.sqrt(np.average((mpc - mean) ** 2, weights=w)))}
+    order = np.argsort(mpc)
+    cdf = (np.cumsum(w[order]) - 0.5 * w[order]) / w.sum()
+    for q in QUANTILES:
+        moments['p{:g}'.format(100 * q)] = float(np.interp(q, cdf, mpc[order]))
+    return moments
+
+
+def _moments_of_changes(dc, dy):
+    '''
+    Standard deviations, correlation and regression slope of paired changes.
+    '''
+    ok = np.isfinite(dc) & np.isfinite(dy)
+    dc, dy = dc[ok], dy[ok]
+    cov = np.cov(dc, dy)
+    return {'std_dlogc': float(np.sqrt(cov[0, 0])), 'std_dlogy': float(np.sqrt(cov[1, 1])),
+            'corr_dlogc_dlogy': float(cov[0, 1] / np.sqrt(cov[0, 0] * cov[1, 1])),
+            'passthrough': float(cov[0, 1] / cov[1, 1])}
+
+
+def cross_section(agent, panel, t_cycle=None):
+    '''
+    MPC distribution and consumption/income divergence of a simulated panel.
+    Income is y = pLvl*TranShk; periods with zero income are left out of the
+    log statistics.
+    Inputs:
+       agent:   the solved consumer type that was simulated
+       panel:   Panel with mNrmNow, cNrmNow, pLvlNow and TranShkNow (and t_age
+                when agents die and are replaced)
+       t_cycle: array (T_sim, AgentCount) of the periods of the cycle, or None
+                to take them from the ages (period k is t_age - 1 of the cycle)
+    Returns:
+       mpc:   array (T_sim, AgentCount) of every agent's MPC in every period
+       stats: dict with
+              mpc:        mpc_moments of the whole panel
+              household:  changes of log consumption and income within households
+                          (std_dlogc, std_dlogy, corr_dlogc_dlogy, passthrough),
+                          mean_abs_log_c_y (mean |log c/y|) and corr_logc_logy
+              aggregate:  the same for changes of log mean consumption and income
+    '''
+    if not isinstance(panel, Panel):
+        panel = Panel(panel)
+    if t_cycle is None:
+        ages = np.arange(1, panel.T_sim + 1)[:, None] if panel.t_age is None else np.asarray(panel.t_age)
+        t_cycle = (ages - 1) % agent.T_cycle
+    mpc = marginal_propensities(agent, panel.evaluate('mNrmNow'), t_cycle)
+
+    logc = panel.evaluate(log(panel['cNrmNow'] * panel['pLvlNow']))
+    with np.errstate(divide='ignore'):
+        logy = panel.evaluate(log(panel['pLvlNow'] * panel['TranShkNow']))
+    same = np.ones((panel.T_sim - 1, panel.AgentCount), dtype=bool)
+    if panel.t_age is not None:
+        # Only compare consecutive periods of the same household
+        t_age = np.asarray(panel.t_age)
+        same = t_age[1:] == t_age[:-1] + 1
+    dc = np.where(same, logc[1:] - logc[:-1], np.nan)
+    dy = np.where(same, logy[1:] - logy[:-1], np.nan)
+    household = _moments_of_changes(dc.ravel(), dy.ravel())
+    gap = logc - logy
+    ok = np.isfinite(gap)
+    household['mean_abs_log_c_y'] = float(np.abs(gap[ok]).mean())
+    household['corr_logc_logy'] = float(np.corrcoef(logc[ok], logy[ok])[0, 1])
+
+    C = panel.evaluate(panel['cNrmNow'] * panel['pLvlNow']).mean(axis=1)
+    Y = panel.evaluate(panel['pLvlNow'] * panel['TranShkNow']).mean(axis=1)
+    aggregate = _moments_of_changes(np.diff(np.log(C)), np.diff(np.log(Y)))
+    return mpc, {'mpc': mpc_moments(mpc), 'household': household, 'aggregate': aggregate}
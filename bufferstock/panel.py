@@ -0,0 +1,252 @@
+'''
+Age-indexed view of simulation histories.
+
+Histories come as T_sim x AgentCount arrays, [period, agent].  Flattening them
+into a DataFrame with one row per agent and period, adding derived columns and
+calling groupby('T_age') copies every value and hashes a million-row key.  A
+Panel instead wraps the arrays as they are (in memory or memory-mapped),
+derived quantities are lazy expressions of the variables, e.g.
+
+    panel = Panel.from_agent(agent)
+    Cons = panel['cNrmNow']*panel['pLvlNow']
+    panel.mean(Cons, age_offset=25)
+    panel.median(log(panel['aNrmNow']))
+
+and reductions evaluate them a block of periods at a time, grouping by age
+along the agent axis.
+'''
+import numpy as np
+import pandas as pd
+
+from .history import HistoryStore
+from .panel_io import open_panel, panel_metadata
+
+
+class Expr(object):
+    '''
+    A lazy expression of panel variables.
+    Inputs:
+       func:  function of a dict of var_name -> array block, returning an array
+       names: set of the variables it reads
+    '''
+    def __init__(self, func, names):
+        self.func = func
+        self.names = frozenset(names)
+
+    def evaluate(self, block):
+        return self.func(block)
+
+    def _binary(self, other, op, reflected=False):
+        other = _wrap(other)
+        if reflected:
+            return Expr(lambda block: op(other.func(block), self.func(block)), self.names | other.names)
+        return Expr(lambda block: op(self.func(block), other.func(block)), self.names | other.names)
+
+    def __add__(self, other):
+        return self._binary(other, np.add)
+
+    def __radd__(self, other):
+        return self._binary(other, np.add, True)
+
+    def __sub__(self, other):
+        return self._binary(other, np.subtract)
+
+    def __rsub__(self, other):
+        return self._binary(other, np.subtract, True)
+
+    def __mul__(self, other):
+        return self._binary(other, np.multiply)
+
+    def __rmul__(self, other):
+        return self._binary(other, np.multiply, True)
+
+    def __truediv__(self, other):
+        return self._binary(other, np.true_divide)
+
+    def __rtruediv__(self, other):
+        return self._binary(other, np.true_divide, True)
+
+    def __pow__(self, other):
+        return self._binary(other, np.power)
+
+    def __neg__(self):
+        return Expr(lambda block: -self.func(block), self.names)
+
+    def apply(self, ufunc):
+        '''
+        Expression of ufunc applied to this one, e.g. expr.apply(np.log).
+        '''
+        return Expr(lambda block: ufunc(self.func(block)), self.names)
+
+
+def _wrap(x):
+    if isinstance(x, Expr):
+        return x
+    return Expr(lambda block: x, ())
+
+
+def var(var_name):
+    '''
+    Expression of one history variable.
+    '''
+    return Expr(lambda block: block[var_name], (var_name,))
+
+
+def log(x):
+    return _wrap(x).apply(np.log)
+
+
+def exp(x):
+    return _wrap(x).apply(np.exp)
+
+
+class Panel(object):
+    '''
+    Histories of a simulation, [period, agent], indexed by age.
+    Inputs:
+       histories: dict of var_name -> array (T_sim, AgentCount); wrapped without a copy
+       t_age:     optional array (T_sim, AgentCount) of ages, e.g. t_age_hist; without
+                  it period k is age k+1 for every agent, as for a cohort
+       block:     number of periods evaluated at a time
+    '''
+    def __init__(self, histories, t_age=None, block=64):
+        self.histories = histories
+        self.t_age = t_age
+        self.block = block
+        shapes = set(np.shape(arr) for arr in histories.values())
+        if len(shapes) != 1:
+            raise ValueError('Histories must all have the same shape, not {}'.format(sorted(shapes)))
+        self.T_sim, self.AgentCount = shapes.pop()
+
+    @classmethod
+    def from_agent(cls, agent, **kwargs):
+        '''
+        Panel of a simulated agent's track_vars histories (t_age is used for the
+        ages when it was tracked).
+        '''
+        histories = {var_name: getattr(agent, var_name + '_hist') for var_name in agent.track_vars}
+        return cls(histories, t_age=histories.pop('t_age', None), **kwargs)
+
+    @classmethod
+    def from_store(cls, store, track_vars, **kwargs):
+        '''
+        Panel of histories memory-mapped from a HistoryStore.
+        '''
+        if not isinstance(store, HistoryStore):
+            store = HistoryStore(directory=store)
+        histories = store.load(track_vars)
+        return cls(histories, t_age=histories.pop('t_age', None), **kwargs)
+
+    @classmethod
+    def from_panel(cls, path, columns=None, **kwargs):
+        '''
+        Panel of the memory-mapped columns of a stored 'npy' panel (see panel_io).
+        '''
+        meta = panel_metadata(path)
+        if columns is None:
+            columns = [name for name in meta['columns'] if name not in ('agent', 'period')]
+        shape = (meta['T_sim'], meta['AgentCount'])
+        histories = dict((name, arr.reshape(shape)) for name, arr in open_panel(path, columns).items())
+        return cls(histories, t_age=histories.pop('t_age', None), **kwargs)
+
+    def __getitem__(self, var_name):
+        if var_name not in self.histories:
+            raise KeyError(var_name)
+        return var(var_name)
+
+    def _blocks(self, expr):
+        '''
+        Yield (values, ages) for blocks of periods; ages is an array (periods,)
+        when every agent in a period has the same age, else (periods, AgentCount).
+        '''
+        expr = var(expr) if isinstance(expr, str) else _wrap(expr)
+        for first in range(0, self.T_sim, self.block):
+            last = min(first + self.block, self.T_sim)
+            block = dict((name, np.asarray(self.histories[name][first:last])) for name in expr.names)
+            values = np.broadcast_to(expr.evaluate(block), (last - first, self.AgentCount))
+            if self.t_age is None:
+                ages = np.arange(first + 1, last + 1)
+            else:
+                ages = np.asarray(self.t_age[first:last]).astype(int)
+                if np.all(ages == ages[:, :1]):
+                    ages = ages[:, 0]
+            yield values, ages
+
+    def evaluate(self, expr):
+        '''
+        Materialize an expression as an array (T_sim, AgentCount).
+        '''
+        return np.concatenate([values for values, _ in self._blocks(expr)], axis=0)
+
+    def _series(self, ages, values, age_offset, name):
+        return pd.Series(values, index=pd.Index(ages + age_offset, name='T_age'), name=name)
+
+    def mean(self, expr, age_offset=0, name=None):
+        '''
+        Mean of an expression (or variable name) by age, skipping NaN.
+        Returns:
+           means: Series indexed by T_age = age + age_offset
+        '''
+        groups, counts, totals = [], [], []
+        for values, ages in self._blocks(expr):
+            ok = ~np.isnan(values)
+            if ages.ndim == 1:
+                # Each period is one age: reduce along the agent axis
+                groups.append(ages)
+                counts.append(ok.sum(axis=1))
+                totals.append(np.where(ok, values, 0.).sum(axis=1))
+            else:
+                groups.append(ages[ok])
+                counts.append(np.ones(groups[-1].size))
+                totals.append(values[ok])
+        groups = np.concatenate(groups)
+        count = np.bincount(groups, weights=np.concatenate(counts))
+        total = np.bincount(groups, weights=np.concatenate(totals))
+        seen = np.nonzero(count)[0]
+        return self._series(seen, total[seen] / count[seen], age_offset, name)
+
+    def quantile(self, expr, q=0.5, age_offset=0, name=None):
+        '''
+        Quantile of an expression (or variable name) by age, skipping NaN, with
+        np.quantile's linear interpolation.
+        Returns:
+           quantiles: Series indexed by T_age = age + age_offset
+        '''
+        blocks = list(self._blocks(expr))
+        row_ages = [ages for _, ages in blocks if ages.ndim == 1]
+        if len(row_ages) == len(blocks):
+            ages = np.concatenate(row_ages)
+            if np.unique(ages).size == ages.size:
+                # Each age is one period: reduce along the agent axis
+                out = np.concatenate([np.nanquantile(values, q, axis=1) if np.isnan(values).any()
+                                      else np.quantile(values, q, axis=1) for values, _ in blocks])
+                order = np.argsort(ages)
+                return self._series(ages[order], out[order], age_offset, name)
+        ages = np.concatenate([np.broadcast_to(a[:, None], v.shape).ravel() if a.ndim == 1 else a.ravel()
+                               for v, a in blocks])
+        values = np.concatenate([v.ravel() for v, _ in blocks])
+        ok = ~np.isnan(values)
+        ages, values = ages[ok], values[ok]
+        order = np.lexsort((values, ages))
+        ages, values = ages[order], values[order]
+        seen, first, counts = np.unique(ages, return_index=True, return_counts=True)
+        # Position of the quantile within each age's sorted values
+        pos = q * (counts - 1)
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, counts - 1)
+        out = values[first + lo] + (pos - lo) * (values[first + hi] - values[first + lo])
+        return self._series(seen, out, age_offset, name)
+
+    def median(self, expr, age_offset=0, name=None):
+        return self.quantile(expr, 0.5, age_offset, name)
+
+    def frame(self, columns, age_offset=0, how='mean'):
+        '''
+        DataFrame of several per-age reductions, in the layout of
+        Data.groupby(['T_age']).mean().reset_index().
+        Inputs:
+           columns: dict of column name -> expression or variable name
+           how:     'mean' or 'median'
+        '''
+        reduce = {'mean': self.mean, 'median': self.median}[how]
+        return pd.DataFrame(dict((name, reduce(expr, age_offset)) for name, expr in columns.items())).reset_index()
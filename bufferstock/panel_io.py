@@ -0,0 +1,155 @@
+'''
+Columnar storage of simulated panels.
+
+A panel is written with one column per tracked variable, plus the index
+columns agent, period and (when t_age was tracked) t_age, in period-major
+order.  Its metadata holds the digest of the ParamSpec that produced it, so a
+stored panel can be matched to its model later.  Two formats are supported:
+
+    'npy':     a directory with one .npy file per column and a metadata.json;
+               columns are memory-mapped, so reading a few of them touches
+               only those files
+    'parquet': a single Parquet file (needs pyarrow), one row group per period
+
+Columns are read lazily and, for more than one, on a pool of threads.
+'''
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet is optional; the npy format needs only numpy
+    pa = None
+    pq = None
+
+INDEX_COLUMNS = ('agent', 'period', 't_age')
+METADATA_KEY = b'bufferstock'
+
+
+def _histories(source):
+    '''
+    Get a dict of var_name -> array (T_sim, AgentCount) from an agent with
+    track_vars, or pass a dict through.
+    '''
+    if isinstance(source, dict):
+        return source
+    return {var_name: getattr(source, var_name + '_hist') for var_name in source.track_vars}
+
+
+def _panel_columns(histories):
+    '''
+    Flatten the histories (period-major) and add the index columns.
+    '''
+    if not histories:
+        raise ValueError('Nothing to write: the panel has no tracked variables')
+    T, N = next(iter(histories.values())).shape
+    columns = {'agent': np.tile(np.arange(N, dtype=np.int64), T),
+               'period': np.repeat(np.arange(T, dtype=np.int64), N)}
+    if 't_age' in histories:
+        columns['t_age'] = np.asarray(histories['t_age']).astype(np.int64).ravel()
+    for var_name, arr in histories.items():
+        if var_name != 't_age':
+            columns[var_name] = np.asarray(arr).ravel()
+    return columns, T, N
+
+
+def write_panel(path, source, spec=None, format='npy', **metadata):
+    '''
+    Write a simulated panel to disk.
+    Inputs:
+       path:     directory (format 'npy') or file (format 'parquet') to write
+       source:   simulated agent (its track_vars histories are written) or a dict
+                 of var_name -> array (T_sim, AgentCount)
+       spec:     optional ParamSpec of the agent; its digest goes in the metadata
+       format:   'npy' or 'parquet'
+       metadata: any further JSON serializable items to store, e.g. seed=0
+    Returns:
+       metadata: dict that was stored with the panel
+    '''
+    columns, T, N = _panel_columns(_histories(source))
+    meta = dict(metadata)
+    meta.update({'T_sim': T, 'AgentCount': N, 'columns': list(columns.keys()),
+                 'spec_digest': spec.digest if spec is not None else None,
+                 'agent_type': spec.agent_type if spec is not None else None})
+
+    if format == 'npy':
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name, values in columns.items():
+            np.save(os.path.join(path, name + '.npy'), values)
+        with open(os.path.join(path, 'metadata.json'), 'w') as f:
+            json.dump(meta, f, indent=1)
+    elif format == 'parquet':
+        if pq is None:
+            raise ImportError('Writing Parquet panels needs pyarrow')
+        table = pa.table(columns)
+        table = table.replace_schema_metadata({METADATA_KEY: json.dumps(meta).encode('utf-8')})
+        pq.write_table(table, path, row_group_size=N)
+    else:
+        raise ValueError("format must be 'npy' or 'parquet', not {!r}".format(format))
+    return meta
+
+
+def panel_metadata(path):
+    '''
+    Read the metadata of a stored panel without reading any columns.
+    '''
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'metadata.json')) as f:
+            return json.load(f)
+    if pq is None:
+        raise ImportError('Reading Parquet panels needs pyarrow')
+    return json.loads(pq.read_schema(path).metadata[METADATA_KEY].decode('utf-8'))
+
+
+def open_panel(path, columns=None):
+    '''
+    Map the columns of an 'npy' panel without reading them.
+    Inputs:
+       path:    panel directory
+       columns: names of the columns to map (defaults to all)
+    Returns:
+       panel: dict of column name -> read-only np.memmap of length T_sim*AgentCount
+    '''
+    if columns is None:
+        columns = panel_metadata(path)['columns']
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in columns}
+
+
+def read_panel(path, columns=None, index=True, threads=None):
+    '''
+    Load some columns of a stored panel into a DataFrame.
+    Inputs:
+       path:    panel directory or Parquet file
+       columns: names of the variables to load (defaults to all of them)
+       index:   also load the index columns agent, period and t_age
+       threads: number of threads reading columns at once (defaults to one per column)
+    Returns:
+       frame: pandas DataFrame, one row per agent and period (empty when no
+              columns are asked for)
+    '''
+    meta = panel_metadata(path)
+    if columns is None:
+        columns = [name for name in meta['columns'] if name not in INDEX_COLUMNS]
+    names = [name for name in INDEX_COLUMNS if index and name in meta['columns']]
+    names += [name for name in columns if name not in names]
+    if not names:
+        return pd.DataFrame()
+
+    if os.path.isdir(path):
+        mapped = open_panel(path, names)
+        pool = ThreadPool(threads or len(names))
+        try:
+            values = pool.map(np.array, [mapped[name] for name in names])
+        finally:
+            pool.close()
+            pool.join()
+        return pd.DataFrame(dict(zip(names, values)), columns=names)
+    if pq is None:
+        raise ImportError('Reading Parquet panels needs pyarrow')
+    return pq.read_table(path, columns=names, use_threads=True).to_pandas()
@@ -0,0 +1,134 @@
+'''
+Solve many independent models at once in a pool of worker processes.
+
+Workers only ever see a ParamSpec and send back the (picklable) per-period
+solution list; the consumer types themselves are rebuilt in the calling process.
+Finite horizon models whose last periods are the same (lifecycle profiles with a
+common retirement tail) still go to a worker each: the shared periods are
+solved once beforehand and sent along, so that every worker only solves the
+periods of its own model before the first difference.
+On platforms that start workers by spawning a fresh interpreter (Windows, and
+macOS by default) calls from a script must sit under `if __name__ == '__main__':`.
+'''
+import multiprocessing
+import os
+from collections import OrderedDict
+
+from .solve import (PERIOD_MEMO, solve_solution, agent_from_solution, attach_targets, spec_period_keys,
+                    solve_tail)
+
+
+def _solve_job(args):
+    '''
+    Solve one spec (in a worker process), with the periods it shares with
+    other specs of the batch put in the process's period memo first.
+    '''
+    spec, cache, tail = args
+    for key, solution_t in tail.items():
+        PERIOD_MEMO.put(key, solution_t)
+    return solve_solution(spec, cache=cache)
+
+
+def shared_tails(specs, cache=None):
+    '''
+    Solve, once for each group of finite horizon specs that end the same way,
+    the trailing periods the whole group has in common.
+    Inputs:
+       specs: list of ParamSpecs
+       cache: optional SolutionCache of single periods
+    Returns:
+       tails: list with, for each spec, a dict of period key -> solution of the
+              periods it shares (empty if it shares none)
+    '''
+    keys = [spec_period_keys(spec) if spec.cycles == 1 else None for spec in specs]
+    groups = OrderedDict()
+    for i, spec_keys in enumerate(keys):
+        if spec_keys:
+            groups.setdefault(spec_keys[-1], []).append(i)
+    tails = [{} for _ in specs]
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        first = keys[members[0]]
+        shared = 1
+        while all(shared < len(keys[i]) and keys[i][-shared - 1] == first[-shared - 1] for i in members):
+            shared += 1
+        tail = solve_tail(specs[members[0]], shared, cache=cache)
+        for i in members:
+            tails[i] = tail
+    return tails
+
+
+def solve_solutions(specs, processes=None, cache=None):
+    '''
+    Solve a batch of models in parallel.
+    Inputs:
+       specs:     list of ParamSpecs
+       processes: number of worker processes; defaults to the number of cores,
+                  and 1 solves everything in this process
+       cache:     optional SolutionCache consulted before and filled after solving
+                  (single finite horizon periods are filled by the workers)
+    Returns:
+       solutions: list of solution lists, in the same order as specs
+    '''
+    specs = list(specs)
+    solutions = [None] * len(specs)
+
+    # Look everything up in the cache first, and solve each distinct model once
+    todo = {}
+    for i, spec in enumerate(specs):
+        entry = cache.get(spec) if cache is not None else None
+        if entry is not None:
+            solutions[i] = entry['solution']
+        else:
+            todo.setdefault(spec.solution_key, []).append(i)
+
+    if todo:
+        keys = list(todo.keys())
+        jobs = [specs[todo[key][0]] for key in keys]
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = min(processes, len(jobs))
+        if processes > 1:
+            # Workers do not see each other's periods, so solve the common tails first
+            work = [(spec, cache, tail) for spec, tail in zip(jobs, shared_tails(jobs, cache))]
+            pool = multiprocessing.Pool(processes)
+            try:
+                solved = pool.map(_solve_job, work, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            # In one process the period memo already shares them
+            solved = [solve_solution(spec, cache=cache) for spec in jobs]
+
+        for key, solution in zip(keys, solved):
+            for i in todo[key]:
+                solutions[i] = solution
+        if cache is not None:
+            # Find the targets of the whole batch at once so they are cached too
+            agents = [agent_from_solution(spec, solution) for spec, solution in zip(jobs, solved)]
+            attach_targets(agents)
+            for spec, agent in zip(jobs, agents):
+                cache.put(spec, agent)
+
+    return solutions
+
+
+def solve_specs(specs, processes=None, cache=None):
+    '''
+    Solve a batch of models in parallel and build a solved agent for each.
+    Inputs:
+       specs:     list of ParamSpecs
+       processes: number of worker processes (see solve_solutions)
+       cache:     optional SolutionCache
+    Returns:
+       agents: list of solved consumer types, in the same order as specs, each
+               with cFunc unpacked, time flowing forward and, for infinite
+               horizon models, its target wealth on solution[0]
+    '''
+    specs = list(specs)
+    solutions = solve_solutions(specs, processes=processes, cache=cache)
+    agents = [agent_from_solution(spec, solution) for spec, solution in zip(specs, solutions)]
+    attach_targets(agents)
+    return agents
@@ -0,0 +1,182 @@
+'''
+Frozen, hashable parameter specifications for HARK consumer types.
+
+HARK's default parameter dictionaries (e.g. ConsumerParameters.init_lifecycle)
+are module level globals, so assigning into them leaks values from one cell of
+the notebook into the next.  A ParamSpec takes a private copy of such a
+dictionary, freezes it, and can be used as a key for caching solved models.
+'''
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+from copy import deepcopy
+
+import numpy as np
+
+# Parameters that only affect how a model is simulated, not how it is solved
+SIM_ONLY_PARAMS = ('AgentCount', 'aNrmInitMean', 'aNrmInitStd', 'pLvlInitMean',
+                   'pLvlInitStd', 'PermGroFacAgg', 'T_age', 'T_sim', 'track_vars', 'seed')
+
+
+def default_parameters():
+    '''
+    HARK's ConsumerParameters module, read on its own.  Importing it the usual
+    way first imports the whole HARK package, which takes seconds; the module
+    itself only defines dictionaries of numbers, so reading it directly lets
+    specs be built without loading HARK until a model is actually solved.
+    Returns:
+       Params: module with init_idiosyncratic_shocks, init_lifecycle, ...
+    '''
+    name = 'HARK.ConsumptionSaving.ConsumerParameters'
+    if name in sys.modules:
+        return sys.modules[name]
+    location = importlib.util.find_spec('HARK').submodule_search_locations[0]
+    spec = importlib.util.spec_from_file_location(
+        '_consumer_parameters', os.path.join(location, 'ConsumptionSaving', 'ConsumerParameters.py'))
+    Params = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(Params)
+    return Params
+
+
+def _freeze(value):
+    '''
+    Convert a parameter value into an immutable equivalent: lists and arrays
+    become tuples, dictionaries become sorted tuples of pairs.
+    '''
+    if isinstance(value, np.ndarray):
+        return tuple(_freeze(x) for x in value.tolist())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(x) for x in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(val)) for key, val in value.items()))
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _thaw(value):
+    '''
+    Inverse of _freeze for sequences: HARK expects time varying parameters as lists.
+    '''
+    if isinstance(value, tuple):
+        return [_thaw(x) for x in value]
+    return value
+
+
+def _canonical(value):
+    '''
+    Make a JSON-friendly version of a frozen value in which 1 and 1.0 hash alike.
+    '''
+    if isinstance(value, tuple):
+        return [_canonical(x) for x in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    return repr(value)
+
+
+class ParamSpec(object):
+    '''
+    An immutable description of one consumer type: the HARK class to build, the
+    number of cycles, and the full parameter dictionary passed to its constructor.
+    Specs compare equal and hash alike whenever they describe the same model.
+    '''
+    __slots__ = ('agent_type', 'cycles', '_items')
+
+    def __init__(self, agent_type='IndShockConsumerType', cycles=0, **params):
+        object.__setattr__(self, 'agent_type', agent_type)
+        object.__setattr__(self, 'cycles', int(cycles))
+        object.__setattr__(self, '_items', tuple(sorted((key, _freeze(val)) for key, val in params.items())))
+
+    @classmethod
+    def from_dict(cls, params, agent_type='IndShockConsumerType', cycles=0, **changes):
+        '''
+        Build a spec from a (possibly shared) parameter dictionary without
+        modifying it.
+        Inputs:
+           params:     dictionary of parameters, e.g. Params.init_idiosyncratic_shocks
+           agent_type: name of the HARK consumer type the spec describes
+           cycles:     0 for an infinite horizon model, 1 for a lifecycle model
+           changes:    parameter values that override those in params
+        Returns:
+           spec: a new ParamSpec
+        '''
+        values = deepcopy(dict(params))
+        values.update(changes)
+        return cls(agent_type, cycles, **values)
+
+    def replace(self, agent_type=None, cycles=None, **changes):
+        '''
+        Return a copy of this spec with some parameters changed.
+        '''
+        values = dict(self._items)
+        values.update(changes)
+        return ParamSpec(agent_type or self.agent_type,
+                         self.cycles if cycles is None else cycles, **values)
+
+    def to_dict(self):
+        '''
+        Return a fresh, mutable parameter dictionary that can be passed to a
+        HARK constructor without sharing state with this spec.
+        '''
+        return {key: _thaw(val) for key, val in self._items}
+
+    def solution_items(self):
+        '''
+        Parameters that matter for the solution of the model (not its simulation).
+        '''
+        return tuple((key, val) for key, val in self._items if key not in SIM_ONLY_PARAMS)
+
+    def _hash_of(self, items):
+        text = json.dumps([self.agent_type, self.cycles,
+                           [[key, _canonical(val)] for key, val in items]])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @property
+    def digest(self):
+        '''
+        Content hash of the whole spec.
+        '''
+        return self._hash_of(self._items)
+
+    @property
+    def solution_key(self):
+        '''
+        Content hash of the parts of the spec that determine the solution.
+        '''
+        return self._hash_of(self.solution_items())
+
+    def __getitem__(self, key):
+        return _thaw(dict(self._items)[key])
+
+    def __contains__(self, key):
+        return key in dict(self._items)
+
+    def keys(self):
+        return [key for key, val in self._items]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ParamSpec is immutable; use replace() to change parameters')
+
+    def __eq__(self, other):
+        return (isinstance(other, ParamSpec) and self.agent_type == other.agent_type
+                and self.cycles == other.cycles and self._items == other._items)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.agent_type, self.cycles, self._items))
+
+    def __reduce__(self):
+        return (_rebuild_spec, (self.agent_type, self.cycles, self._items))
+
+    def __repr__(self):
+        return 'ParamSpec({}, cycles={}, {})'.format(self.agent_type, self.cycles, self.digest[:12])
+
+
+def _rebuild_spec(agent_type, cycles, items):
+    return ParamSpec(agent_type, cycles, **dict(items))
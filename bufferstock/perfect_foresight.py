@@ -0,0 +1,178 @@
+'''
+Closed form solution and deterministic paths of the perfect foresight model.
+
+With no income risk the consumption function is linear, c_t = kappa_t*(m_t + h_t),
+where human wealth h_t and the MPC kappa_t follow from the PermGroFac profile:
+
+    h_t       = (G_t/R)*(h_{t+1} + 1),                    h_T = 0
+    1/kappa_t = 1 + [R^{-1}(beta R)^{1/rho}]/kappa_{t+1},   kappa_T = 1
+
+Both recursions (and the law of motion of m) are evaluated with cumulative
+products over the profile, so thousands of profiles are handled in one go.
+The results are the same as solving and simulating a PerfForesightConsumerType.
+'''
+import numpy as np
+
+
+def _profiles(PermGroFac):
+    '''
+    Make PermGroFac into an array of shape (P, T).
+    '''
+    G = np.asarray(PermGroFac, dtype=float)
+    if G.ndim < 2:
+        G = G[np.newaxis, :]
+    return G
+
+
+def _per_profile(value, P):
+    '''
+    Make a scalar or per-profile parameter into a column of shape (P, 1).
+    '''
+    return np.broadcast_to(np.asarray(value, dtype=float).reshape(-1, 1), (P, 1))
+
+
+def _suffix_ratio(step):
+    '''
+    Solve x_t = 1 + step_t*x_{t+1}, x_T = 1 for every t at once.
+    Inputs:
+       step: array (P, T)
+    Returns:
+       x: array (P, T+1), where x_t = sum_{i>=t} prod_{t<=j<i} step_j
+    '''
+    P = step.shape[0]
+    D = np.cumprod(np.concatenate([np.ones((P, 1)), step], axis=1), axis=1)
+    tail = np.cumsum(D[:, ::-1], axis=1)[:, ::-1]
+    return tail / D
+
+
+class PerfForesightSolution(object):
+    '''
+    The solution of P perfect foresight lifecycle models with T periods.
+    Attributes:
+       PermGroFac: array (P, T) of growth profiles
+       Rfree:      array (P, 1)
+       hNrm:       array (P, T+1) of normalized human wealth, zero in the terminal period
+       MPC:        array (P, T+1) of marginal propensities to consume, one in the terminal period
+       mNrmMin:    array (P, T+1), equal to -hNrm
+       aNrmInitMean, pLvlInitMean: mean log assets and log permanent income at
+                   birth, when known (solve_pf_spec takes them from the spec)
+    '''
+    def __init__(self, PermGroFac, Rfree, hNrm, MPC, aNrmInitMean=None, pLvlInitMean=None):
+        self.PermGroFac = PermGroFac
+        self.Rfree = Rfree
+        self.hNrm = hNrm
+        self.MPC = MPC
+        self.mNrmMin = -hNrm
+        self.aNrmInitMean = aNrmInitMean
+        self.pLvlInitMean = pLvlInitMean
+
+    def cFunc(self, m, t=0):
+        '''
+        Consumption in period t, c_t(m) = MPC_t*(m + h_t), for every profile.
+        Inputs:
+           m: scalar or array (M,) or (P, M) of market resources
+           t: period of the lifecycle
+        Returns:
+           c: array (P, M)
+        '''
+        m = np.atleast_1d(np.asarray(m, dtype=float))
+        return self.MPC[:, t:t + 1] * (m + self.hNrm[:, t:t + 1])
+
+    def simulate_path(self, aNrmInit=None, pLvlInit=None):
+        '''
+        Deterministic path of one consumer per profile from birth to the last
+        period, with the same timing as HARK's simulation: the newborn's income
+        growth factor is the last entry of PermGroFac (time has "already
+        advanced"), and period t+1 resources are m = R/G_t*a_t + 1.
+        Inputs:
+           aNrmInit: normalized assets at birth; defaults to exp(aNrmInitMean),
+                     as HARK draws them with aNrmInitStd = 0 (or to 0 if unknown)
+           pLvlInit: permanent income at birth; defaults to exp(pLvlInitMean)
+                     (or to 1 if unknown)
+        Returns:
+           path: dict of arrays (P, T): mNrm, cNrm, aNrm, pLvl and t_age (1..T)
+        '''
+        if aNrmInit is None:
+            aNrmInit = np.exp(self.aNrmInitMean) if self.aNrmInitMean is not None else 0.
+        if pLvlInit is None:
+            pLvlInit = np.exp(self.pLvlInitMean) if self.pLvlInitMean is not None else 1.
+        G = self.PermGroFac
+        R = self.Rfree
+        P, T = G.shape
+        MPC = self.MPC[:, :T]
+        hNrm = self.hNrm[:, :T]
+
+        # m_{t+1} = alpha_t*m_t + beta_t, unrolled with cumulative products
+        alpha = R / G * (1. - MPC)
+        beta = 1. - R / G * MPC * hNrm
+        A = np.cumprod(np.concatenate([np.ones((P, 1)), alpha[:, :-1]], axis=1), axis=1)
+        m0 = R[:, 0] / G[:, -1] * aNrmInit + 1.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shifted = np.concatenate([np.zeros((P, 1)), np.cumsum(beta[:, :-1] / A[:, 1:], axis=1)], axis=1)
+        mNrm = A * (m0[:, np.newaxis] + shifted)
+
+        cNrm = MPC * (mNrm + hNrm)
+        aNrm = mNrm - cNrm
+        pLvl = pLvlInit * G[:, -1:] * np.cumprod(np.concatenate([np.ones((P, 1)), G[:, :-1]], axis=1), axis=1)
+        t_age = np.tile(np.arange(1, T + 1), (P, 1))
+        return {'mNrm': mNrm, 'cNrm': cNrm, 'aNrm': aNrm, 'pLvl': pLvl, 't_age': t_age}
+
+
+def solve_pf(PermGroFac, Rfree, DiscFac, CRRA, LivPrb=1.0):
+    '''
+    Solve finite horizon perfect foresight models in closed form.
+    Inputs:
+       PermGroFac: array (T,) or (P, T) of income growth profiles
+       Rfree, DiscFac, CRRA: scalars or arrays (P,)
+       LivPrb:     scalar, array (T,) or (P, T) of survival probabilities
+    Returns:
+       solution: PerfForesightSolution
+    '''
+    G = _profiles(PermGroFac)
+    P, T = G.shape
+    R = _per_profile(Rfree, P)
+    rho = _per_profile(CRRA, P)
+    DiscFacEff = _per_profile(DiscFac, P) * np.broadcast_to(np.asarray(LivPrb, dtype=float), (P, T))
+    PatFac = (R * DiscFacEff) ** (1. / rho) / R
+
+    hNrm = _suffix_ratio(G / R) - 1.
+    MPC = 1. / _suffix_ratio(PatFac)
+    return PerfForesightSolution(G, R, hNrm, MPC)
+
+
+def solve_pf_infinite(PermGroFac, Rfree, DiscFac, CRRA, LivPrb=1.0):
+    '''
+    Limits of the infinite horizon perfect foresight model,
+    h = (G/R)/(1 - G/R) and kappa = 1 - R^{-1}(beta R)^{1/rho}, for P models.
+    Inputs:
+       PermGroFac, Rfree, DiscFac, CRRA, LivPrb: scalars or arrays (P,)
+    Returns:
+       solution: PerfForesightSolution with a single period (T = 0); hNrm is
+                 inf where the finite human wealth condition fails
+    '''
+    G = np.atleast_1d(np.asarray(PermGroFac, dtype=float)).ravel()
+    P = np.broadcast(G, np.asarray(Rfree), np.asarray(DiscFac), np.asarray(CRRA), np.asarray(LivPrb)).size
+    G = np.broadcast_to(G, (P,)).reshape(P, 1)
+    R = _per_profile(Rfree, P)
+    rho = _per_profile(CRRA, P)
+    PatFac = (R * _per_profile(DiscFac, P) * _per_profile(LivPrb, P)) ** (1. / rho) / R
+    with np.errstate(divide='ignore'):
+        hNrm = np.where(G < R, (G / R) / (1. - G / R), np.inf)
+    MPC = np.where(PatFac < 1., 1. - PatFac, 0.)
+    return PerfForesightSolution(np.empty((P, 0)), R, hNrm, MPC)
+
+
+def solve_pf_spec(spec):
+    '''
+    Closed form solution of the PerfForesightConsumerType described by a ParamSpec,
+    which also carries the spec's aNrmInitMean and pLvlInitMean.
+    '''
+    if spec.cycles == 0:
+        solution = solve_pf_infinite(spec['PermGroFac'][0], spec['Rfree'], spec['DiscFac'],
+                                     spec['CRRA'], spec['LivPrb'][0])
+    else:
+        T = spec['T_cycle']
+        solution = solve_pf(spec['PermGroFac'][:T], spec['Rfree'], spec['DiscFac'], spec['CRRA'], spec['LivPrb'][:T])
+    solution.aNrmInitMean = spec['aNrmInitMean'] if 'aNrmInitMean' in spec else None
+    solution.pLvlInitMean = spec['pLvlInitMean'] if 'pLvlInitMean' in spec else None
+    return solution
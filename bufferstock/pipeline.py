@@ -0,0 +1,340 @@
+'''
+Run the figure/table pipeline as a graph of named stages, re-executing only
+what is out of date.
+
+Each stage is a function registered with the inputs it depends on: the stages
+whose results it takes (as keyword arguments named after them), source files
+(globs allowed; module_sources() lists a module with everything of its package
+that it imports) and parameter values.  Its key is a content hash of its own
+code, those files and parameters, and the keys of the stages it requires, so
+a change anywhere upstream changes the key of every stage downstream of it.
+A stage is stale when its key differs from the one recorded when it last ran,
+when one of its declared output files is missing or has been changed since,
+or when a stage it requires is about to be rerun (because it is stale, or
+was forced).
+
+Results are pickled in the state directory, so a stage whose inputs are up to
+date is never rerun just because something after it is.  Stages that do not
+depend on each other can run at the same time, each in its own process.
+'''
+import ast
+import glob
+import hashlib
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from multiprocessing.connection import wait
+
+from .params import _canonical, _freeze
+
+# Default location of the pipeline state, relative to the directory the script is run from
+DEFAULT_STATE_DIR = '.pipeline'
+
+
+def file_digest(path):
+    '''
+    Content hash of a file, or None if it does not exist.
+    '''
+    if not os.path.isfile(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _relative_imports(path):
+    '''
+    Files of the modules a Python file imports with relative imports
+    (anywhere in it, including imports inside functions).
+    '''
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    here = os.path.dirname(path)
+    imported = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 1:
+            names = [node.module] if node.module else [alias.name for alias in node.names]
+            for name in names:
+                candidate = os.path.join(here, *name.split('.')) + '.py'
+                if os.path.isfile(candidate):
+                    imported.append(candidate)
+    return imported
+
+
+def module_sources(*paths):
+    '''
+    Source files of a stage that calls the given modules: the modules' files
+    and, recursively, those of every module of the same package they import.
+    Inputs:
+       paths: files of the modules, e.g. 'bufferstock/solve.py'
+    Returns:
+       files: sorted list of paths
+    '''
+    found = set()
+    todo = list(paths)
+    while todo:
+        path = os.path.normpath(todo.pop())
+        if path not in found:
+            found.add(path)
+            todo.extend(_relative_imports(path))
+    return sorted(found)
+
+
+class Stage(object):
+    '''
+    One step of the pipeline.
+    Inputs:
+       name:     name of the stage, and of the keyword argument that passes its
+                 result to the stages that require it
+       func:     function of the results of the required stages (and, if it
+                 has a processes argument, of the number of worker processes
+                 it may start; see Pipeline.run)
+       requires: names of the stages whose results func takes
+       outputs:  files the stage writes
+       sources:  files (or glob patterns) whose contents the stage depends on,
+                 besides its own code
+       params:   values the stage depends on, e.g. a dict of constants it reads
+                 from its module
+       default:  whether the stage runs when no targets are named
+    '''
+    def __init__(self, name, func, requires=(), outputs=(), sources=(), params=None, default=True):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.outputs = tuple(outputs)
+        self.sources = tuple(sources)
+        self.params = params
+        self.default = default
+
+    def source_files(self):
+        files = []
+        for pattern in self.sources:
+            matches = sorted(glob.glob(pattern))
+            files.extend(matches if matches else [pattern])
+        return files
+
+    def own_digest(self):
+        '''
+        Hash of the stage's code, source files and parameters.
+        '''
+        h = hashlib.sha256()
+        h.update(self.name.encode('utf-8'))
+        h.update(inspect.getsource(self.func).encode('utf-8'))
+        for path in self.source_files():
+            h.update('{}:{}'.format(path, file_digest(path)).encode('utf-8'))
+        h.update(json.dumps(_canonical(_freeze(self.params))).encode('utf-8'))
+        return h.hexdigest()
+
+
+class Pipeline(object):
+    '''
+    A graph of stages and the record of when each was last run.
+    Inputs:
+       directory: where results and state are kept
+    '''
+    def __init__(self, directory=DEFAULT_STATE_DIR):
+        self.directory = directory
+        self.stages = {}
+        self.order = []
+
+    def stage(self, name=None, requires=(), outputs=(), sources=(), params=None, default=True):
+        '''
+        Decorator registering a function as a stage (named after the function
+        unless a name is given); see Stage for the arguments.
+        '''
+        def register(func):
+            stage_name = func.__name__ if name is None else name
+            for required in requires:
+                if required not in self.stages:
+                    raise ValueError('Stage {} requires {}, which has not been defined before it'.format(
+                        stage_name, required))
+            self.stages[stage_name] = Stage(stage_name, func, requires, outputs, sources, params, default)
+            self.order.append(stage_name)
+            return func
+        return register
+
+    def _state_path(self):
+        return os.path.join(self.directory, 'state.json')
+
+    def _result_path(self, name):
+        return os.path.join(self.directory, name + '.pkl')
+
+    def load_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, path, write, mode):
+        # Write to a temporary file first so that nothing ever sees half a file
+        handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _record(self, name):
+        # The key is taken once the stage has run, after anything it reads that
+        # its requirements write (e.g. the figures typeset into the paper)
+        state = self.load_state()
+        state[name] = {'key': self.keys(self.targets([name]))[name],
+                       'outputs': dict((path, file_digest(path)) for path in self.stages[name].outputs),
+                       'time': time.time()}
+        self._write(self._state_path(), lambda f: json.dump(state, f, indent=1, sort_keys=True), 'w')
+
+    def load_result(self, name):
+        '''
+        The pickled result of the last run of a stage.
+        '''
+        with open(self._result_path(name), 'rb') as f:
+            return pickle.load(f)
+
+    def targets(self, names=None):
+        '''
+        The named stages and everything they require, in an order in which each
+        stage comes after its requirements.  No names means the default stages.
+        '''
+        if names is None:
+            names = [name for name in self.order if self.stages[name].default]
+        for name in names:
+            if name not in self.stages:
+                raise KeyError('No stage named {!r}; the stages are {}'.format(name, ', '.join(self.order)))
+        needed = set()
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].requires)
+        return [name for name in self.order if name in needed]
+
+    def keys(self, names):
+        '''
+        Content keys of stages (listed after their requirements, as targets() does).
+        '''
+        keys = {}
+        for name in names:
+            stage = self.stages[name]
+            h = hashlib.sha256(stage.own_digest().encode('utf-8'))
+            for required in stage.requires:
+                h.update(keys[required].encode('utf-8'))
+            keys[name] = h.hexdigest()
+        return keys
+
+    def status(self, names=None, force=()):
+        '''
+        Why each stage needs to run.
+        Inputs:
+           names: targets, as for targets()
+           force: names of stages to rerun whether stale or not; they are
+                  targets too, and the targets that require them are rerun as well
+        Returns:
+           reasons: dict of stage name -> reason, or None when it is up to date
+        '''
+        if names is None:
+            names = [name for name in self.order if self.stages[name].default]
+        names = self.targets(list(names) + [name for name in force if name not in names])
+        keys = self.keys(names)
+        state = self.load_state()
+        reasons = {}
+        for name in names:
+            stage = self.stages[name]
+            record = state.get(name)
+            # A stage that takes the result of one being rerun is rerun too, even
+            # if that result may come out the same (e.g. when it was forced)
+            changed = [required for required in stage.requires if reasons.get(required)]
+            if name in force:
+                reasons[name] = 'forced'
+            elif record is None or not os.path.exists(self._result_path(name)):
+                reasons[name] = 'never run'
+            elif changed:
+                reasons[name] = 'requires {}'.format(', '.join(changed))
+            elif record['key'] != keys[name]:
+                reasons[name] = 'inputs changed'
+            else:
+                missing = [path for path in stage.outputs if record['outputs'].get(path) != file_digest(path)]
+                reasons[name] = 'output {} changed'.format(', '.join(missing)) if missing else None
+        return reasons
+
+    def execute(self, name, processes=None):
+        '''
+        Run one stage on the stored results of its requirements and store its
+        result.  (Its key is recorded by run, in the parent process, so that
+        stages running side by side never write the state at the same time.)
+        Inputs:
+           name:      name of the stage
+           processes: passed on to the stage if it takes a processes argument
+        '''
+        stage = self.stages[name]
+        inputs = dict((required, self.load_result(required)) for required in stage.requires)
+        if 'processes' in inspect.signature(stage.func).parameters:
+            inputs['processes'] = processes
+        result = stage.func(**inputs)
+        self._write(self._result_path(name),
+                    lambda f: pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+        return result
+
+    def run(self, names=None, jobs=1, force=(), verbose=True):
+        '''
+        Bring the named stages (and what they require) up to date.
+        Inputs:
+           names:   targets, as for targets()
+           jobs:    number of stages that may run at once, each in its own process;
+                    with more than one, each stage that starts worker processes
+                    gets an equal share of the cores, rather than all of them
+           force:   names of stages to rerun whether stale or not (and, with
+                    the stages they need, bring up to date)
+           verbose: print a line for every stage that is run
+        Returns:
+           ran: names of the stages that were run, in the order they finished
+        '''
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        reasons = self.status(names, force)
+        todo = [name for name in reasons if reasons[name] is not None]
+        done = set(name for name in reasons if reasons[name] is None)
+        ran = []
+        # Keep jobs stages that each start a pool from running jobs times as many processes as cores
+        processes = max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 else None
+
+        def ready():
+            return [name for name in todo if all(required in done for required in self.stages[name].requires)]
+
+        running = {}
+        try:
+            while todo or running:
+                waiting = ready()
+                if waiting and (jobs <= 1 or len(running) < jobs):
+                    # Stages start in the order they were defined, as far as their requirements allow
+                    name = waiting[0]
+                    todo.remove(name)
+                    if verbose:
+                        print('Running stage {} ({})'.format(name, reasons[name]))
+                    if jobs <= 1:
+                        self.execute(name, processes)
+                        self._record(name)
+                        done.add(name)
+                        ran.append(name)
+                    else:
+                        process = multiprocessing.Process(target=self.execute, args=(name, processes))
+                        process.start()
+                        running[process.sentinel] = (name, process)
+                    continue
+                for sentinel in wait(list(running.keys())):
+                    name, process = running.pop(sentinel)
+                    process.join()
+                    if process.exitcode != 0:
+                        raise RuntimeError('Stage {} failed (exit code {})'.format(name, process.exitcode))
+                    self._record(name)
+                    done.add(name)
+                    ran.append(name)
+        finally:
+            for name, process in running.values():
+                process.join()
+        return ran
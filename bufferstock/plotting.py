@@ -0,0 +1,91 @@
+'''
+Arrows along the curves of a phase diagram.
+
+Every curve on a figure is laid end to end on one arc length axis, so the
+arrow positions of all of them are found with a single np.cumsum and
+np.searchsorted, and all of the arrow heads are drawn by one quiver.
+'''
+import numpy as np
+
+
+def _as_curves(x, y):
+    '''
+    Make x and y into lists of 1D arrays, one per curve.
+    '''
+    if np.ndim(x) == 1 and np.isscalar(x[0]):
+        x, y = [x], [y]
+    return [np.asarray(xk, dtype=float) for xk in x], [np.asarray(yk, dtype=float) for yk in y]
+
+
+def arrow_positions(x, y, narrs=15, dspace=0.5, direc='neg'):
+    '''
+    Place evenly spaced arrows along one or more curves.
+    Inputs:
+       x, y:   arrays (N,) of one curve, or lists of arrays for several curves
+       narrs:  number of arrows per curve
+       dspace: shift of the arrows along the curve, as a fraction of the spacing
+       direc:  'neg' for arrows pointing along the curve (towards its last
+               point), 'pos' for arrows pointing back; a string or one per curve
+    Returns:
+       px, py: arrays of arrow positions
+       ux, uy: arrays of unit vectors (in data coordinates) the arrows point along
+    '''
+    xs, ys = _as_curves(x, y)
+    K = len(xs)
+    direcs = [direc] * K if isinstance(direc, str) else list(direc)
+    for d in direcs:
+        if d not in ('pos', 'neg'):
+            raise ValueError("direc must be 'pos' or 'neg', not {!r}".format(d))
+    sign = np.array([1. if d == 'neg' else -1. for d in direcs])
+
+    # Lay the curves end to end; the step from one curve to the next gets zero length
+    n = np.array([xk.size for xk in xs])
+    X, Y = np.concatenate(xs), np.concatenate(ys)
+    dx, dy = np.diff(X), np.diff(Y)
+    seg = np.hypot(dx, dy)
+    last = np.cumsum(n)[:-1] - 1
+    seg[last] = 0.
+    rtot = np.concatenate([[0.], np.cumsum(seg)])
+    start = rtot[np.concatenate([[0], last + 1])]
+    length = rtot[np.cumsum(n) - 1] - start
+
+    # Arc length of every arrow, aspace*(dspace + j) along its own curve
+    aspace = length / narrs
+    s = (-sign * abs(dspace))[:, np.newaxis] + np.arange(narrs)[np.newaxis, :]
+    s = s * aspace[:, np.newaxis]
+    keep = (s >= 0.) & (s < length[:, np.newaxis])
+    curve = np.nonzero(keep)[0]
+    s = (s + start[:, np.newaxis])[keep]
+
+    # Segment each arrow falls on, skipping the zero length joins
+    i = np.clip(np.searchsorted(rtot, s, side='right') - 1, 0, seg.size - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ux, uy = dx[i] / seg[i], dy[i] / seg[i]
+    px = X[i] + (s - rtot[i]) * ux
+    py = Y[i] + (s - rtot[i]) * uy
+    return px, py, sign[curve] * ux, sign[curve] * uy
+
+
+def arrowplot(axes, x, y, narrs=15, dspace=0.5, direc='neg',
+              hl=0.01, hw=3, c='black'):
+    '''
+    Draw arrow heads along one or more curves with a single quiver.
+    Inputs:
+       axes:   matplotlib axes to draw on
+       x, y:   arrays (N,) of one curve, or lists of arrays for several curves
+       narrs:  number of arrows drawn along each curve
+       dspace: shift of the arrows along the curve, between 0 and 1
+       direc:  'pos' or 'neg' to select the direction of the arrows (or one per curve)
+       hl:     length of the arrow heads, in data units
+       hw:     width of the arrow heads, in points
+       c:      color of the arrow heads
+    Returns:
+       quiver: the matplotlib Quiver holding every arrow
+    '''
+    px, py, ux, uy = arrow_positions(x, y, narrs, dspace, direc)
+    # Arrows of length hl are centred on their positions; head sizes are in
+    # multiples of a two point shaft
+    return axes.quiver(px, py, ux * hl, uy * hl, pivot='middle',
+                       angles='xy', scale_units='xy', scale=1.,
+                       units='inches', width=2. / 72., headwidth=hw,
+                       headlength=1.5 * hw, headaxislength=1.5 * hw, color=c)
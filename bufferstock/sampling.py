@@ -0,0 +1,176 @@
+'''
+Variance-reduced random numbers for the counter-based simulation.
+
+simulate_sharded (and simulate_streaming, given draws) map four uniforms per
+agent, stream and period through the inverse CDFs of the death, birth and
+income distributions.  Besides the plain counter-based draws, the uniforms of
+a whole population in one period can be
+
+    'sobol':      a scrambled Sobol point set, so that every period's cross
+                  section of permanent and transitory shocks (and of the
+                  unemployment events) covers the distributions evenly
+    'antithetic': pairs of agents (0, 1), (2, 3), ... with draws u and 1 - u
+    'stratified': a Latin hypercube: each of the four uniforms takes exactly
+                  one value in each of AgentCount equal strata, so, e.g., the
+                  share of unemployed agents is UnempPrb to within 1/AgentCount
+
+Points are handed out by agent id, so results still do not depend on the
+number of shards.  Each is an unbiased randomization: standard errors come
+from independent replications (replicate(), or combine_replications() for a
+simulation run once per replication by hand).  comparison_draws() makes one
+source of draws for all the agent types of a comparison, so that they share
+their shocks as with a ShockBank.
+'''
+from copy import deepcopy
+
+import numpy as np
+from scipy.stats import qmc
+
+from .counter import CounterDraws, counter_uniforms
+from .sharded import simulate_sharded
+from .shock_bank import bank_for
+from .streaming import stats_frame
+
+METHODS = ('mc', 'sobol', 'antithetic', 'stratified')
+
+
+class PopulationDraws(object):
+    '''
+    Base class of draws made for the whole population of a period at once.
+    Inputs:
+       seed:       key of the randomization
+       AgentCount: size of the population
+    '''
+    def __init__(self, seed, AgentCount):
+        self.seed = seed
+        self.AgentCount = AgentCount
+        self._cache = {}
+
+    def _rng(self, stream, period):
+        return np.random.default_rng([self.seed, stream, period])
+
+    def population(self, stream, period):
+        '''
+        Uniforms of every agent, array (AgentCount, 4).
+        '''
+        raise NotImplementedError()
+
+    def uniforms(self, stream, period, agent_ids):
+        # Agents are simulated period by period, so one period per stream is kept
+        key = self._cache.get(stream)
+        if key is None or key[0] != period:
+            key = (period, np.clip(self.population(stream, period), 2. ** -53, 1. - 2. ** -53))
+            self._cache[stream] = key
+        return key[1][agent_ids]
+
+
+class SobolDraws(PopulationDraws):
+    '''
+    An independently scrambled Sobol point set in four dimensions for each
+    stream and period, handed to the agents in a random order.  (The k-th
+    points of two scrambled sets are not independent, so without the shuffle
+    each agent's shocks would be correlated from one period to the next.)  The
+    set has full balance when AgentCount is a power of two; otherwise it is
+    the first AgentCount points of the next power.
+    '''
+    def population(self, stream, period):
+        rng = self._rng(stream, period)
+        sobol = qmc.Sobol(d=4, scramble=True, seed=rng)
+        points = sobol.random_base2(int(np.ceil(np.log2(max(self.AgentCount, 2)))))[:self.AgentCount]
+        return points[rng.permutation(self.AgentCount)]
+
+
+class AntitheticDraws(PopulationDraws):
+    '''
+    Counter-based draws u for even agent ids and 1 - u for the odd agent
+    after each (a last agent without a partner keeps its own draws).
+    '''
+    def population(self, stream, period):
+        ids = np.arange(self.AgentCount)
+        u = counter_uniforms(self.seed, stream, period, ids // 2)
+        return np.where((ids % 2 == 1)[:, None], 1. - u, u)
+
+
+class StratifiedDraws(PopulationDraws):
+    '''
+    A Latin hypercube sample in four dimensions for each stream and period.
+    '''
+    def population(self, stream, period):
+        return qmc.LatinHypercube(d=4, seed=self._rng(stream, period)).random(self.AgentCount)
+
+
+def make_draws(method, seed, AgentCount):
+    '''
+    Draws for simulate_sharded.
+    Inputs:
+       method:     one of METHODS ('mc' is the plain counter-based draws)
+       seed:       key of the draws
+       AgentCount: size of the population
+    '''
+    if method == 'mc':
+        return CounterDraws(seed)
+    if method == 'sobol':
+        return SobolDraws(seed, AgentCount)
+    if method == 'antithetic':
+        return AntitheticDraws(seed, AgentCount)
+    if method == 'stratified':
+        return StratifiedDraws(seed, AgentCount)
+    raise ValueError('method must be one of {}, not {!r}'.format(METHODS, method))
+
+
+def comparison_draws(agents, method='mc', seed=0):
+    '''
+    One source of draws for every agent type in a comparison.
+    Inputs:
+       agents: list of agent types to be simulated with the draws
+       method: one of METHODS; 'mc' gives a ShockBank of the counter-based draws
+       seed:   key of the draws
+    Returns:
+       draws: ShockBank or PopulationDraws covering the largest AgentCount
+    '''
+    if method == 'mc':
+        return bank_for(agents, seed)
+    return make_draws(method, seed, max(agent.AgentCount for agent in agents))
+
+
+def combine_replications(frames):
+    '''
+    Mean and standard error over independent replications of a simulation.
+    Inputs:
+       frames: list of DataFrames in the layout of stats_frame, one per replication
+    Returns:
+       estimate: DataFrame of the mean over replications
+       se:       DataFrame of the standard errors of the estimate (NaN with one replication)
+    '''
+    frames = [frame.set_index('T_age') for frame in frames]
+    stacked = np.stack([frame.values for frame in frames])
+    estimate = frames[0].copy()
+    se = frames[0].copy()
+    estimate[:] = stacked.mean(axis=0)
+    se[:] = stacked.std(axis=0, ddof=1) / np.sqrt(len(frames)) if len(frames) > 1 else np.nan
+    return estimate.reset_index(), se.reset_index()
+
+
+def replicate(agent, reducers, method='sobol', replications=8, seed=0, age_offset=0, **kwargs):
+    '''
+    Simulate an agent with independent randomizations of a sampling method
+    and estimate the per-age statistics with their standard errors.
+    Inputs:
+       agent:        solved consumer type
+       reducers:     dict of name -> streaming Reducer (copied for each replication)
+       method:       one of METHODS
+       replications: number of independent replications (at least 2)
+       seed:         replication r uses key seed + r
+       age_offset:   see stats_frame
+       kwargs:       further arguments of simulate_sharded, e.g. sim_periods
+    Returns:
+       estimate: DataFrame of the mean over replications, laid out as stats_frame's
+       se:       DataFrame of the standard errors of the estimate
+    '''
+    kwargs.setdefault('track_vars', [])
+    frames = []
+    for r in range(replications):
+        draws = make_draws(method, seed + r, agent.AgentCount)
+        stats = simulate_sharded(agent, reducers=deepcopy(reducers), bank=draws, **kwargs)
+        frames.append(stats_frame(stats, age_offset))
+    return combine_replications(frames)
@@ -0,0 +1,164 @@
+'''
+Derivatives of the consumption function, target wealth and Table 1 moments
+with respect to the structural parameters.
+
+The derivatives are central finite differences.  The model at spec and the two
+models at theta +/- h for every parameter are solved together, in lockstep,
+by vector_egm.solve_batch, so a full Jacobian costs about one extra solve
+instead of 2*P separate ones.  (Warm starting each perturbed model from the
+base solution saves little here: a perturbation takes about as many cycles to
+work its way down from the top of the grid as a cold solve takes to converge.)
+The batch reproduces HARK's own solution of each model, with the spec's
+CubicBool, and every model stops by the same criterion.
+
+Simulated moments are differenced with common random numbers: every model
+has the same seed, the same draws from its own ergodic distribution and the
+same number of periods.  The histogram moments have no sampling noise at all.
+'''
+import numpy as np
+import pandas as pd
+
+from .solve import agent_from_solution, make_agent
+from .sweep import GRID_PARAMS, MOMENTS, table1_moments
+from .vector_egm import solve_batch
+
+PARAMS = GRID_PARAMS
+
+# Default finite difference step of each parameter
+STEPS = {'PermGroFac': 1e-4, 'DiscFac': 1e-4, 'CRRA': 1e-3, 'Rfree': 1e-4,
+         'UnempPrb': 1e-4, 'PermShkStd': 1e-4, 'TranShkStd': 1e-4}
+
+# Parameters that cannot be negative; their difference is one sided when the
+# lower step would cross zero.  (With IncUnemp = 0 the model is not smooth at
+# UnempPrb = 0: any chance of unemployment moves the natural borrowing limit.)
+NONNEGATIVE = ('UnempPrb', 'PermShkStd', 'TranShkStd')
+
+
+def _value(spec, name):
+    value = spec[name]
+    return value[0] if isinstance(value, list) else value
+
+
+def _with_value(spec, name, value):
+    return spec.replace(**{name: [value] if isinstance(spec[name], list) else value})
+
+
+def perturbed_specs(spec, params=PARAMS, steps=None):
+    '''
+    The pairs of models that the derivatives difference.
+    Inputs:
+       spec:   ParamSpec of the base model
+       params: names of the parameters
+       steps:  dict of parameter -> step, overriding STEPS
+    Returns:
+       pairs: list of (name, lower value, upper value, lower spec, upper spec)
+    '''
+    h = dict(STEPS)
+    h.update(steps or {})
+    pairs = []
+    for name in params:
+        value = _value(spec, name)
+        lo = value if name in NONNEGATIVE and value < h[name] else value - h[name]
+        hi = value + h[name]
+        pairs.append((name, lo, hi, _with_value(spec, name, lo), _with_value(spec, name, hi)))
+    return pairs
+
+
+class Sensitivity(object):
+    '''
+    Derivatives of a model's solution and moments with respect to its parameters.
+    Attributes:
+       params:   tuple of the P parameter names
+       values:   array (P,) of their values in the base model
+       mNrm:     array (M,) of market resources where cFunc is differentiated
+       cNrm:     array (M,) of base consumption there
+       dcFunc:   array (P, M) of dc(m)/dtheta; the PermGroFac row is the
+                 consumption response that Table 2 finds by solving the model
+                 again at a higher growth rate
+       mNrmSS, aNrmSS:   base target wealth
+       dmNrmSS, daNrmSS: arrays (P,) of their derivatives
+       moments:  array (7,) of base Table 1 moments, in the order of MOMENTS
+                 (None when they were not asked for)
+       dmoments: array (P, 7) of their derivatives
+    '''
+    def __init__(self, params, values, mNrm, cNrm, dcFunc, mNrmSS, aNrmSS, dmNrmSS, daNrmSS,
+                 moments=None, dmoments=None):
+        self.params = tuple(params)
+        self.values = values
+        self.mNrm = mNrm
+        self.cNrm = cNrm
+        self.dcFunc = dcFunc
+        self.mNrmSS = mNrmSS
+        self.aNrmSS = aNrmSS
+        self.dmNrmSS = dmNrmSS
+        self.daNrmSS = daNrmSS
+        self.moments = moments
+        self.dmoments = dmoments
+
+    def frame(self, elasticities=False):
+        '''
+        The scalar derivatives as a DataFrame, a row per parameter and a column
+        for mNrmSS, aNrmSS and each Table 1 moment.
+        Inputs:
+           elasticities: report dlog(y)/dlog(theta) instead of dy/dtheta
+        '''
+        columns = {'mNrmSS': (self.mNrmSS, self.dmNrmSS), 'aNrmSS': (self.aNrmSS, self.daNrmSS)}
+        if self.moments is not None:
+            for j, name in enumerate(MOMENTS):
+                columns[name] = (self.moments[j], self.dmoments[:, j])
+        table = pd.DataFrame(dict((name, deriv * self.values / level if elasticities else deriv)
+                                  for name, (level, deriv) in columns.items()),
+                             index=pd.Index(self.params, name='param'))
+        return table
+
+
+def sensitivity(spec, params=PARAMS, steps=None, mNrm=None, moments='histogram', periods=100):
+    '''
+    Derivatives of cFunc, the target wealth and the Table 1 moments of an
+    infinite horizon model with respect to each parameter.
+    Inputs:
+       spec:    ParamSpec of an infinite horizon IndShockConsumerType with T_cycle = 1
+       params:  names of the parameters (any of PARAMS)
+       steps:   dict of parameter -> finite difference step, overriding STEPS
+       mNrm:    array of market resources to differentiate cFunc at; defaults
+                to the asset grid above the highest mNrmMin of the models
+       moments: 'histogram' or 'simulation' for the Table 1 moments (see
+                sweep.table1_moments), or None to skip them
+       periods: periods simulated by every model (moments='simulation')
+    Returns:
+       sens: Sensitivity
+    '''
+    pairs = perturbed_specs(spec, params, steps)
+    specs = [spec] + [s for _, _, _, spec_lo, spec_hi in pairs for s in (spec_lo, spec_hi)]
+    models = [make_agent(s) for s in specs]
+    batch = solve_batch(spec,
+                        PermGroFac=[model.PermGroFac[0] for model in models],
+                        DiscFac=[model.DiscFac for model in models],
+                        CRRA=[model.CRRA for model in models],
+                        Rfree=[model.Rfree for model in models],
+                        IncomeDstn=[model.IncomeDstn[0] for model in models],
+                        CubicBool=models[0].CubicBool)
+
+    # Model 0 is the base; models 2j+1 and 2j+2 are the lower and upper ones of parameter j
+    lo = np.arange(1, len(specs), 2)
+    hi = lo + 1
+    dtheta = np.array([v_hi - v_lo for _, v_lo, v_hi, _, _ in pairs])
+    if mNrm is None:
+        mNrm = np.max(batch.mNrmMin) + np.asarray(models[0].aXtraGrid)
+    mNrm = np.asarray(mNrm, dtype=float)
+    cNrm = batch.cFunc(mNrm)
+
+    row = None
+    drow = None
+    if moments is not None:
+        rows = np.array([table1_moments(agent_from_solution(s, [batch.solution(k)]), moments, periods=periods)
+                         for k, s in enumerate(specs)])
+        row = rows[0]
+        drow = (rows[hi] - rows[lo]) / dtheta[:, np.newaxis]
+
+    return Sensitivity(params, np.array([_value(spec, name) for name in params]), mNrm, cNrm[0],
+                       (cNrm[hi] - cNrm[lo]) / dtheta[:, np.newaxis],
+                       batch.mNrmSS[0], batch.aNrmSS[0],
+                       (batch.mNrmSS[hi] - batch.mNrmSS[lo]) / dtheta,
+                       (batch.aNrmSS[hi] - batch.aNrmSS[lo]) / dtheta,
+                       row, drow)
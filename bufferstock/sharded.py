@@ -0,0 +1,147 @@
+'''
+Simulation split into shards of agents that run in a pool of processes.
+
+HARK draws every shock from one sequential RandomState, so a simulation cannot
+be split without changing its results.  Here the shocks come from the
+counter-based random numbers of counter.py, so an agent draws the same shocks
+whichever shard it is simulated in.  Histories are put back together
+agent by agent, and reducers are kept for fixed blocks of agents and merged in
+block order, so histories and aggregates are bit-identical for any number of
+shards or processes.
+'''
+import multiprocessing
+import os
+from copy import deepcopy
+
+import numpy as np
+
+from .counter import CounterDraws, counter_sim_one_period, initialize_counter_sim
+from .history import HistoryStore
+
+
+def _simulate_shard(job):
+    '''
+    Simulate one shard of agents (in a worker process).
+    Inputs:
+       job: tuple (agent, draws, blocks, sim_periods, track_vars, reducers, by, store),
+            where blocks is a list of (first id, last id + 1) of the shard's blocks
+    Returns:
+       histories:      dict of var_name -> array (sim_periods, agents in the shard),
+                       empty when the store is memory-mapped and the shard has
+                       written straight into the files
+       block_reducers: list with a copy of the reducers for each block
+    '''
+    agent, draws, blocks, sim_periods, track_vars, reducers, by, store = job
+    agent = deepcopy(agent)
+    agent.T_sim = sim_periods
+    first, last = blocks[0][0], blocks[-1][1]
+    if store.mapped:
+        # Write into this shard's columns of the files the parent made
+        agent.track_vars = []
+        initialize_counter_sim(agent, draws, np.arange(first, last), store)
+        agent.track_vars = track_vars
+        for var_name in track_vars:
+            setattr(agent, var_name + '_hist', store.open(var_name, mode='r+')[:, first:last])
+    else:
+        agent.track_vars = track_vars
+        initialize_counter_sim(agent, draws, np.arange(first, last), store)
+    block_reducers = [deepcopy(reducers) for _ in blocks]
+
+    with np.errstate(divide='ignore', over='ignore', under='ignore', invalid='ignore'):
+        agent.timeFwd()
+        for t in range(sim_periods):
+            counter_sim_one_period(agent, draws)
+            for var_name in track_vars:
+                getattr(agent, var_name + '_hist')[agent.t_sim, :] = getattr(agent, var_name)
+            groups = np.asarray(getattr(agent, by), dtype=int)
+            for name, reducer in reducers.items():
+                x = reducer.values(agent)
+                for (lo, hi), block in zip(blocks, block_reducers):
+                    block[name].update(x[lo - first:hi - first], groups[lo - first:hi - first])
+            agent.t_sim += 1
+
+    if store.mapped:
+        for var_name in track_vars:
+            getattr(agent, var_name + '_hist').flush()
+        return {}, block_reducers
+    histories = {var_name: getattr(agent, var_name + '_hist') for var_name in track_vars}
+    return histories, block_reducers
+
+
+def simulate_sharded(agent, sim_periods=None, track_vars=None, reducers=None, seed=None,
+                     shards=None, processes=None, block_size=1000, by='t_age', store=None, bank=None):
+    '''
+    Simulate a solved agent's AgentCount agents in shards, using counter-based
+    random numbers (or the draws of a ShockBank).  The results depend on seed
+    and block_size but not on the number of shards or processes.
+    Inputs:
+       agent:       solved consumer type (cFunc unpacked, time flowing forward)
+       sim_periods: number of periods (defaults to agent.T_sim)
+       track_vars:  variables whose full histories are kept (defaults to agent.track_vars);
+                    they are stored on agent as <var>_hist, as simulate() does
+       reducers:    optional dict of name -> streaming Reducer; with more than one
+                    process their var must be an attribute name or a module level
+                    function, since lambdas cannot be sent to other processes
+       seed:        key of the random numbers (defaults to agent.seed)
+       shards:      number of shards (defaults to the number of processes)
+       processes:   number of worker processes; defaults to the number of cores,
+                    and 1 simulates every shard in this process
+       block_size:  number of agents per reducer block; shards are made of whole blocks
+       by:          integer agent attribute the reducers group by
+       store:       optional HistoryStore for the histories (float32, memory-mapped)
+       bank:        optional ShockBank, or variance-reduced draws from
+                    sampling.make_draws, to take the draws from instead of seed
+    Returns:
+       reducers: dict of name -> Reducer merged over all agents
+    '''
+    if sim_periods is None:
+        sim_periods = agent.T_sim
+    if track_vars is None:
+        track_vars = list(agent.track_vars)
+    if reducers is None:
+        reducers = {}
+    if seed is None:
+        seed = agent.seed
+    draws = CounterDraws(seed) if bank is None else bank
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if store is None:
+        store = HistoryStore()
+
+    edges = list(range(0, agent.AgentCount, block_size)) + [agent.AgentCount]
+    blocks = list(zip(edges[:-1], edges[1:]))
+    if shards is None:
+        shards = processes
+    shards = max(1, min(shards, len(blocks)))
+    jobs = [(agent, draws, [blocks[b] for b in run], sim_periods, track_vars, reducers, by, store)
+            for run in np.array_split(np.arange(len(blocks)), shards)]
+    histories = {var_name: store.allocate(var_name, (sim_periods, agent.AgentCount)) for var_name in track_vars}
+    if store.mapped:
+        for arr in histories.values():
+            arr.flush()
+
+    processes = min(processes, len(jobs))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_simulate_shard, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_simulate_shard(job) for job in jobs]
+
+    # Put the histories back together in agent order, and merge the block
+    # reducers in block order so that the sums are always done the same way
+    for var_name, arr in histories.items():
+        if store.mapped:
+            arr = store.open(var_name)
+        else:
+            arr[:] = np.concatenate([shard[var_name] for shard, _ in results], axis=1)
+        setattr(agent, var_name + '_hist', arr)
+    block_reducers = [block for _, shard_blocks in results for block in shard_blocks]
+    merged = deepcopy(block_reducers[0])
+    for block in block_reducers[1:]:
+        for name, reducer in merged.items():
+            reducer.merge(block[name])
+    return merged
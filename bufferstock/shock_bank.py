@@ -0,0 +1,89 @@
+'''
+A bank of pre-drawn shocks shared by several agent types.
+
+Comparing scenarios (occupations, growth rates, discount factors) with
+independent shocks leaves Monte Carlo noise in every difference between them.
+A ShockBank holds one set of standardized draws per agent and period (death,
+birth, permanent, transitory and unemployment uniforms); every scenario
+simulated from it maps the same uniforms through its own distributions, so
+the noise largely cancels out of between-scenario differences.  The bank is
+drawn once, is read-only, and can be saved and memory-mapped so that worker
+processes share one copy.
+'''
+import os
+
+import numpy as np
+
+from .counter import counter_uniforms, DEATH_STREAM, BIRTH_STREAM, INCOME_STREAM
+
+STREAMS = {'death': DEATH_STREAM, 'birth': BIRTH_STREAM, 'income': INCOME_STREAM}
+
+
+class ShockBank(object):
+    '''
+    Standardized draws for AgentCount agents over periods 0..T_sim.
+    Inputs:
+       draws: dict of stream name -> array (T_sim+1, AgentCount, 4) of uniforms;
+              period 0 holds the draws of the initial population
+    '''
+    def __init__(self, draws):
+        self.draws = {}
+        for name, arr in draws.items():
+            if not isinstance(arr, np.memmap):
+                arr = np.asarray(arr)
+                arr.setflags(write=False)
+            self.draws[STREAMS[name]] = arr
+
+    @classmethod
+    def draw(cls, T_sim, AgentCount, seed=0):
+        '''
+        Fill a bank from the counter-based generator, so that it holds exactly
+        the draws simulate_sharded would make with the same seed.
+        '''
+        ids = np.arange(AgentCount)
+        return cls({name: np.stack([counter_uniforms(seed, stream, period, ids) for period in range(T_sim + 1)])
+                    for name, stream in STREAMS.items()})
+
+    @property
+    def T_sim(self):
+        return self.draws[INCOME_STREAM].shape[0] - 1
+
+    @property
+    def AgentCount(self):
+        return self.draws[INCOME_STREAM].shape[1]
+
+    def uniforms(self, stream, period, agent_ids):
+        '''
+        The banked draws of the given agents, array (len(agent_ids), 4).
+        '''
+        if period > self.T_sim:
+            raise ValueError('The shock bank only holds {} periods'.format(self.T_sim))
+        return self.draws[stream][period, agent_ids]
+
+    def save(self, directory):
+        '''
+        Write the bank to a directory of .npy files.
+        '''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, stream in STREAMS.items():
+            np.save(os.path.join(directory, name + '.npy'), self.draws[stream])
+
+    @classmethod
+    def load(cls, directory):
+        '''
+        Map a saved bank read-only, without reading it into memory.
+        '''
+        return cls({name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in STREAMS})
+
+
+def bank_for(agents, seed=0):
+    '''
+    Draw one bank big enough for every agent type in a comparison.
+    Inputs:
+       agents: list of agent types to be simulated with the bank
+       seed:   key of the draws
+    Returns:
+       bank: ShockBank covering max(T_sim) periods and max(AgentCount) agents
+    '''
+    return ShockBank.draw(max(agent.T_sim for agent in agents), max(agent.AgentCount for agent in agents), seed)
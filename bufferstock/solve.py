@@ -0,0 +1,499 @@
+'''
+Build consumer types from ParamSpecs and solve them, reusing cached solutions
+when the same model has been solved before.
+
+Infinite horizon models can be warm started: instead of iterating from the
+terminal solution c_T(m) = m, the iteration starts from the converged solution
+of a neighbouring model, which is usually only a few cycles away.  That only
+pays under a consumption function criterion such as metric='mean_abs' (24
+cycles instead of 33 for the Table 2 g=1.03 model); under HARK's own criterion
+it can take more cycles (98 instead of 87), so there the iteration starts cold.
+A warm started solution differs from the cold one by up to the tolerance, so
+it is never written to the solution cache.
+
+Finite horizon (cycles=1) models are solved one period at a time.  Each period
+is keyed on its own solver inputs and on the key of the period after it, so a
+lifecycle model whose last periods match those of a model solved before (the
+shared retirement tail of the occupation profiles, say) only re-solves the
+periods before the first difference.  With a SolutionCache the periods are
+also kept on disk, so this holds across runs too.
+'''
+import hashlib
+import warnings
+from copy import deepcopy
+from time import time
+
+import numpy as np
+from HARK.core import solveOneCycle
+from HARK.utilities import getArgNames
+from HARK.ConsumptionSaving.ConsIndShockModel import IndShockConsumerType, PerfForesightConsumerType
+
+from .cache import PeriodMemo, cFunc_knots
+from .steady_state import attach_steady_states
+
+AGENT_TYPES = {'IndShockConsumerType': IndShockConsumerType,
+               'PerfForesightConsumerType': PerfForesightConsumerType}
+
+# Escape clause for the infinite horizon iteration, as in HARK's solveAgent
+MAX_CYCLES = 5000
+
+# One period solutions shared by every finite horizon solve in this process
+PERIOD_MEMO = PeriodMemo()
+
+
+def make_agent(spec):
+    '''
+    Construct an (unsolved) consumer type described by a ParamSpec.
+    '''
+    return AGENT_TYPES[spec.agent_type](cycles=spec.cycles, **spec.to_dict())
+
+
+def attach_solution(agent, solution):
+    '''
+    Give an agent a solution list (in chronological order) as if agent.solve()
+    had produced it.
+    '''
+    agent.timeFwd()
+    agent.solution = solution
+    agent.addToTimeVary('solution')
+    agent.postSolve()
+
+
+def initial_guess(initial):
+    '''
+    Turn a warm start argument into the one period solution to iterate from.
+    Inputs:
+       initial: a solved agent, a solution list in chronological order, or a
+                single one period solution
+    Returns:
+       solution_next: the solution of the first period of the (next) cycle
+    '''
+    if hasattr(initial, 'solution'):
+        initial = initial.solution
+    if isinstance(initial, list):
+        initial = initial[0]
+    return initial
+
+
+def _digest_update(h, value):
+    '''
+    Feed a solver input (number, array, list, function...) into a hash.
+    '''
+    if isinstance(value, np.ndarray):
+        h.update('array{}{}'.format(value.dtype, value.shape).encode('utf-8'))
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update('[{}'.format(len(value)).encode('utf-8'))
+        for x in value:
+            _digest_update(h, x)
+    elif callable(value) and hasattr(value, '__name__'):
+        h.update('{}.{}'.format(getattr(value, '__module__', ''), value.__name__).encode('utf-8'))
+    elif isinstance(value, (float, int, np.generic)) and not isinstance(value, bool):
+        h.update(repr(float(value)).encode('utf-8'))
+    else:
+        h.update(repr(value).encode('utf-8'))
+
+
+def period_inputs(agent, t):
+    '''
+    The one period solver of an agent in period t (time flowing forward) and the
+    inputs it takes, other than solution_next.
+    '''
+    if 'solveOnePeriod' in agent.time_vary:
+        solver = agent.solveOnePeriod[t]
+    else:
+        solver = agent.solveOnePeriod
+    inputs = {}
+    for name in getArgNames(solver):
+        if name == 'solution_next':
+            continue
+        if name in agent.time_vary:
+            inputs[name] = getattr(agent, name)[t]
+        else:
+            inputs[name] = getattr(agent, name)
+    return solver, inputs
+
+
+def period_key(solver, inputs, key_next):
+    '''
+    Hash identifying the solution of one period: its solver, its inputs and the
+    key of the period after it.
+    '''
+    h = hashlib.sha256(key_next.encode('utf-8'))
+    _digest_update(h, solver)
+    for name in sorted(inputs):
+        h.update(name.encode('utf-8'))
+        _digest_update(h, inputs[name])
+    return h.hexdigest()
+
+
+def period_keys(agent):
+    '''
+    Keys of every period of a cycles=1 agent (after preSolve, time flowing
+    forward), each chained with the key of the period after it.
+    '''
+    # The terminal solution only depends on the agent type and on inputs
+    # (CRRA) that are also inputs of every period
+    key = type(agent).__name__
+    keys = [None] * agent.T_cycle
+    for t in reversed(range(agent.T_cycle)):
+        solver, inputs = period_inputs(agent, t)
+        key = period_key(solver, inputs, key)
+        keys[t] = key
+    return keys
+
+
+def spec_period_keys(spec):
+    '''
+    Keys of every period of a finite horizon spec (see period_keys), without
+    solving it.  Specs whose keys end the same way share those periods.
+    '''
+    agent = make_agent(spec)
+    agent.timeFwd()
+    agent.preSolve()
+    return period_keys(agent)
+
+
+def _solve_period(agent, t, key, solution_next, memo, cache):
+    '''
+    One step of backward induction, looking the period up in memo and cache first.
+    Returns:
+       solution_t: the solution of period t
+       solved:     whether it had to be solved
+    '''
+    solution_t = memo.get(key) if memo is not None else None
+    if solution_t is None and cache is not None:
+        solution_t = cache.get_period(key)
+        if solution_t is not None and memo is not None:
+            memo.put(key, solution_t)
+    if solution_t is not None:
+        return solution_t, False
+    solver, inputs = period_inputs(agent, t)
+    solution_t = solver(solution_next=solution_next, **inputs)
+    if memo is not None:
+        memo.put(key, solution_t)
+    if cache is not None:
+        cache.put_period(key, solution_t)
+    return solution_t, True
+
+
+def solve_tail(spec, periods, memo=PERIOD_MEMO, cache=None):
+    '''
+    Solve only the last periods of a finite horizon spec, e.g. those it shares
+    with other specs that are about to be solved side by side.
+    Inputs:
+       spec:    ParamSpec with cycles = 1
+       periods: number of periods at the end of its life to solve
+       memo:    PeriodMemo shared between solves, or None
+       cache:   optional SolutionCache of single periods
+    Returns:
+       tail: dict of period key -> one period solution
+    '''
+    agent = make_agent(spec)
+    tail = {}
+    with np.errstate(divide='ignore', over='ignore', under='ignore', invalid='ignore'):
+        agent.timeFwd()
+        agent.preSolve()
+        keys = period_keys(agent)
+        solution_next = agent.solution_terminal
+        for t in reversed(range(agent.T_cycle - periods, agent.T_cycle)):
+            solution_next, _ = _solve_period(agent, t, keys[t], solution_next, memo, cache)
+            tail[keys[t]] = solution_next
+    return tail
+
+
+def solve_finite(agent, memo=PERIOD_MEMO, cache=None):
+    '''
+    Backward induction for a cycles=1 agent, reusing any trailing periods that
+    are already in memo or in the cache.  Gives the same solution as agent.solve().
+    Inputs:
+       agent: a HARK consumer type with cycles = 1
+       memo:  PeriodMemo shared between solves, or None to share nothing
+       cache: optional SolutionCache that keeps single periods between runs
+    Returns:
+       solved_periods: number of periods that had to be solved
+    '''
+    with np.errstate(divide='ignore', over='ignore', under='ignore', invalid='ignore'):
+        agent.preSolve()
+        original_time_flow = agent.time_flow
+        agent.timeFwd()
+
+        T = agent.T_cycle
+        keys = period_keys(agent)
+        solution = [None] * T
+        solution_next = agent.solution_terminal
+        solved_periods = 0
+        for t in reversed(range(T)):
+            solution_t, solved = _solve_period(agent, t, keys[t], solution_next, memo, cache)
+            solved_periods += solved
+            solution[t] = solution_t
+            solution_next = solution_t
+        if not agent.pseudo_terminal:
+            solution.append(deepcopy(agent.solution_terminal))
+
+        agent.solution = solution
+        if not original_time_flow:
+            agent.timeRev()
+            agent.solution.reverse()
+        agent.addToTimeVary('solution')
+        agent.postSolve()
+
+    agent.solved_periods = solved_periods
+    return solved_periods
+
+
+def _metric_grid(agent, solution):
+    '''
+    Market resources m_i at which the "mean_abs" and "max_abs" metrics compare
+    consumption functions: the agent's asset grid above this period's minimum m.
+    '''
+    grid = np.asarray(getattr(agent, 'aXtraGrid', DEFAULT_METRIC_GRID))
+    return getattr(solution, 'mNrmMin', 0.0) + grid
+
+
+def hark_distance(agent, solution_now, solution_last):
+    '''
+    HARK's own distance: the largest change in the nodes of the marginal value function.
+    '''
+    return solution_now.distance(solution_last)
+
+
+def mean_abs_distance(agent, solution_now, solution_last):
+    '''
+    The notebook's criterion, (1/n) sum_i |c_t(m_i) - c_{t+1}(m_i)|.
+    '''
+    m = _metric_grid(agent, solution_now)
+    return np.nanmean(np.abs(solution_now.cFunc(m) - solution_last.cFunc(m)))
+
+
+def max_abs_distance(agent, solution_now, solution_last):
+    '''
+    max_i |c_t(m_i) - c_{t+1}(m_i)|
+    '''
+    m = _metric_grid(agent, solution_now)
+    return np.nanmax(np.abs(solution_now.cFunc(m) - solution_last.cFunc(m)))
+
+
+# Distance metrics that can be named in a ParamSpec (metric='mean_abs')
+METRICS = {'hark': hark_distance,
+           'mean_abs': mean_abs_distance,
+           'max_abs': max_abs_distance}
+
+# Convergence criterion of solve_continuation and parameter_path: the notebook's
+# mean absolute change in c(m) below 0.0005, under which warm starts pay
+CONTINUATION_METRIC = 'mean_abs'
+CONTINUATION_TOLERANCE = 0.0005
+
+# Points used by the consumption metrics for agents without an asset grid
+DEFAULT_METRIC_GRID = np.linspace(0.0, 20.0, 48)
+
+
+def solve_agent(agent, initial=None, tolerance=None, max_cycles=None, metric=None, cache=None):
+    '''
+    Solve an agent in place, like agent.solve(), optionally warm starting an
+    infinite horizon model from a previous solution.
+
+    The convergence controls default to attributes of the agent, so they can
+    also be set in a ParamSpec (tolerance=1e-4, max_cycles=200, metric='mean_abs'),
+    where they become part of the cache key.  A per-cycle trace of dicts with
+    keys cycle, distance, time and grid_size is stored in agent.solve_trace.
+    Inputs:
+       agent:      a HARK consumer type
+       initial:    optional solved agent (or solution) of a neighbouring model of
+                   the same type to start the iteration from; ignored (with a
+                   warning) under metric 'hark', where it does not save cycles
+       tolerance:  stop once the distance between successive cycles is this small
+       max_cycles: give up (with a warning) after this many cycles
+       metric:     name in METRICS, or a function (agent, solution_now, solution_last)
+       cache:      optional SolutionCache keeping the single periods of a finite
+                   horizon model (see solve_finite)
+    Returns:
+       completed_cycles: number of cycles iterated, also stored on the agent
+    '''
+    if agent.cycles == 1:
+        solve_finite(agent, cache=cache)
+        agent.completed_cycles = 1
+        return 1
+    if agent.cycles != 0:
+        agent.solve()
+        agent.completed_cycles = agent.cycles
+        return agent.completed_cycles
+
+    if tolerance is None:
+        tolerance = agent.tolerance
+    if max_cycles is None:
+        max_cycles = getattr(agent, 'max_cycles', MAX_CYCLES)
+    if metric is None:
+        metric = getattr(agent, 'metric', 'hark')
+    distance = METRICS[metric] if not callable(metric) else metric
+    if metric == 'hark' and initial is not None:
+        warnings.warn("Warm start ignored under metric 'hark', where it does not save cycles; "
+                      "set metric='mean_abs' (and a tolerance) in the spec to use it")
+        initial = None
+    agent.warm_started = initial is not None
+
+    trace = []
+    with np.errstate(divide='ignore', over='ignore', under='ignore', invalid='ignore'):
+        agent.preSolve()
+        original_time_flow = agent.time_flow
+        agent.timeRev()
+
+        if initial is None:
+            solution_last = agent.solution_terminal
+        else:
+            solution_last = initial_guess(initial)
+
+        go = True
+        converged = False
+        completed_cycles = 0
+        t_last = time()
+        while go:
+            solution_cycle = solveOneCycle(agent, solution_last)
+            solution_now = solution_cycle[-1]
+            completed_cycles += 1
+            # The terminal solution is never accepted as converged, but a warm
+            # start that is already close enough is
+            if completed_cycles > 1 or initial is not None:
+                solution_distance = distance(agent, solution_now, solution_last)
+                converged = solution_distance <= tolerance
+                go = not converged and completed_cycles < max_cycles
+            else:
+                solution_distance = np.nan
+            t_now = time()
+            knots = cFunc_knots(solution_now.cFunc)
+            trace.append({'cycle': completed_cycles,
+                          'distance': float(solution_distance),
+                          'time': t_now - t_last,
+                          'grid_size': len(knots[0]) if knots is not None else 0})
+            t_last = t_now
+            solution_last = solution_now
+
+        if original_time_flow:
+            agent.timeFwd()
+        agent.solution = solution_cycle
+        if agent.time_flow:
+            agent.solution.reverse()
+        agent.addToTimeVary('solution')
+        agent.postSolve()
+
+    agent.completed_cycles = completed_cycles
+    agent.converged = converged
+    agent.solve_trace = trace
+    if not converged:
+        warnings.warn('Solution did not converge in {} cycles (distance {:.3g}, tolerance {:.3g})'.format(
+            completed_cycles, trace[-1]['distance'], tolerance))
+    return completed_cycles
+
+
+def solve_solution(spec, initial=None, cache=None):
+    '''
+    Solve the model described by spec from scratch (or from a warm start).
+    Inputs:
+       spec:    ParamSpec of the model
+       initial: optional solved agent to warm start an infinite horizon model from
+       cache:   optional SolutionCache of single finite horizon periods
+    Returns:
+       solution: list of per-period solutions in chronological order
+    '''
+    agent = make_agent(spec)
+    agent.timeFwd()
+    solve_agent(agent, initial, cache=cache)
+    return agent.solution
+
+
+def agent_from_solution(spec, solution):
+    '''
+    Make the consumer type described by spec and give it an existing solution.
+    Returns:
+       agent: the solved consumer type, with cFunc unpacked and time flowing forward
+    '''
+    agent = make_agent(spec)
+    attach_solution(agent, solution)
+    agent.unpackcFunc()
+    agent.timeFwd()
+    return agent
+
+
+def attach_targets(agents):
+    '''
+    Store the target wealth (mNrmSS, aNrmSS, mGrowthSlopeSS) on the solutions of
+    the infinite horizon agents in the list, finding all the missing ones in a
+    single vectorized root find.  Agents whose solution already carries the
+    targets (e.g. loaded from the cache) are left alone.
+    '''
+    todo = [agent for agent in agents
+            if agent.cycles == 0 and not hasattr(agent.solution[0], 'aNrmSS')]
+    if todo:
+        attach_steady_states(todo)
+
+
+def solve_spec(spec, cache=None, initial=None):
+    '''
+    Make and solve the consumer type described by spec.
+    Inputs:
+       spec:    ParamSpec of the model
+       cache:   optional SolutionCache; on a hit no backward induction is done
+       initial: optional solved agent of a neighbouring model to warm start from
+                (see solve_agent); a warm started solve is not added to the cache
+    Returns:
+       agent: the solved consumer type, with cFunc unpacked and time flowing forward
+    '''
+    entry = cache.get(spec) if cache is not None else None
+    if entry is not None:
+        agent = agent_from_solution(spec, entry['solution'])
+        attach_targets([agent])
+        return agent
+    agent = make_agent(spec)
+    agent.timeFwd()
+    solve_agent(agent, initial, cache=cache)
+    agent.unpackcFunc()
+    agent.timeFwd()
+    attach_targets([agent])
+    # A warm started solution depends on where it started, so only cold solves are cached
+    if cache is not None and not getattr(agent, 'warm_started', False):
+        cache.put(spec, agent)
+    return agent
+
+
+def _continuation_spec(spec, metric, tolerance):
+    '''
+    Give a spec the convergence criterion of a continuation, unless it has its own.
+    '''
+    if metric is None or 'metric' in spec:
+        return spec
+    return spec.replace(metric=metric, tolerance=tolerance)
+
+
+def parameter_path(spec, name, values, metric=CONTINUATION_METRIC, tolerance=CONTINUATION_TOLERANCE):
+    '''
+    Make the specs along a path in one parameter, e.g.
+    parameter_path(base_params, 'PermGroFac', [[1.02], [1.03], [1.04]]).
+    Unless spec sets its own metric, they get the criterion metric and
+    tolerance (None leaves them as they are), under which warm starts pay.
+    '''
+    return [_continuation_spec(spec.replace(**{name: value}), metric, tolerance) for value in values]
+
+
+def solve_continuation(specs, cache=None, initial=None, metric=CONTINUATION_METRIC,
+                       tolerance=CONTINUATION_TOLERANCE):
+    '''
+    Solve a sequence of neighbouring models, warm starting each one from the
+    converged solution of the one before it.
+    Inputs:
+       specs:     list of ParamSpecs ordered along the parameter path
+       cache:     optional SolutionCache
+       initial:   optional solved agent to warm start the first model from
+       metric:    convergence metric given to specs that do not set one (under
+                  HARK's own criterion a warm start is not used); None keeps
+                  the specs as they are
+       tolerance: tolerance that goes with metric
+    Returns:
+       agents: list of solved consumer types, in the same order as specs
+    '''
+    agents = []
+    for spec in specs:
+        spec = _continuation_spec(spec, metric, tolerance)
+        agent = solve_spec(spec, cache, initial)
+        agents.append(agent)
+        initial = agent
+    return agents
@@ -0,0 +1,180 @@
+'''
+Evaluate many HARK consumption functions at once.
+
+LinearInterp and CubicInterp (and the LowerEnvelope of one of them with a
+linear borrowing constraint) are all piecewise cubics in the same form as
+HARK's CubicInterp: NaN below the first node, a cubic in alpha on each segment,
+and a decay towards a limiting line above the last node.  A StackedFunc holds
+the coefficients of K such functions, padded to a common number of nodes, and
+evaluates them (and their derivatives) row by row with array operations.
+'''
+import numpy as np
+from HARK.interpolation import LinearInterp, CubicInterp, LowerEnvelope
+
+from .utilities import batch_searchsorted
+
+
+def _linear_coeffs(func):
+    '''
+    Nodes and cubic coefficients equivalent to a HARK LinearInterp.
+    '''
+    x, y = np.asarray(func.x_list, dtype=float), np.asarray(func.y_list, dtype=float)
+    coeffs = np.zeros((x.size + 1, 4))
+    coeffs[0] = np.nan
+    coeffs[1:-1, 0] = y[:-1]
+    coeffs[1:-1, 1] = np.diff(y)
+    if func.decay_extrap:
+        coeffs[-1] = [func.intercept_limit, func.slope_limit, func.decay_extrap_A, -func.decay_extrap_B]
+    else:
+        slope = (y[-1] - y[-2]) / (x[-1] - x[-2])
+        coeffs[-1] = [y[-1] - slope * x[-1], slope, 0., 0.]
+    return x, coeffs
+
+
+def _cubic_coeffs(func):
+    '''
+    Nodes and coefficients of a HARK CubicInterp.
+    '''
+    return np.asarray(func.x_list, dtype=float), np.asarray(func.coeffs, dtype=float)
+
+
+def _constraint(func):
+    '''
+    (x0, y0, slope) of a two node LinearInterp used as a borrowing constraint.
+    '''
+    x, y = func.x_list, func.y_list
+    return x[0], y[0], (y[1] - y[0]) / (x[1] - x[0])
+
+
+def _split(func):
+    '''
+    Separate a consumption function into its smooth part and (optionally) the
+    linear constraint it is lower-enveloped with.
+    '''
+    if isinstance(func, LowerEnvelope):
+        smooth = [f for f in func.functions if not (isinstance(f, LinearInterp) and f.x_n == 2)]
+        cnst = [f for f in func.functions if isinstance(f, LinearInterp) and f.x_n == 2]
+        if len(smooth) == 1 and len(cnst) == 1:
+            return smooth[0], _constraint(cnst[0])
+        if len(smooth) == 0 and len(cnst) == 2:
+            return cnst[0], _constraint(cnst[1])
+        raise ValueError('Can only stack the lower envelope of one function and one linear constraint')
+    return func, (np.inf, 0., 0.)
+
+
+class StackedFunc(object):
+    '''
+    K one dimensional HARK functions evaluated together.
+    Inputs:
+       x_list:   array (K, N) of nodes, padded above each row's last node
+       coeffs:   array (K, N+1, 4) of CubicInterp style coefficients
+       n:        array (K,) with the number of real nodes in each row
+       cnst:     array (K, 3) of (x0, y0, slope) constraints, x0 = inf for none
+       closed:   array (K,) of bools, True where the function is defined at its first node
+    '''
+    def __init__(self, x_list, coeffs, n, cnst, closed):
+        self.x_list = x_list
+        self.coeffs = coeffs
+        self.n = n
+        self.cnst = cnst
+        self.closed = closed
+
+    @classmethod
+    def from_functions(cls, functions):
+        '''
+        Stack a list of LinearInterp / CubicInterp functions, possibly wrapped in
+        a LowerEnvelope with a linear borrowing constraint.
+        '''
+        parts = []
+        cnst = []
+        closed = []
+        for func in functions:
+            smooth, constraint = _split(func)
+            if isinstance(smooth, CubicInterp):
+                parts.append(_cubic_coeffs(smooth))
+            elif isinstance(smooth, LinearInterp):
+                parts.append(_linear_coeffs(smooth))
+            else:
+                raise TypeError('Cannot stack a {}'.format(type(smooth).__name__))
+            cnst.append(constraint)
+            closed.append(isinstance(smooth, LinearInterp))
+
+        K = len(parts)
+        N = max(x.size for x, _ in parts)
+        x_list = np.zeros((K, N))
+        coeffs = np.zeros((K, N + 1, 4))
+        n = np.zeros(K, dtype=int)
+        for k, (x, c) in enumerate(parts):
+            n[k] = x.size
+            x_list[k, :x.size] = x
+            # Padding nodes sit above the real ones, so queries there are treated
+            # as extrapolation once pos is capped at n
+            x_list[k, x.size:] = x[-1] + 1. + np.arange(N - x.size)
+            coeffs[k, :x.size + 1] = c
+        return cls(x_list, coeffs, n, np.array(cnst, dtype=float), np.array(closed))
+
+    def __len__(self):
+        return self.n.size
+
+    def eval_with_derivative(self, x):
+        '''
+        Evaluate every function and its derivative.
+        Inputs:
+           x: array (K,) or (K, M)
+        Returns:
+           y, dydx: arrays of the same shape as x
+        '''
+        x = np.asarray(x, dtype=float)
+        flat = x.ndim == 1
+        if flat:
+            x = x[:, np.newaxis]
+        K = x.shape[0]
+        rows = np.arange(K)[:, np.newaxis]
+        n = self.n[:, np.newaxis]
+
+        pos = np.minimum(batch_searchsorted(self.x_list, x), n)
+        c = self.coeffs[rows, pos]
+        c0, c1, c2, c3 = c[..., 0], c[..., 1], c[..., 2], c[..., 3]
+        y = np.full(x.shape, np.nan)
+        dydx = np.full(x.shape, np.nan)
+
+        inside = (pos > 0) & (pos < n)
+        lo = self.x_list[rows, np.maximum(pos - 1, 0)]
+        hi = self.x_list[rows, np.minimum(pos, self.x_list.shape[1] - 1)]
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            span = hi - lo
+            alpha = (x - lo) / span
+            y_in = c0 + alpha * (c1 + alpha * (c2 + alpha * c3))
+            d_in = (c1 + alpha * (2. * c2 + alpha * 3. * c3)) / span
+            top_alpha = x - self.x_list[rows, n - 1]
+            decay = np.exp(top_alpha * c3)
+            y_top = c0 + x * c1 - c2 * decay
+            d_top = c1 - c2 * c3 * decay
+        y[inside] = y_in[inside]
+        dydx[inside] = d_in[inside]
+        top = pos == n
+        y[top] = y_top[top]
+        dydx[top] = d_top[top]
+        # LinearInterp (unlike CubicInterp) is defined exactly at its first node
+        at_first = (x == self.x_list[:, :1]) & self.closed[:, np.newaxis]
+        k = np.nonzero(at_first)[0]
+        y[at_first] = self.coeffs[k, 1, 0]
+        dydx[at_first] = self.coeffs[k, 1, 1] / (self.x_list[k, 1] - self.x_list[k, 0])
+
+        # Lower envelope with the borrowing constraint
+        x0, y0, slope = self.cnst[:, 0:1], self.cnst[:, 1:2], self.cnst[:, 2:3]
+        with np.errstate(invalid='ignore'):
+            y_cnst = np.where(x >= x0, y0 + slope * (x - x0), np.nan)
+            use_cnst = (y_cnst < y) | (np.isnan(y) & ~np.isnan(y_cnst))
+        y = np.where(use_cnst, y_cnst, y)
+        dydx = np.where(use_cnst, np.broadcast_to(slope, x.shape), dydx)
+
+        if flat:
+            return y[:, 0], dydx[:, 0]
+        return y, dydx
+
+    def __call__(self, x):
+        return self.eval_with_derivative(x)[0]
+
+    def derivative(self, x):
+        return self.eval_with_derivative(x)[1]
@@ -0,0 +1,151 @@
+'''
+Target (steady state) wealth of many solved buffer-stock models at once.
+
+The target is the m at which market resources are expected to stay put,
+E_t[m_{t+1}/m_t] = 1, with
+
+    E_t[m_{t+1}] = (R/G)*(m_t - c(m_t))*E[1/psi] + E[psi*theta]
+
+HARK's addSSmNrm leaves out E[1/psi] (treats it as one), and so does
+find_targets by default, so that mNrmSS agrees with the value HARK reports.
+All K roots are found together by Newton steps that fall back on bisection
+whenever they would leave the current bracket.
+'''
+import numpy as np
+
+from .stack import StackedFunc
+
+
+class SteadyState(object):
+    '''
+    Targets of K models.
+    Attributes:
+       mNrmSS:    array (K,) of target market resources (NaN where there is none)
+       aNrmSS:    array (K,) of target end-of-period assets, mNrmSS - c(mNrmSS)
+       cNrmSS:    array (K,) of consumption at the target
+       slope:     array (K,) of d E[m_{t+1}/m_t] / dm at the target; negative
+                  when the target is stable
+       converged: array (K,) of bools
+    '''
+    def __init__(self, mNrmSS, aNrmSS, cNrmSS, slope, converged):
+        self.mNrmSS = mNrmSS
+        self.aNrmSS = aNrmSS
+        self.cNrmSS = cNrmSS
+        self.slope = slope
+        self.converged = converged
+
+    def __len__(self):
+        return self.mNrmSS.size
+
+
+def find_targets(cFunc, mNrmMin, PermGroFac, Rfree, ExIncNext=1.0, ExPermShkInv=1.0,
+                 m_max=1000., tol=1e-12, max_iter=100):
+    '''
+    Solve E[m_{t+1}] = m_t for K models with a safeguarded, vectorized Newton method.
+    Inputs:
+       cFunc:        object whose eval_with_derivative maps an array (K,) of m to
+                     (c, dc/dm), e.g. a StackedFunc
+       mNrmMin:      array (K,) of the lowest feasible m
+       PermGroFac, Rfree, ExIncNext, ExPermShkInv: scalars or arrays (K,)
+       m_max:        upper end of the search; models with no target below it get NaN
+       tol:          convergence tolerance on the change in m
+       max_iter:     cap on Newton / bisection steps
+    Returns:
+       targets: SteadyState
+    '''
+    mNrmMin = np.asarray(mNrmMin, dtype=float)
+    K = mNrmMin.size
+    RNrm = np.broadcast_to(np.asarray(Rfree, dtype=float) / np.asarray(PermGroFac, dtype=float)
+                           * np.asarray(ExPermShkInv, dtype=float), (K,))
+    ExInc = np.broadcast_to(np.asarray(ExIncNext, dtype=float), (K,))
+
+    def gap(m):
+        # E[m_{t+1}] - m_t and its derivative
+        c, dc = cFunc.eval_with_derivative(m)
+        return RNrm * (m - c) + ExInc - m, RNrm * (1. - dc) - 1.
+
+    # Bracket the root: expected resources rise at the bottom and fall at the top
+    lo = mNrmMin + 1e-10 * np.maximum(1., np.abs(mNrmMin))
+    hi = np.maximum(lo + ExInc, 1.)
+    g_hi = gap(hi)[0]
+    while True:
+        grow = (g_hi > 0.) & (hi < m_max)
+        if not np.any(grow):
+            break
+        hi = np.where(grow, np.minimum(2. * hi, m_max), hi)
+        g_hi = gap(hi)[0]
+    found = (gap(lo)[0] > 0.) & (g_hi <= 0.)
+
+    m = 0.5 * (lo + hi)
+    converged = ~found
+    for _ in range(max_iter):
+        g, dg = gap(m)
+        lo = np.where(g > 0., m, lo)
+        hi = np.where(g > 0., hi, m)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = m - g / dg
+        bad = ~((step > lo) & (step < hi))
+        m_new = np.where(bad, 0.5 * (lo + hi), step)
+        done = np.abs(m_new - m) <= tol * np.maximum(1., np.abs(m))
+        m = np.where(converged, m, m_new)
+        converged = converged | done
+        if np.all(converged):
+            break
+
+    c, dc = cFunc.eval_with_derivative(m)
+    mNrmSS = np.where(found, m, np.nan)
+    cNrmSS = np.where(found, c, np.nan)
+    # d/dm of E[m_{t+1}]/m at a point where E[m_{t+1}] = m
+    slope = np.where(found, (RNrm * (1. - dc) - 1.) / m, np.nan)
+    return SteadyState(mNrmSS, mNrmSS - cNrmSS, cNrmSS, slope, converged & found)
+
+
+def _shock_moments(agent):
+    '''
+    E[psi*theta] and E[1/psi] under the agent's first period income distribution.
+    '''
+    ShkPrbs, PermShkVals, TranShkVals = agent.IncomeDstn[0]
+    return np.dot(ShkPrbs, PermShkVals * TranShkVals), np.dot(ShkPrbs, 1. / PermShkVals)
+
+
+def steady_states(agents, t=0, exact=False):
+    '''
+    Find the target wealth of many solved agents in one vectorized root find.
+    Inputs:
+       agents: list of solved consumer types (IndShockConsumerType or
+               PerfForesightConsumerType) with their solutions in chronological order
+       t:      period of the solution to use
+       exact:  include E[1/psi] in the expectation of next period's m instead of
+               following HARK's addSSmNrm
+    Returns:
+       targets: SteadyState, one entry per agent
+    '''
+    cFunc = StackedFunc.from_functions([agent.solution[t].cFunc for agent in agents])
+    mNrmMin = np.array([agent.solution[t].mNrmMin for agent in agents], dtype=float)
+    PermGroFac = np.array([agent.PermGroFac[t] for agent in agents], dtype=float)
+    Rfree = np.array([agent.Rfree for agent in agents], dtype=float)
+    ExInc = np.ones(len(agents))
+    ExPermShkInv = np.ones(len(agents))
+    for k, agent in enumerate(agents):
+        if hasattr(agent, 'IncomeDstn'):
+            ExInc[k], ExPermShkInv[k] = _shock_moments(agent)
+    if not exact:
+        ExPermShkInv[:] = 1.
+    return find_targets(cFunc, mNrmMin, PermGroFac, Rfree, ExInc, ExPermShkInv)
+
+
+def attach_steady_states(agents, t=0, exact=False):
+    '''
+    Compute the targets of solved agents and store them on their period t
+    solutions as mNrmSS, aNrmSS and mGrowthSlopeSS, so they travel (and are
+    cached) with the solution.
+    Returns:
+       targets: SteadyState
+    '''
+    targets = steady_states(agents, t, exact)
+    for k, agent in enumerate(agents):
+        solution = agent.solution[t]
+        solution.mNrmSS = targets.mNrmSS[k] if targets.converged[k] else None
+        solution.aNrmSS = targets.aNrmSS[k] if targets.converged[k] else None
+        solution.mGrowthSlopeSS = targets.slope[k] if targets.converged[k] else None
+    return targets
@@ -0,0 +1,288 @@
+'''
+Per-age statistics of a simulation, accumulated period by period.
+
+HARK's simulate() keeps every tracked variable as a T_sim x AgentCount history,
+although the tables and figures only use a few statistics of each age group.
+simulate_streaming() runs the same simulation but hands each period's values
+to online reducers (mean, variance, quantiles, histograms) grouped by age, so
+memory grows with the number of ages rather than with T_sim x AgentCount.
+'''
+import numpy as np
+import pandas as pd
+
+from .counter import counter_sim_one_period
+
+
+def _grow(arr, n, fill=0.):
+    '''
+    Pad the first axis of arr with fill up to length n.
+    '''
+    if arr.shape[0] >= n:
+        return arr
+    pad = np.full((n - arr.shape[0],) + arr.shape[1:], fill)
+    return np.concatenate([arr, pad], axis=0)
+
+
+class Reducer(object):
+    '''
+    Base class of the online reducers.
+    Inputs:
+       var: name of the agent attribute to reduce (e.g. 'aNrmNow'), or a function
+            of the agent returning an array (AgentCount,), e.g.
+            lambda agent: agent.cNrmNow*agent.pLvlNow
+    '''
+    def __init__(self, var):
+        self.var = var
+
+    def values(self, agent):
+        if callable(self.var):
+            return np.asarray(self.var(agent), dtype=float)
+        return np.asarray(getattr(agent, self.var), dtype=float)
+
+    def update(self, x, groups):
+        '''
+        Add one period of values x, array (AgentCount,), with their integer
+        age groups.
+        '''
+        raise NotImplementedError()
+
+    def merge(self, other):
+        '''
+        Fold in the statistics of another reducer of the same kind, e.g. one that
+        saw a different group of agents.
+        '''
+        raise NotImplementedError()
+
+    def result(self):
+        '''
+        Returns:
+           ages:   array of the age groups that have been seen
+           values: array with the statistic of each age group
+        '''
+        raise NotImplementedError()
+
+
+class Mean(Reducer):
+    '''
+    Mean of a variable by age.
+    '''
+    def __init__(self, var):
+        Reducer.__init__(self, var)
+        self.count = np.zeros(0)
+        self.total = np.zeros(0)
+
+    def update(self, x, groups):
+        n = max(groups.max() + 1, self.count.size)
+        self.count = _grow(self.count, n) + np.bincount(groups, minlength=n)
+        self.total = _grow(self.total, n) + np.bincount(groups, weights=x, minlength=n)
+
+    def merge(self, other):
+        n = max(self.count.size, other.count.size)
+        self.count = _grow(self.count, n) + _grow(other.count, n)
+        self.total = _grow(self.total, n) + _grow(other.total, n)
+
+    def result(self):
+        ages = np.nonzero(self.count)[0]
+        return ages, self.total[ages] / self.count[ages]
+
+
+class Variance(Reducer):
+    '''
+    Sample variance (ddof=1) of a variable by age, merging each period into the
+    running count, mean and sum of squared deviations with Chan et al.'s
+    pairwise update.
+    '''
+    def __init__(self, var):
+        Reducer.__init__(self, var)
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.M2 = np.zeros(0)
+
+    def update(self, x, groups):
+        n = max(groups.max() + 1, self.count.size)
+        count_b = np.bincount(groups, minlength=n).astype(float)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.bincount(groups, weights=x, minlength=n) / count_b
+        mean_b[count_b == 0] = 0.
+        M2_b = np.bincount(groups, weights=(x - mean_b[groups]) ** 2, minlength=n)
+        self._combine(count_b, mean_b, M2_b)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.M2)
+
+    def _combine(self, count_b, mean_b, M2_b):
+        n = max(self.count.size, count_b.size)
+        count_a, mean_a = _grow(self.count, n), _grow(self.mean, n)
+        count_b, mean_b = _grow(count_b, n), _grow(mean_b, n)
+        count = count_a + count_b
+        seen = count_b > 0
+        delta = np.where(seen, mean_b - mean_a, 0.)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(seen, mean_a + delta * count_b / count, mean_a)
+            self.M2 = _grow(self.M2, n) + np.where(seen, _grow(M2_b, n) + delta ** 2 * count_a * count_b / count, 0.)
+        self.count = count
+
+    def result(self):
+        ages = np.nonzero(self.count > 1)[0]
+        return ages, self.M2[ages] / (self.count[ages] - 1.)
+
+
+class Quantile(Reducer):
+    '''
+    Quantiles of a variable by age from a merging t-digest: each age keeps at
+    most about `compression` weighted centroids, small near the tails and large
+    near the median, plus its exact minimum and maximum.
+    Inputs:
+       var:         see Reducer
+       q:           quantile, or list of quantiles, in [0, 1]
+       compression: size parameter of the digest; larger is more accurate
+    '''
+    def __init__(self, var, q=0.5, compression=200):
+        Reducer.__init__(self, var)
+        self.q = q
+        self.compression = compression
+        self.digests = {}
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - 0.5 * weights) / total
+        # Arcsine scale function: centroids hold less weight near q = 0 and 1
+        k = np.floor(self.compression * (np.arcsin(2. * q - 1.) / np.pi + 0.5)).astype(int)
+        _, bucket = np.unique(k, return_inverse=True)
+        w = np.bincount(bucket, weights=weights)
+        return np.bincount(bucket, weights=means * weights) / w, w
+
+    def _add(self, age, means, weights, lo, hi):
+        if age in self.digests:
+            means_a, weights_a, lo_a, hi_a = self.digests[age]
+            means = np.concatenate([means_a, means])
+            weights = np.concatenate([weights_a, weights])
+            lo, hi = min(lo_a, lo), max(hi_a, hi)
+        means, weights = self._compress(means, weights)
+        self.digests[age] = (means, weights, lo, hi)
+
+    def update(self, x, groups):
+        order = np.argsort(groups, kind='mergesort')
+        ages, first = np.unique(groups[order], return_index=True)
+        for age, chunk in zip(ages, np.split(x[order], first[1:])):
+            self._add(age, chunk, np.ones(chunk.size), chunk.min(), chunk.max())
+
+    def merge(self, other):
+        for age in sorted(other.digests.keys()):
+            self._add(age, *other.digests[age])
+
+    def result(self):
+        ages = np.array(sorted(self.digests.keys()), dtype=int)
+        q = np.atleast_1d(self.q)
+        values = np.zeros((ages.size, q.size))
+        for i, age in enumerate(ages):
+            means, weights, lo, hi = self.digests[age]
+            total = weights.sum()
+            mid = np.concatenate([[0.], np.cumsum(weights) - 0.5 * weights, [total]])
+            values[i] = np.interp(q * total, mid, np.concatenate([[lo], means, [hi]]))
+        if np.ndim(self.q) == 0:
+            values = values[:, 0]
+        return ages, values
+
+
+class Histogram(Reducer):
+    '''
+    Counts of a variable by age over fixed bins; values outside the bins are
+    dropped, as in np.histogram.
+    Inputs:
+       var:  see Reducer
+       bins: array of bin edges
+    '''
+    def __init__(self, var, bins):
+        Reducer.__init__(self, var)
+        self.bins = np.asarray(bins, dtype=float)
+        self.counts = np.zeros((0, self.bins.size - 1))
+
+    def update(self, x, groups):
+        nbins = self.bins.size - 1
+        n = max(groups.max() + 1, self.counts.shape[0])
+        idx = np.searchsorted(self.bins, x, side='right') - 1
+        idx[x == self.bins[-1]] = nbins - 1
+        inside = (idx >= 0) & (idx < nbins)
+        flat = np.bincount(groups[inside] * nbins + idx[inside], minlength=n * nbins)
+        self.counts = _grow(self.counts, n) + flat.reshape(n, nbins)
+
+    def merge(self, other):
+        n = max(self.counts.shape[0], other.counts.shape[0])
+        self.counts = _grow(self.counts, n) + _grow(other.counts, n)
+
+    def result(self):
+        ages = np.nonzero(self.counts.sum(axis=1))[0]
+        return ages, self.counts[ages]
+
+
+def simulate_streaming(agent, reducers, sim_periods=None, by='t_age', draws=None):
+    '''
+    Simulate an initialized agent exactly as AgentType.simulate does, passing
+    each period's values to the reducers instead of (or as well as) storing the
+    histories of track_vars.  Set agent.track_vars = [] before initializeSim()
+    to keep no histories at all.
+    Inputs:
+       agent:       consumer type after initializeSim()
+       reducers:    dict of name -> Reducer
+       sim_periods: number of periods to simulate (defaults to agent.T_sim)
+       by:          integer agent attribute to group by, read after each period
+       draws:       optional CounterDraws, ShockBank or sampling draws to take
+                    the shocks from instead of agent.RNG; the agent must then be
+                    initialized with counter.initialize_counter_sim
+    Returns:
+       reducers: the same dict, updated
+    '''
+    with np.errstate(divide='ignore', over='ignore', under='ignore', invalid='ignore'):
+        orig_time = agent.time_flow
+        agent.timeFwd()
+        if sim_periods is None:
+            sim_periods = agent.T_sim
+
+        for t in range(sim_periods):
+            if draws is None:
+                agent.simOnePeriod()
+            else:
+                counter_sim_one_period(agent, draws)
+            for var_name in agent.track_vars:
+                getattr(agent, var_name + '_hist')[agent.t_sim, :] = getattr(agent, var_name)
+            groups = np.asarray(getattr(agent, by), dtype=int)
+            for reducer in reducers.values():
+                reducer.update(reducer.values(agent), groups)
+            agent.t_sim += 1
+
+        if not orig_time:
+            agent.timeRev()
+    return reducers
+
+
+def stats_frame(stats, age_offset=0):
+    '''
+    Collect the results of per-age reducers into a DataFrame with a T_age
+    column and one column per reducer (one per quantile for a Quantile with
+    several), in the layout of Data.groupby(['T_age']).mean().reset_index().
+    Histograms are left out; read them with Histogram.result().
+    Inputs:
+       stats:      dict of name -> Reducer, or a list of such dicts
+       age_offset: added to the ages, e.g. 25 to start the lifecycle at age 26
+    Returns:
+       frame: pandas DataFrame sorted by T_age
+    '''
+    if isinstance(stats, dict):
+        stats = [stats]
+    columns = {}
+    for group in stats:
+        for name, reducer in group.items():
+            if isinstance(reducer, Histogram):
+                continue
+            ages, values = reducer.result()
+            if values.ndim == 1:
+                columns[name] = pd.Series(values, index=ages + age_offset)
+            else:
+                for j, q in enumerate(np.atleast_1d(reducer.q)):
+                    columns['{}_{:g}'.format(name, q)] = pd.Series(values[:, j], index=ages + age_offset)
+    frame = pd.DataFrame(columns)
+    frame.index.name = 'T_age'
+    return frame.sort_index().reset_index()
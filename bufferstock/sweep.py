@@ -0,0 +1,208 @@
+'''
+Table 1 over a grid of parameters.
+
+A sweep is declared as a base ParamSpec and a dict of parameter -> values;
+every combination is a cell.  Cells are solved in a pool of worker processes
+(through the SolutionCache), their Table 1 moments are found in the pool too,
+and the results go to one tidy CSV table with a row per cell.  Cells already
+in the table are skipped, and the table is rewritten after every batch, so an
+interrupted sweep picks up where it stopped.
+
+The moments come from the stationary distribution on a grid (method
+'histogram', exact up to the grid and fast) or from a simulation warm started
+from the ergodic distribution and stopped once stable (method 'simulation').
+'''
+import itertools
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .ergodic import start_from_ergodic, simulate_until_stable
+from .histogram import stationary_path
+from .mpc import marginal_propensities
+from .parallel import solve_solutions
+from .solve import agent_from_solution, attach_targets
+from .streaming import Mean, simulate_streaming
+
+GRID_PARAMS = ('PermGroFac', 'DiscFac', 'CRRA', 'Rfree', 'UnempPrb', 'PermShkStd', 'TranShkStd')
+MOMENTS = ('AggConsGrowth', 'PermIncAvGrowth', 'ConsAvGrowth', 'AggSavingRate', 'AvMPC', 'AvNetWealth',
+           'TargetNetWealth')
+MEANS = ('Cons', 'logCons', 'logpLvl', 'm', 'a', 'mNrm', 'cNrm')
+
+
+def table1_reducers(suffix=''):
+    '''
+    Per-age means used in Table 1, named with the given suffix.
+    '''
+    return {'Cons' + suffix: Mean(lambda agent: agent.cNrmNow * agent.pLvlNow),                    # Consumption level
+            'logCons' + suffix: Mean(lambda agent: np.log(agent.cNrmNow) + np.log(agent.pLvlNow)),  # log of consumption level
+            'logpLvl' + suffix: Mean(lambda agent: np.log(agent.pLvlNow)),                       # log of permanent income
+            'm' + suffix: Mean(lambda agent: agent.mNrmNow * agent.pLvlNow),                     # Wealth level
+            'a' + suffix: Mean(lambda agent: agent.aNrmNow * agent.pLvlNow),                     # End of period asset level
+            'mNrm' + suffix: Mean('mNrmNow'),
+            'cNrm' + suffix: Mean('cNrmNow')}
+
+
+def table1_path_stats(path, suffix=''):
+    '''
+    The same per-age means from a histogram.DistributionPath.
+    '''
+    logpLvl = path.mean(None, 'logpLvl')
+    return {'Cons' + suffix: path.stat(path.mean('cNrmNow', 'pLvl')),
+            'logCons' + suffix: path.stat(path.mean(np.log(path.cNrm)) + logpLvl),
+            'logpLvl' + suffix: path.stat(logpLvl),
+            'm' + suffix: path.stat(path.mean('mNrmNow', 'pLvl')),
+            'a' + suffix: path.stat(path.mean('aNrmNow', 'pLvl')),
+            'mNrm' + suffix: path.stat(path.mean('mNrmNow')),
+            'cNrm' + suffix: path.stat(path.mean('cNrmNow'))}
+
+
+def table1_row(means, agent):
+    '''
+    The Table 1 moments of one model.
+    Inputs:
+       means: dict of each name in MEANS -> array of per-period means whose last
+              two entries are the periods compared
+       agent: the solved model, with aNrmSS on solution[0]
+    Returns:
+       row: array (7,) in the order of MOMENTS
+    '''
+    Cons, logCons, logpLvl, m, a, mNrm, cNrm = [np.asarray(means[name])[-2:] for name in MEANS]
+    return np.array([np.log(Cons[1]) - np.log(Cons[0]),   # Growth rate of aggregate consumption
+                     logpLvl[1] - logpLvl[0],             # Average growth rate of household permanent income
+                     logCons[1] - logCons[0],             # Average growth rate of household consumption
+                     1 - Cons[1] / (m[1] - a[0]),         # Aggregate personal saving rate
+                     marginal_propensities(agent, mNrm[1]),  # Average MPC out of wealth
+                     mNrm[1] - cNrm[1],                   # Average net wealth
+                     agent.solution[0].aNrmSS])           # Target net wealth
+
+
+def table1_moments(agent, method='histogram', max_periods=100, periods=None):
+    '''
+    Table 1 moments of a solved infinite-horizon agent.
+    Inputs:
+       agent:       solved consumer type (cycles=0) with aNrmSS attached
+       method:      'histogram' or 'simulation'
+       max_periods: most periods to simulate (method 'simulation')
+       periods:     simulate exactly this many periods instead of stopping once
+                    stable, e.g. so that models compared with common random
+                    numbers are simulated for equally long
+    Returns:
+       row: array (7,) in the order of MOMENTS
+    '''
+    if method == 'histogram':
+        stats = table1_path_stats(stationary_path(agent, 2))
+    elif method == 'simulation':
+        agent.T_sim = max_periods if periods is None else periods
+        agent.track_vars = []
+        agent.initializeSim()
+        start_from_ergodic(agent)
+        stats = table1_reducers()
+        if periods is None:
+            simulate_until_stable([agent], [stats])
+        else:
+            simulate_streaming(agent, stats)
+    else:
+        raise ValueError("method must be 'histogram' or 'simulation', not {!r}".format(method))
+    return table1_row(dict((name, stats[name].result()[1]) for name in MEANS), agent)
+
+
+def grid_specs(base, grid):
+    '''
+    Every combination of the grid's parameter values.
+    Inputs:
+       base: ParamSpec the cells start from
+       grid: dict of parameter name -> list of values; scalars for parameters
+             that base holds as one element lists (PermGroFac, PermShkStd, ...)
+             are wrapped for the one period cycle
+    Returns:
+       cells: list of (dict of parameter -> scalar value, ParamSpec)
+    '''
+    names = list(grid.keys())
+    cells = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        cell = dict(zip(names, values))
+        changes = dict((name, [value] if isinstance(base[name], list) else value) for name, value in cell.items())
+        cells.append((cell, base.replace(**changes)))
+    return cells
+
+
+def _moments_job(job):
+    '''
+    Table 1 moments of one cell (in a worker process).
+    '''
+    spec, solution, method = job
+    agent = agent_from_solution(spec, solution)
+    attach_targets([agent])
+    return table1_moments(agent, method)
+
+
+def _write_csv(results, path):
+    # Write to a temporary file first so that an interrupted write never loses
+    # the rows of earlier batches
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(handle, 'w') as f:
+        results.to_csv(f, index=False)
+    os.replace(tmp_path, path)
+
+
+def run_sweep(base, grid, path=None, method='histogram', processes=None, cache=None, batch_size=256):
+    '''
+    Table 1 moments for every cell of a parameter grid.
+    Inputs:
+       base:       ParamSpec of the baseline model (cycles=0)
+       grid:       dict of parameter name -> list of values, e.g.
+                   {'DiscFac': [0.9, 0.93, 0.96], 'CRRA': [1.5, 2., 3.]}
+       path:       CSV file of the results; cells already in it are skipped
+       method:     'histogram' or 'simulation' (see table1_moments)
+       processes:  number of worker processes; defaults to the number of cores
+       cache:      optional SolutionCache for the solutions
+       batch_size: number of cells solved and measured between writes of path
+    Returns:
+       results: DataFrame with a row per cell of this grid (even if path holds
+                other cells too): the grid parameters, the MOMENTS, the method
+                and the spec digest
+    '''
+    if processes is None:
+        processes = os.cpu_count() or 1
+    results = pd.read_csv(path) if path is not None and os.path.exists(path) else pd.DataFrame()
+    done = set(zip(results['digest'], results['method'])) if len(results) else set()
+    cells = list(grid_specs(base, grid))
+    todo = [(cell, spec) for cell, spec in cells if (spec.digest, method) not in done]
+
+    for first in range(0, len(todo), batch_size):
+        batch = todo[first:first + batch_size]
+        specs = [spec for _, spec in batch]
+        solutions = solve_solutions(specs, processes=processes, cache=cache)
+        jobs = [(spec, solution, method) for spec, solution in zip(specs, solutions)]
+        if min(processes, len(jobs)) > 1:
+            pool = multiprocessing.Pool(min(processes, len(jobs)))
+            try:
+                rows = pool.map(_moments_job, jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rows = [_moments_job(job) for job in jobs]
+
+        records = []
+        for (cell, spec), row in zip(batch, rows):
+            record = dict(cell)
+            record.update(zip(MOMENTS, row))
+            record.update({'method': method, 'digest': spec.digest})
+            records.append(record)
+        results = pd.concat([results, pd.DataFrame(records)], ignore_index=True)
+        if path is not None:
+            _write_csv(results, path)
+
+    # The table may hold other sweeps too; return only this grid's cells, in grid order
+    found = results.drop_duplicates(['digest', 'method'], keep='last').set_index(['digest', 'method'], drop=False)
+    records = []
+    for cell, spec in cells:
+        record = found.loc[(spec.digest, method)].to_dict()
+        record.update(cell)
+        records.append(record)
+    return pd.DataFrame(records, columns=results.columns)
@@ -0,0 +1,65 @@
+'''
+Array helpers shared by the vectorized solvers: row-wise searchsorted and
+linear interpolation over a stack of grids.
+'''
+import numpy as np
+
+
+def batch_searchsorted(grids, x):
+    '''
+    Row-wise np.searchsorted: for each k, find where x[k] would be inserted into
+    the sorted row grids[k].  Every row is shifted by its own offset so that the
+    whole stack becomes one sorted array and a single searchsorted call does the
+    work of K of them.
+    Inputs:
+       grids: array (K, N), each row sorted ascending
+       x:     array (K, M) of query points
+    Returns:
+       idx: integer array (K, M) of insertion indices into each row
+    '''
+    grids = np.asarray(grids, dtype=float)
+    x = np.asarray(x, dtype=float)
+    K, N = grids.shape
+    lo = min(np.nanmin(grids), np.nanmin(x))
+    span = max(np.nanmax(grids), np.nanmax(x)) - lo + 1.0
+    offset = span * np.arange(K)[:, np.newaxis]
+    flat = (grids - lo + offset).ravel()
+    idx = np.searchsorted(flat, (x - lo + offset).ravel()).reshape(x.shape)
+    return idx - N * np.arange(K)[:, np.newaxis]
+
+
+def batch_interp(x, xp, fp, intercept_limit=None, slope_limit=None):
+    '''
+    Row-wise linear interpolation, extrapolating the way HARK's LinearInterp does:
+    NaN below the first node and, above the last node, either linearly or by
+    decaying towards the limiting function intercept_limit + slope_limit*x.
+    Inputs:
+       x:               array (K, M) of query points
+       xp, fp:          arrays (K, N) of nodes and values
+       intercept_limit: optional array (K,) of limiting intercepts (NaN for linear extrapolation)
+       slope_limit:     optional array (K,) of limiting slopes
+    Returns:
+       y: array (K, M)
+    '''
+    K, N = xp.shape
+    rows = np.arange(K)[:, np.newaxis]
+    i = np.maximum(batch_searchsorted(xp[:, :-1], x), 1)
+    x_lo, x_hi = xp[rows, i - 1], xp[rows, i]
+    f_lo, f_hi = fp[rows, i - 1], fp[rows, i]
+    alpha = (x - x_lo) / (x_hi - x_lo)
+    y = (1. - alpha) * f_lo + alpha * f_hi
+    y[x < xp[:, :1]] = np.nan
+
+    if intercept_limit is not None:
+        decay = ~np.isnan(intercept_limit)
+        if np.any(decay):
+            x_top, y_top = xp[:, -1], fp[:, -1]
+            slope_top = (fp[:, -1] - fp[:, -2]) / (xp[:, -1] - xp[:, -2])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                A = intercept_limit + slope_limit * x_top - y_top
+                B = -(slope_limit - slope_top) / A
+            above = (x > x_top[:, np.newaxis]) & decay[:, np.newaxis]
+            k = np.nonzero(above)[0]
+            y[above] = (intercept_limit[k] + slope_limit[k] * x[above]
+                        - A[k] * np.exp(-B[k] * (x[above] - x_top[k])))
+    return y
@@ -0,0 +1,325 @@
+'''
+A vectorized endogenous grid method solver for many infinite horizon
+buffer-stock models at once.
+
+All K models share the asset grid and borrowing constraint of a base
+ParamSpec and differ in (PermGroFac, DiscFac, CRRA, Rfree); they share its
+income process too, unless each is given its own discretized one.  Each backward
+step is the same computation as HARK's ConsIndShockSolverBasic (linear
+interpolation, decay extrapolation towards the perfect foresight limit), or
+with CubicBool as its ConsIndShockSolver (cubic splines through the MPCs from
+the marginal marginal value), done for every model in one set of array
+operations.  A model stops being iterated once it has converged by HARK's own
+criterion, so every row matches the solution of the corresponding
+IndShockConsumerType.
+'''
+import numpy as np
+from HARK.interpolation import CubicInterp, LinearInterp, LowerEnvelope
+from HARK.ConsumptionSaving.ConsIndShockModel import ConsumerSolution
+
+from .solve import make_agent, MAX_CYCLES
+from .stack import StackedFunc
+from .steady_state import find_targets
+from .utilities import batch_interp
+
+# Parameters that may differ across the models in a batch
+BATCH_PARAMS = ('PermGroFac', 'DiscFac', 'CRRA', 'Rfree')
+
+
+def eval_cFunc(m, mNrm, cNrm, mNrmMin, hNrm, MPCmin):
+    '''
+    Evaluate a stack of (lower-enveloped) linear consumption functions.
+    Inputs:
+       m:                   array (K, M) of market resources
+       mNrm, cNrm:          arrays (K, N) of consumption function nodes
+       mNrmMin, hNrm, MPCmin: arrays (K,); NaN hNrm means linear extrapolation
+    Returns:
+       c: array (K, M)
+    '''
+    cUnc = batch_interp(m, mNrm, cNrm, MPCmin * hNrm, MPCmin)
+    cCnst = m - mNrmMin[:, np.newaxis]
+    cCnst[m < mNrmMin[:, np.newaxis]] = np.nan
+    with np.errstate(invalid='ignore'):
+        return np.fmin(cUnc, cCnst)
+
+
+def cubic_coeffs(x, y, dydx, intercept_limit, slope_limit):
+    '''
+    Coefficients of K CubicInterp splines (without lower extrapolation), as
+    HARK computes them one spline at a time.
+    Inputs:
+       x, y, dydx:      arrays (K, N) of nodes, values and slopes
+       intercept_limit, slope_limit: arrays (K,) of the limiting line; NaN
+                        intercepts mean linear extrapolation from the last node
+    Returns:
+       coeffs: array (K, N+1, 4), laid out as CubicInterp.coeffs
+    '''
+    K, N = x.shape
+    coeffs = np.empty((K, N + 1, 4))
+    coeffs[:, 0] = np.nan
+    span = np.diff(x, axis=1)
+    y0, y1 = y[:, :-1], y[:, 1:]
+    d0, d1 = dydx[:, :-1] * span, dydx[:, 1:] * span
+    coeffs[:, 1:N, 0] = y0
+    coeffs[:, 1:N, 1] = d0
+    coeffs[:, 1:N, 2] = 3. * (y1 - y0) - 2. * d0 - d1
+    coeffs[:, 1:N, 3] = 2. * (y0 - y1) + d0 + d1
+
+    # Decay towards the limiting line above the last node
+    linear = np.isnan(intercept_limit)
+    slope_limit = np.where(linear, dydx[:, -1], slope_limit)
+    intercept_limit = np.where(linear, y[:, -1] - slope_limit * x[:, -1], intercept_limit)
+    gap = slope_limit * x[:, -1] + intercept_limit - y[:, -1]
+    slope = slope_limit - dydx[:, -1]
+    decays = (gap != 0.) & (slope <= 0.)
+    coeffs[:, N, 0] = intercept_limit
+    coeffs[:, N, 1] = slope_limit
+    coeffs[:, N, 2] = np.where(slope > 0., 0., gap)
+    coeffs[:, N, 3] = np.where(decays, slope / np.where(decays, gap, 1.), 0.)
+    return coeffs
+
+
+def stack_cubic(mNrm, cNrm, MPC, mNrmMin, hNrm, MPCmin):
+    '''
+    A StackedFunc of K cubic consumption functions, each lower-enveloped with
+    its borrowing constraint c = m - mNrmMin.
+    '''
+    coeffs = cubic_coeffs(mNrm, cNrm, MPC, MPCmin * hNrm, MPCmin)
+    cnst = np.column_stack([mNrmMin, np.zeros(mNrmMin.size), np.ones(mNrmMin.size)])
+    K, N = mNrm.shape
+    return StackedFunc(mNrm, coeffs, np.full(K, N), cnst, np.zeros(K, dtype=bool))
+
+
+class BatchSolution(object):
+    '''
+    Converged solutions of K buffer-stock models.
+    Attributes:
+       PermGroFac, DiscFac, CRRA, Rfree: arrays (K,) of the model parameters
+       mNrm, cNrm:        arrays (K, N) of consumption function nodes
+       MPC:               arrays (K, N) of the MPCs at the nodes (cubic splines only)
+       mNrmMin, hNrm, MPCmin, MPCmax: arrays (K,) of the solution bounds
+       ExIncNext:         array (K,) of expected income E[psi*theta]
+       mNrmSS:            array (K,) of target market resources (NaN if none)
+       aNrmSS:            array (K,) of target end-of-period assets
+       mGrowthSlopeSS:    array (K,) of the slope of E[m_{t+1}/m_t] at the target
+       completed_cycles:  array (K,) of iterations each model took to converge
+       cFuncs:            list of K HARK consumption functions
+    '''
+    def __init__(self, params, mNrm, cNrm, mNrmMin, hNrm, MPCmin, ExIncNext, completed_cycles,
+                 MPC=None, MPCmax=None):
+        for name in BATCH_PARAMS:
+            setattr(self, name, params[name])
+        self.mNrm = mNrm
+        self.cNrm = cNrm
+        self.MPC = MPC
+        self.mNrmMin = mNrmMin
+        self.hNrm = hNrm
+        self.MPCmin = MPCmin
+        self.MPCmax = MPCmax
+        self.ExIncNext = ExIncNext
+        self.completed_cycles = completed_cycles
+        if MPC is None:
+            cFuncsUnc = [LinearInterp(mNrm[k], cNrm[k], MPCmin[k] * hNrm[k], MPCmin[k]) for k in range(len(mNrmMin))]
+        else:
+            cFuncsUnc = [CubicInterp(mNrm[k], cNrm[k], MPC[k], MPCmin[k] * hNrm[k], MPCmin[k])
+                         for k in range(len(mNrmMin))]
+        self.cFuncs = [LowerEnvelope(cFuncsUnc[k],
+                                     LinearInterp(np.array([mNrmMin[k], mNrmMin[k] + 1.]), np.array([0., 1.])))
+                       for k in range(len(mNrmMin))]
+        targets = self.find_targets()
+        self.mNrmSS = targets.mNrmSS
+        self.aNrmSS = targets.aNrmSS
+        self.mGrowthSlopeSS = targets.slope
+
+    def __len__(self):
+        return len(self.mNrmMin)
+
+    def cFunc(self, m):
+        '''
+        Evaluate all K consumption functions.
+        Inputs:
+           m: array (M,) of market resources shared by every model, or (K, M)
+        Returns:
+           c: array (K, M)
+        '''
+        m = np.asarray(m, dtype=float)
+        if m.ndim < 2:
+            m = np.tile(m, (len(self), 1))
+        if self.MPC is not None:
+            return stack_cubic(self.mNrm, self.cNrm, self.MPC, self.mNrmMin, self.hNrm, self.MPCmin)(m)
+        return eval_cFunc(m, self.mNrm, self.cNrm, self.mNrmMin, self.hNrm, self.MPCmin)
+
+    def find_targets(self, m_max=1000.):
+        '''
+        Target wealth of every model, on the same condition as HARK's addSSmNrm.
+        Returns:
+           targets: SteadyState (NaN for models without a target in (mNrmMin, m_max])
+        '''
+        return find_targets(StackedFunc.from_functions(self.cFuncs), self.mNrmMin,
+                            self.PermGroFac, self.Rfree, self.ExIncNext, m_max=m_max)
+
+    def solution(self, k):
+        '''
+        Model k as a one period HARK solution, with its target wealth attached,
+        e.g. for solve.agent_from_solution(spec, [batch.solution(k)]).
+        '''
+        solution = ConsumerSolution(cFunc=self.cFuncs[k], mNrmMin=self.mNrmMin[k], hNrm=self.hNrm[k],
+                                    MPCmin=self.MPCmin[k], MPCmax=self.MPCmax[k])
+        found = not np.isnan(self.mNrmSS[k])
+        solution.mNrmSS = self.mNrmSS[k] if found else None
+        solution.aNrmSS = self.aNrmSS[k] if found else None
+        solution.mGrowthSlopeSS = self.mGrowthSlopeSS[k] if found else None
+        return solution
+
+
+def batch_params(K=None, **params):
+    '''
+    Broadcast the batch parameters to arrays of a common length K.
+    '''
+    arrays = {name: np.atleast_1d(np.asarray(value, dtype=float)).ravel()
+              for name, value in params.items()}
+    if K is None:
+        K = max(arr.size for arr in arrays.values())
+    return {name: np.broadcast_to(arr, (K,)).copy() for name, arr in arrays.items()}
+
+
+def stack_income(IncomeDstn):
+    '''
+    Stack K discretized income distributions [ShkPrbs, PermShkVals, TranShkVals]
+    into arrays (K, S), padding the shorter ones with points of zero probability.
+    '''
+    S = max(len(dstn[0]) for dstn in IncomeDstn)
+    stacked = []
+    for part in range(3):
+        rows = [np.asarray(dstn[part], dtype=float) for dstn in IncomeDstn]
+        pad = [np.zeros(S - row.size) if part == 0 else np.full(S - row.size, row[0]) for row in rows]
+        stacked.append(np.array([np.concatenate([row, extra]) for row, extra in zip(rows, pad)]))
+    return stacked
+
+
+def solve_batch(spec, PermGroFac=None, DiscFac=None, CRRA=None, Rfree=None, IncomeDstn=None,
+                CubicBool=False, tolerance=None, max_cycles=MAX_CYCLES):
+    '''
+    Solve K infinite horizon buffer-stock models at once.
+    Inputs:
+       spec:       ParamSpec of an infinite horizon IndShockConsumerType with
+                   T_cycle = 1; supplies everything that is shared by the batch
+       PermGroFac, DiscFac, CRRA, Rfree:
+                   scalars or arrays of length K; any left out are taken from spec
+       IncomeDstn: optional list of K discretized income distributions (each an
+                   agent's IncomeDstn[0]); defaults to the one of spec for all
+       CubicBool:  interpolate with cubic splines, as IndShockConsumerType
+                   does with CubicBool=True, instead of linearly
+       tolerance:  convergence tolerance (defaults to the agent's own)
+       max_cycles: cap on the number of iterations
+    Returns:
+       solution: BatchSolution with K consumption functions and target m
+    '''
+    agent = make_agent(spec)
+    given = {'PermGroFac': PermGroFac, 'DiscFac': DiscFac, 'CRRA': CRRA, 'Rfree': Rfree}
+    for name in BATCH_PARAMS:
+        if given[name] is None:
+            given[name] = agent.PermGroFac[0] if name == 'PermGroFac' else getattr(agent, name)
+    params = batch_params(**given)
+    if tolerance is None:
+        tolerance = agent.tolerance
+
+    G = params['PermGroFac']
+    R = params['Rfree']
+    rho = params['CRRA']
+    DiscFacEff = params['DiscFac'] * agent.LivPrb[0]
+    K = G.size
+
+    # The asset grid is common to the whole batch, and so are the income shocks
+    # unless every model has its own
+    ShkPrbs, PermShkVals, TranShkVals = [np.broadcast_to(arr, (K, arr.shape[1])) for arr in
+                                         stack_income([agent.IncomeDstn[0]] if IncomeDstn is None else IncomeDstn)]
+    PermShkMin, TranShkMin = np.min(PermShkVals, axis=1), np.min(TranShkVals, axis=1)
+    ExIncNext = np.sum(ShkPrbs * PermShkVals * TranShkVals, axis=1)
+    worst = PermShkVals * TranShkVals == (PermShkMin * TranShkMin)[:, np.newaxis]
+    WorstIncPrb = np.sum(np.where(worst, ShkPrbs, 0.), axis=1)
+    aXtraGrid = np.asarray(agent.aXtraGrid)
+    BoroCnstArt = agent.BoroCnstArt
+    PatFac = (R * DiscFacEff) ** (1. / rho) / R
+
+    # Terminal period: c_T(m) = m with linear extrapolation
+    mNrm = np.tile([0., 1.], (K, 1))
+    cNrm = np.tile([0., 1.], (K, 1))
+    mNrmMin = np.zeros(K)
+    hNrm = np.full(K, np.nan)
+    hNrmNext = np.zeros(K)
+    MPCmin = np.ones(K)
+    MPCmax = np.ones(K)
+    MPC = np.ones((K, 2))
+    completed = np.zeros(K, dtype=int)
+    active = np.arange(K)
+
+    while active.size > 0:
+        a = active
+        rows = a[:, np.newaxis, np.newaxis]
+
+        # Bounds on this period's solution
+        MPCminNow = 1. / (1. + PatFac[a] / MPCmin[a])
+        MPCmaxNow = 1. / (1. + WorstIncPrb[a] ** (1. / rho[a]) * PatFac[a] / MPCmax[a])
+        hNrmNow = G[a] / R[a] * (ExIncNext[a] + hNrmNext[a])
+        BoroCnstNat = (mNrmMin[a] - TranShkMin[a]) * (G[a] * PermShkMin[a]) / R[a]
+        mNrmMinNow = BoroCnstNat if BoroCnstArt is None else np.maximum(BoroCnstNat, BoroCnstArt)
+
+        # Next period's market resources for every asset level and shock
+        aNrmNow = aXtraGrid[np.newaxis, :] + BoroCnstNat[:, np.newaxis]
+        mNrmNext = (R[a] / G[a])[:, np.newaxis, np.newaxis] / PermShkVals[a][:, np.newaxis, :] \
+            * aNrmNow[:, :, np.newaxis] + TranShkVals[a][:, np.newaxis, :]
+        if CubicBool:
+            cNext, MPCNext = stack_cubic(mNrm[a], cNrm[a], MPC[a], mNrmMin[a], hNrm[a], MPCmin[a]
+                                         ).eval_with_derivative(mNrmNext.reshape(a.size, -1))
+            cNext, MPCNext = cNext.reshape(mNrmNext.shape), MPCNext.reshape(mNrmNext.shape)
+        else:
+            cNext = eval_cFunc(mNrmNext.reshape(a.size, -1), mNrm[a], cNrm[a], mNrmMin[a],
+                               hNrm[a], MPCmin[a]).reshape(mNrmNext.shape)
+
+        # Euler equation, then the endogenous grid of market resources
+        rho_a = rho[rows]
+        EndOfPrdvP = (DiscFacEff[a] * R[a] * G[a] ** (-rho[a]))[:, np.newaxis] * np.sum(
+            ShkPrbs[a][:, np.newaxis, :] * PermShkVals[a][:, np.newaxis, :] ** (-rho_a) * cNext ** (-rho_a), axis=2)
+        cNrmNow = EndOfPrdvP ** (-1. / rho[a][:, np.newaxis])
+        mNrmNow = cNrmNow + aNrmNow
+        cNew = np.concatenate([np.zeros((a.size, 1)), cNrmNow], axis=1)
+        mNew = np.concatenate([BoroCnstNat[:, np.newaxis], mNrmNow], axis=1)
+        if CubicBool:
+            # MPCs at the nodes from the marginal marginal value, vPP = MPC*u''(c)
+            EndOfPrdvPP = (DiscFacEff[a] * R[a] ** 2 * G[a] ** (-rho[a] - 1.))[:, np.newaxis] * np.sum(
+                ShkPrbs[a][:, np.newaxis, :] * PermShkVals[a][:, np.newaxis, :] ** (-rho_a - 1.)
+                * MPCNext * (-rho_a) * cNext ** (-rho_a - 1.), axis=2)
+            dcda = EndOfPrdvPP / (-rho[a][:, np.newaxis] * cNrmNow ** (-rho[a][:, np.newaxis] - 1.))
+            MPCNew = np.concatenate([MPCmaxNow[:, np.newaxis], dcda / (dcda + 1.)], axis=1)
+
+        # HARK's distance between successive consumption functions; the first
+        # cycle is never accepted as converged
+        if mNrm.shape[1] == mNew.shape[1]:
+            distance = np.maximum(np.max(np.abs(mNew - mNrm[a]), axis=1),
+                                  np.max(np.abs(cNew - cNrm[a]), axis=1))
+            distance = np.maximum(distance, np.abs(mNrmMinNow - mNrmMin[a]))
+            if CubicBool:
+                distance = np.maximum(distance, np.max(np.abs(MPCNew - MPC[a]), axis=1))
+        else:
+            distance = np.full(a.size, np.inf)
+            mNrm = np.zeros((K, mNew.shape[1]))
+            cNrm = np.zeros((K, cNew.shape[1]))
+            MPC = np.zeros((K, mNew.shape[1]))
+
+        mNrm[a] = mNew
+        cNrm[a] = cNew
+        if CubicBool:
+            MPC[a] = MPCNew
+        mNrmMin[a] = mNrmMinNow
+        hNrm[a] = hNrmNow
+        hNrmNext[a] = hNrmNow
+        MPCmin[a] = MPCminNow
+        MPCmax[a] = MPCmaxNow
+        completed[a] += 1
+
+        go = (distance > tolerance) & (completed[a] < max_cycles)
+        active = a[go]
+
+    return BatchSolution(params, mNrm, cNrm, mNrmMin, hNrm, MPCmin, ExIncNext, completed,
+                         MPC if CubicBool else None, MPCmax)
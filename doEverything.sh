@@ -4,16 +4,6 @@ scriptDir="$(realpath $(dirname "$0"))" # get the path to this script itself
 
 sudo echo 'Authorizing sudo.'
 
-python ./Carroll_1997_RemARK.py #save figures and tables
+python ./Carroll_1997_RemARK.py #save figures and tables (only the stages that are out of date are rerun)
 
-cd Paper
-xelatex main.tex #creates the main paper and aux file
-bibtex main.aux  #run bibtex to run aux to create bbl file
-xelatex main.tex #rerun latex with the bbl file
-
-cd ..
-cd Slides
-
-chmod u+x make_slides.sh #This is to grant permission to making the slides
-
-./make_slides.sh #create slides
+python ./Carroll_1997_RemARK.py --only paper slides #typeset the main paper (xelatex, bibtex, xelatex) and the slides
@@ -0,0 +1,95 @@
+'''
+Checks of the streaming reducers and of the sharded simulation: statistics
+merged over shards of a population must agree with numpy's on the whole
+population, and a sharded simulation must not depend on the number of shards.
+'''
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+from bufferstock.streaming import Histogram, Mean, Quantile, Variance
+
+
+def _population(seed=0, size=20000, ages=5):
+    RNG = np.random.RandomState(seed)
+    x = RNG.lognormal(0., 0.8, size)
+    groups = RNG.randint(0, ages, size)
+    return x, groups
+
+
+def _merged(reducer, x, groups, shards=4, periods=3):
+    '''
+    Feed the population to one copy of reducer per shard, a period's worth at
+    a time, and merge the copies.
+    '''
+    copies = []
+    for shard in np.array_split(np.arange(x.size), shards):
+        part = deepcopy(reducer)
+        for chunk in np.array_split(shard, periods):
+            part.update(x[chunk], groups[chunk])
+        copies.append(part)
+    merged = copies[0]
+    for part in copies[1:]:
+        merged.merge(part)
+    return merged
+
+
+def test_mean_and_variance_match_numpy():
+    x, groups = _population()
+    ages, mean = _merged(Mean('x'), x, groups).result()
+    _, var = _merged(Variance('x'), x, groups).result()
+    for i, age in enumerate(ages):
+        np.testing.assert_allclose(mean[i], x[groups == age].mean(), rtol=1e-12)
+        np.testing.assert_allclose(var[i], x[groups == age].var(ddof=1), rtol=1e-10)
+
+
+def test_quantiles_match_numpy():
+    x, groups = _population(1)
+    q = [0.01, 0.1, 0.5, 0.9, 0.99]
+    ages, values = _merged(Quantile('x', q), x, groups, shards=7).result()
+    for i, age in enumerate(ages):
+        these = np.sort(x[groups == age])
+        # The estimate's rank is within a fraction of a percent of the one asked for
+        ranks = np.searchsorted(these, values[i]) / float(these.size)
+        np.testing.assert_allclose(ranks, q, atol=0.005)
+        np.testing.assert_allclose(values[i][2], np.quantile(these, 0.5), rtol=0.01)
+
+
+def test_histogram_matches_numpy():
+    x, groups = _population(2)
+    bins = np.linspace(0., 5., 21)
+    ages, counts = _merged(Histogram('x', bins), x, groups).result()
+    for i, age in enumerate(ages):
+        np.testing.assert_array_equal(counts[i], np.histogram(x[groups == age], bins)[0])
+
+
+@pytest.fixture(scope='module')
+def agent():
+    from bufferstock.params import ParamSpec, default_parameters
+    from bufferstock.solve import solve_spec
+    Params = default_parameters()
+    return solve_spec(ParamSpec.from_dict(Params.init_idiosyncratic_shocks, cycles=0, AgentCount=1200, T_sim=15))
+
+
+@pytest.mark.parametrize('shards,processes', [(3, 1), (6, 1), (2, 2)])
+def test_sharded_simulation_does_not_depend_on_shards(agent, shards, processes):
+    from bufferstock.sharded import simulate_sharded
+
+    def run(shards, processes):
+        stats = simulate_sharded(agent, reducers={'m': Mean('mNrmNow'), 'a': Variance('aNrmNow'),
+                                                  'c': Quantile('cNrmNow', [0.1, 0.5, 0.9])},
+                                 track_vars=['aNrmNow', 'pLvlNow', 't_age'], seed=3, shards=shards,
+                                 processes=processes, block_size=200)
+        return stats, agent.aNrmNow_hist.copy(), agent.pLvlNow_hist.copy(), agent.t_age_hist.copy()
+
+    stats_1, aNrm_1, pLvl_1, age_1 = run(1, 1)
+    stats_n, aNrm_n, pLvl_n, _ = run(shards, processes)
+    np.testing.assert_array_equal(aNrm_1, aNrm_n)
+    np.testing.assert_array_equal(pLvl_1, pLvl_n)
+    for name in stats_1:
+        np.testing.assert_array_equal(stats_1[name].result()[1], stats_n[name].result()[1])
+    # The merged statistics are those of the whole simulated population
+    ages, var = stats_1['a'].result()
+    for i, age in enumerate(ages):
+        np.testing.assert_allclose(var[i], aNrm_1[age_1 == age].var(ddof=1), rtol=1e-8)